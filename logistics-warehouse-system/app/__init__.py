@@ -1,4 +1,4 @@
 """
 Flask application initialization
 """
-from .main import app
\ No newline at end of file
+from .main import create_app
\ No newline at end of file
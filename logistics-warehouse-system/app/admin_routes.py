@@ -1,10 +1,19 @@
 """
 Admin routes for the Logistics Warehouse System
 """
-from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from .models import user_model, unit_model, product_model, transaction_model
+import calendar
+import os
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
+from .models import user_model, unit_model, product_model, transaction_model, sales_rollup_model, FanOutError
 from .database import db_instance
+from .pagination import page_size_from
+from .cache import catalog_cache
+from .aggregator import derived_views
+from .security import password_hasher
+from .catalog_import import import_catalog, detect_format, CatalogTooLarge, IMPORT_WEB_MAX_ROWS
+from .export import EXPORT_FORMATS, EXPORT_SOURCES, transactions_query, stream_transactions_export, export_filename
+from . import profiling
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -25,6 +34,10 @@ def dashboard():
     units = unit_model.get_all_units()
     supervisors = user_model.get_all_supervisors()
     
+    # Per-unit totals: one query for the unit summaries, one aggregation for headcount
+    financial_summaries = product_model.calculate_all_financial_summaries(units)
+    users_per_unit = user_model.count_users_by_unit()
+    
     # Calculate total profits and volume usage
     total_realized_gain = 0
     total_potential_gain = 0
@@ -33,30 +46,16 @@ def dashboard():
     total_employees = 0
     
     for unit in units:
-        # Get financial summary for each unit
-        financial_summary = product_model.calculate_unit_financial_summary(unit['unit_id'])
+        financial_summary = financial_summaries[unit['unit_id']]
         unit['financial_summary'] = financial_summary  # Add to unit object
         total_realized_gain += financial_summary['total_realized_gain']
         total_potential_gain += financial_summary['total_potential_gain']
         
-        # Get unit products for volume calculations
-        unit_products = product_model.get_products_by_unit(unit['unit_id'])
-        
-        # Calculate volume usage
-        unit_volume_used = 0
-        for p in unit_products:
-            if 'product_volume' in p and 'product_quantity' in p:
-                unit_volume_used += p['product_volume'] * p['product_quantity']
-        
-        total_volume_used += unit_volume_used
+        total_volume_used += financial_summary['total_volume_used']
         total_volume_capacity += unit['unit_volume']
         
-        # Count employees in this unit
-        unit_employees = user_model.get_users_by_unit(unit['unit_id'])
-        total_employees += len(unit_employees)
-    
-    # Add supervisors to employee count
-    total_employees += len(supervisors)
+        # Employees and supervisors assigned to this unit
+        total_employees += users_per_unit.get(unit['unit_id'], 0)
     
     # Calculate volume usage percentage
     volume_usage_percentage = (total_volume_used / total_volume_capacity * 100) if total_volume_capacity > 0 else 0
@@ -84,11 +83,12 @@ def create_unit():
             unit_id = unit_model.create_unit(unit_name, unit_volume)
             
             # Add all existing products to this unit with 0 quantity
-            products = list(db_instance.db.products_master.find())
-            for product in products:
-                product_model.add_product_to_unit(unit_id, product['product_id'], 0)
+            report = product_model.add_all_products_to_unit(unit_id, 0)
             
             flash(f'Η αποθήκη "{unit_name}" δημιουργήθηκε επιτυχώς με κωδικό {unit_id}!', 'success')
+            if report['failed']:
+                flash(f'{len(report["failed"])} από {report["total"]} προϊόντα δεν προστέθηκαν στην αποθήκη. '
+                      f'Δοκιμάστε ξανά την εντολή "flask add-products-to-unit {unit_id}".', 'error')
             return redirect(url_for('admin.view_units'))
         else:
             flash('Παρακαλώ συμπληρώστε όλα τα πεδία σωστά!', 'error')
@@ -103,10 +103,10 @@ def view_units():
     
     units = unit_model.get_all_units()
     
-    # Calculate financial summary for each unit
+    # Attach financial summary to each unit
+    financial_summaries = product_model.calculate_all_financial_summaries(units)
     for unit in units:
-        financial_summary = product_model.calculate_unit_financial_summary(unit['unit_id'])
-        unit['financial_summary'] = financial_summary
+        unit['financial_summary'] = financial_summaries[unit['unit_id']]
     
     return render_template('admin/view_units.html', units=units)
 
@@ -130,41 +130,65 @@ def create_product():
                 product_category, product_purchase_price >= 0, 
                 product_selling_price >= 0, product_manufacturer]):
             
-            product_id = product_model.create_product(
-                product_name, product_weight, product_volume,
-                product_category, product_purchase_price, 
-                product_selling_price, product_manufacturer,
-                initial_quantity
-            )
-            
-            flash(f'Το προϊόν "{product_name}" δημιουργήθηκε επιτυχώς με κωδικό {product_id} και αρχική ποσότητα {initial_quantity}!', 'success')
+            try:
+                product_id = product_model.create_product(
+                    product_name, product_weight, product_volume,
+                    product_category, product_purchase_price, 
+                    product_selling_price, product_manufacturer,
+                    initial_quantity
+                )
+            except FanOutError as e:
+                failed = e.report['failed']
+                product_id = failed[0]['product_id']
+                flash(f'Το προϊόν {product_id} δεν προστέθηκε σε {len(failed)} από {e.report["total"]} αποθήκες. '
+                      f'Δοκιμάστε ξανά την εντολή "flask add-product-to-units {product_id} --quantity {initial_quantity}".', 'error')
+            else:
+                flash(f'Το προϊόν "{product_name}" δημιουργήθηκε επιτυχώς με κωδικό {product_id} και αρχική ποσότητα {initial_quantity}!', 'success')
             return redirect(url_for('admin.view_products'))
         else:
             flash('Παρακαλώ συμπληρώστε όλα τα πεδία σωστά!', 'error')
     
     return render_template('admin/create_product.html')
 
+@admin_bp.route('/import_products', methods=['GET', 'POST'])
+def import_products():
+    """Bulk import products from a CSV or JSONL catalog file"""
+    check = require_admin()
+    if check: return check
+    
+    report = None
+    if request.method == 'POST':
+        catalog_file = request.files.get('catalog_file')
+        if catalog_file and catalog_file.filename:
+            try:
+                report = import_catalog(catalog_file.stream, detect_format(catalog_file.filename),
+                                        max_rows=IMPORT_WEB_MAX_ROWS)
+            except CatalogTooLarge as e:
+                flash(f'Το αρχείο έχει περισσότερες από {e.max_rows} γραμμές. '
+                      f'Μεγάλοι κατάλογοι εισάγονται με την εντολή flask import-catalog.', 'error')
+            else:
+                flash(f'Η εισαγωγή ολοκληρώθηκε: {report["inserted"]} νέα προϊόντα, '
+                      f'{report["updated"]} ενημερώσεις, {report["rejected"]} γραμμές απορρίφθηκαν.',
+                      'error' if report['rejected'] else 'success')
+        else:
+            flash('Παρακαλώ επιλέξτε αρχείο CSV ή JSONL!', 'error')
+    
+    return render_template('admin/import_products.html', report=report, max_rows=IMPORT_WEB_MAX_ROWS)
+
 @admin_bp.route('/products')
 def view_products():
     """View all products"""
     check = require_admin()
     if check: return check
     
-    # Get all master products
-    products = list(db_instance.db.products_master.find())
-    
-    # Enrich with total quantities across all units
-    for product in products:
-        # Get total quantity across all units
-        unit_products = list(db_instance.db.unit_products.find({
-            "product_id": product["product_id"]
-        }))
-        
-        total_quantity = sum(up.get("product_quantity", 0) for up in unit_products)
-        
-        product["total_quantity"] = total_quantity
+    # Get one page of master products, enriched with total quantities across all units
+    page = product_model.get_master_products_page(page_size=page_size_from(request.args),
+                                                  cursor=request.args.get('cursor'))
     
-    return render_template('admin/view_products.html', products=products)
+    return render_template('admin/view_products.html',
+                         products=page['items'],
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'])
 
 @admin_bp.route('/delete_product/<product_id>')
 def delete_product(product_id):
@@ -173,7 +197,7 @@ def delete_product(product_id):
     if check: return check
     
     # Get product name for flash message
-    product = db_instance.db.products_master.find_one({"product_id": product_id})
+    product = product_model.get_master_product(product_id)
     if not product:
         flash('Το προϊόν δεν βρέθηκε!', 'error')
         return redirect(url_for('admin.view_products'))
@@ -196,12 +220,8 @@ def delete_product(product_id):
         flash(f'Δεν μπορείτε να διαγράψετε το προϊόν "{product_name}" γιατί υπάρχει απόθεμα στις αποθήκες: {", ".join(units_with_stock)}', 'error')
         return redirect(url_for('admin.view_products'))
     
-    # Delete product from all units and transactions
-    db_instance.db.unit_products.delete_many({"product_id": product_id})
-    db_instance.db.transactions.delete_many({"product_id": product_id})
-    
-    # Delete from master catalog
-    db_instance.db.products_master.delete_one({"product_id": product_id})
+    # Delete product from all units, transactions and master catalog
+    product_model.delete_product(product_id)
     
     flash(f'Το προϊόν "{product_name}" διαγράφηκε επιτυχώς από όλες τις αποθήκες!', 'success')
     return redirect(url_for('admin.view_products'))
@@ -213,7 +233,7 @@ def view_product_details(product_id):
     if check: return check
     
     # Get master product
-    product = db_instance.db.products_master.find_one({"product_id": product_id})
+    product = product_model.get_master_product(product_id)
     if not product:
         flash('Το προϊόν δεν βρέθηκε!', 'error')
         return redirect(url_for('admin.view_products'))
@@ -242,9 +262,7 @@ def view_product_details(product_id):
             total_gain += unit_info['gain']
     
     # Get recent transactions for this product
-    recent_transactions = list(db_instance.db.transactions.find({
-        "product_id": product_id
-    }).sort("timestamp", -1).limit(20))
+    recent_transactions = transaction_model.get_transactions_by_product(product_id, limit=20)
     
     # Enrich transactions with unit names
     for transaction in recent_transactions:
@@ -265,7 +283,7 @@ def edit_product(product_id):
     if check: return check
     
     # Get product
-    product = db_instance.db.products_master.find_one({"product_id": product_id})
+    product = product_model.get_master_product(product_id)
     if not product:
         flash('Το προϊόν δεν βρέθηκε!', 'error')
         return redirect(url_for('admin.view_products'))
@@ -285,18 +303,15 @@ def edit_product(product_id):
                 product_selling_price >= 0, product_manufacturer]):
             
             # Update product in master catalog
-            db_instance.db.products_master.update_one(
-                {"product_id": product_id},
-                {"$set": {
-                    "product_name": product_name,
-                    "product_weight": product_weight,
-                    "product_volume": product_volume,
-                    "product_category": product_category,
-                    "product_purchase_price": product_purchase_price,
-                    "product_selling_price": product_selling_price,
-                    "product_manufacturer": product_manufacturer
-                }}
-            )
+            product_model.update_product(product_id, {
+                "product_name": product_name,
+                "product_weight": product_weight,
+                "product_volume": product_volume,
+                "product_category": product_category,
+                "product_purchase_price": product_purchase_price,
+                "product_selling_price": product_selling_price,
+                "product_manufacturer": product_manufacturer
+            })
             
             flash(f'Το προϊόν "{product_name}" ενημερώθηκε επιτυχώς!', 'success')
             return redirect(url_for('admin.view_products'))
@@ -408,6 +423,102 @@ def access_unit_as_supervisor(unit_id):
     flash(f'Πρόσβαση ως προϊστάμενος στην αποθήκη "{unit["unit_name"]}"', 'info')
     return redirect(url_for('supervisor.dashboard'))
 
+@admin_bp.route('/export_transactions')
+def export_transactions():
+    """Export the transactions ledger (form, or streamed download when format is given)"""
+    check = require_admin()
+    if check: return check
+    
+    file_format = request.args.get('format')
+    if file_format not in EXPORT_FORMATS:
+        return render_template('admin/export_transactions.html',
+                             units=unit_model.get_all_units(),
+                             archived_before=transaction_model.archived_before())
+    
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d') if request.args.get('start_date') else None
+        # Inclusive end date
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end_date') else None
+    except ValueError:
+        flash('Μη έγκυρη ημερομηνία!', 'error')
+        return redirect(url_for('admin.export_transactions'))
+    
+    unit_id = request.args.get('unit_id') or None
+    transaction_type = request.args.get('transaction_type') if request.args.get('transaction_type') in ('sale', 'purchase') else None
+    compress = request.args.get('gzip') == '1'
+    source = request.args.get('source') if request.args.get('source') in EXPORT_SOURCES else 'hot'
+    
+    query = transactions_query(unit_id, start_date, end_date, transaction_type)
+    mimetype = 'application/gzip' if compress else ('text/csv' if file_format == 'csv' else 'application/x-ndjson')
+    return Response(
+        stream_with_context(stream_transactions_export(query, file_format, compress, source=source)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={export_filename(file_format, compress, unit_id)}"}
+    )
+
+@admin_bp.route('/api/runtime_stats')
+def runtime_stats():
+    """In-process cache and password hashing statistics (this worker only)"""
+    check = require_admin()
+    if check: return check
+    
+    return jsonify({
+        "catalog_cache": catalog_cache.stats(),
+        "password_hasher": password_hasher.stats()
+    })
+
+@admin_bp.route('/profiles')
+def profiles():
+    """Profiled requests of this worker (slow ones and ?profile=1), newest first"""
+    check = require_admin()
+    if check: return check
+    
+    return render_template('admin/profiles.html',
+                         captures=list(reversed(profiling.captures)),
+                         slow_ms=profiling.PROFILE_SLOW_MS,
+                         pid=os.getpid())
+
+@admin_bp.route('/profiles/<int:capture_id>')
+def profile_detail(capture_id):
+    """Stack profile summary and MongoDB commands of one profiled request"""
+    check = require_admin()
+    if check: return check
+    
+    capture = profiling.get_capture(capture_id)
+    if not capture:
+        flash('Το προφίλ δεν βρέθηκε (κρατούνται μόνο τα πιο πρόσφατα)!', 'error')
+        return redirect(url_for('admin.profiles'))
+    
+    # Share of samples per function (inclusive), for a quick look without a viewer
+    total = sum(capture['samples'].values())
+    functions = {}
+    for stack, count in capture['samples'].items():
+        for frame in set(stack):
+            functions[frame] = functions.get(frame, 0) + count
+    top_functions = sorted(functions.items(), key=lambda item: item[1], reverse=True)[:25]
+    
+    return render_template('admin/profile_detail.html',
+                         capture=capture,
+                         total_samples=total,
+                         top_functions=top_functions)
+
+@admin_bp.route('/profiles/<int:capture_id>/<file_format>')
+def profile_download(capture_id, file_format):
+    """Download a capture as collapsed stacks or as a speedscope file"""
+    check = require_admin()
+    if check: return check
+    
+    capture = profiling.get_capture(capture_id)
+    if not capture or file_format not in ('collapsed', 'speedscope'):
+        flash('Το προφίλ δεν βρέθηκε (κρατούνται μόνο τα πιο πρόσφατα)!', 'error')
+        return redirect(url_for('admin.profiles'))
+    
+    if file_format == 'collapsed':
+        body, mimetype, filename = profiling.collapsed_stacks(capture), 'text/plain', f"profile_{capture_id}.collapsed.txt"
+    else:
+        body, mimetype, filename = profiling.speedscope_profile(capture), 'application/json', f"profile_{capture_id}.speedscope.json"
+    return Response(body, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
 @admin_bp.route('/statistics')
 def company_statistics():
     """View company-wide statistics"""
@@ -418,6 +529,10 @@ def company_statistics():
     units = unit_model.get_all_units()
     supervisors = user_model.get_all_supervisors()
     
+    # Per-unit totals and headcount, each with a single query
+    financial_summaries = product_model.calculate_all_financial_summaries(units)
+    employees_per_unit = user_model.count_users_by_unit(role='employee')
+    
     # Initialize statistics containers
     total_realized_gain = 0
     total_potential_gain = 0
@@ -425,13 +540,10 @@ def company_statistics():
     total_volume_capacity = 0
     total_employees = 0
     unit_financial_data = []
-    product_categories = {}
-    employee_performance = []
     monthly_sales = {}
     
     for unit in units:
-        # Get financial summary for each unit
-        financial_summary = product_model.calculate_unit_financial_summary(unit['unit_id'])
+        financial_summary = financial_summaries[unit['unit_id']]
         total_realized_gain += financial_summary['total_realized_gain']
         total_potential_gain += financial_summary['total_potential_gain']
         
@@ -442,50 +554,26 @@ def company_statistics():
             'financial_summary': financial_summary
         })
         
-        # Get unit products for other calculations
-        unit_products = product_model.get_products_by_unit(unit['unit_id'])
-        
-        # Calculate volume usage
-        unit_volume_used = 0
-        for p in unit_products:
-            if 'product_volume' in p and 'product_quantity' in p:
-                unit_volume_used += p['product_volume'] * p['product_quantity']
-            
-            # Collect product categories
-            category = p.get('product_category', 'Άλλα')
-            if category in product_categories:
-                product_categories[category] += p.get('product_quantity', 0)
-            else:
-                product_categories[category] = p.get('product_quantity', 0)
-        
-        total_volume_used += unit_volume_used
+        total_volume_used += financial_summary['total_volume_used']
         total_volume_capacity += unit['unit_volume']
         
         # Count employees in this unit
-        unit_employees = user_model.get_users_by_unit(unit['unit_id'])
-        employees_only = [emp for emp in unit_employees if emp['role'] == 'employee']
-        total_employees += len(employees_only)
-        
-        # Get employee performance (sales data from transactions)
-        for employee in employees_only:
-            # Get transactions performed by this employee
-            employee_transactions = list(db_instance.db.transactions.find({
-                "unit_id": unit['unit_id'],
-                "performed_by": employee['username'],
-                "transaction_type": "sale"
-            }))
-            
-            total_sales = sum(t.get('total_amount', 0) for t in employee_transactions)
-            total_quantity = sum(t.get('quantity', 0) for t in employee_transactions)
-            
-            if total_sales > 0:  # Only include employees with sales
-                employee_performance.append({
-                    'name': f"{employee['name']} {employee['surname']}",
-                    'unit_name': unit['unit_name'],
-                    'total_sales': total_sales,
-                    'total_quantity': total_quantity,
-                    'transactions_count': len(employee_transactions)
-                })
+        total_employees += employees_per_unit.get(unit['unit_id'], 0)
+    
+    # Stock per product category across all units (derived view when DERIVED_VIEWS is on)
+    product_categories = derived_views.category_stock()
+    
+    # Top 10 employees by sales (derived view when DERIVED_VIEWS is on)
+    unit_names = {unit['unit_id']: unit['unit_name'] for unit in units}
+    employee_performance = []
+    for seller in derived_views.top_sellers(10):
+        employee_performance.append({
+            'name': f"{seller['name']} {seller['surname']}",
+            'unit_name': unit_names.get(seller['unit_id'], 'Άγνωστη'),
+            'total_sales': seller['total_sales'],
+            'total_quantity': seller['total_quantity'],
+            'transactions_count': seller['transactions_count']
+        })
     
     # Add supervisors to employee count
     total_employees += len(supervisors)
@@ -493,35 +581,17 @@ def company_statistics():
     # Calculate volume usage percentage
     volume_usage_percentage = (total_volume_used / total_volume_capacity * 100) if total_volume_capacity > 0 else 0
     
-    # Get monthly sales data for charts
-    from datetime import datetime, timedelta
-    import calendar
-    
-    # Get transactions from last 12 months
+    # Monthly sales for the last 12 months, from the daily rollups or their monthly view
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=365)
     
-    transactions = list(db_instance.db.transactions.find({
-        "timestamp": {"$gte": start_date, "$lte": end_date},
-        "transaction_type": "sale"
-    }))
-    
-    for transaction in transactions:
-        month_key = transaction['timestamp'].strftime('%Y-%m')
-        month_name = calendar.month_name[transaction['timestamp'].month] + ' ' + str(transaction['timestamp'].year)
-        
-        if month_key in monthly_sales:
-            monthly_sales[month_key]['amount'] += transaction.get('total_amount', 0)
-            monthly_sales[month_key]['quantity'] += transaction.get('quantity', 0)
-        else:
-            monthly_sales[month_key] = {
-                'month_name': month_name,
-                'amount': transaction.get('total_amount', 0),
-                'quantity': transaction.get('quantity', 0)
-            }
-    
-    # Sort employee performance by sales
-    employee_performance.sort(key=lambda x: x['total_sales'], reverse=True)
+    for month_key, totals in derived_views.monthly_totals(start_date, end_date).items():
+        year, month = month_key.split('-')
+        monthly_sales[month_key] = {
+            'month_name': calendar.month_name[int(month)] + ' ' + year,
+            'amount': totals['amount'],
+            'quantity': totals['quantity']
+        }
     
     # Sort unit financial data
     unit_financial_data.sort(key=lambda x: x['financial_summary']['total_potential_gain'], reverse=True)
@@ -537,7 +607,7 @@ def company_statistics():
                          total_employees=total_employees,
                          unit_financial_data=unit_financial_data,
                          product_categories=product_categories,
-                         employee_performance=employee_performance[:10],  # Top 10
+                         employee_performance=employee_performance,
                          monthly_sales=monthly_sales_list,
                          unit_count=len(units))
 
@@ -562,11 +632,8 @@ def view_unit(unit_id):
     # Get unit employees
     unit_employees = user_model.get_users_by_unit(unit_id)
     
-    # Calculate volume usage
-    total_volume_used = 0
-    for product in unit_products:
-        if 'product_volume' in product and 'product_quantity' in product:
-            total_volume_used += product['product_volume'] * product['product_quantity']
+    # Volume usage comes with the financial summary
+    total_volume_used = financial_summary['total_volume_used']
     
     volume_usage_percentage = (total_volume_used / unit['unit_volume'] * 100) if unit['unit_volume'] > 0 else 0
     
@@ -642,8 +709,9 @@ def delete_unit(unit_id):
         # Delete unit products
         db_instance.db.unit_products.delete_many({"unit_id": unit_id})
         
-        # Delete transactions
-        db_instance.db.transactions.delete_many({"unit_id": unit_id})
+        # Delete transactions and their rollups
+        transaction_model.delete_transactions(unit_id=unit_id)
+        sales_rollup_model.delete_rollups(unit_id=unit_id)
         
         # Delete unit
         result = unit_model.delete_unit(unit_id)
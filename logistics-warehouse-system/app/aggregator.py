@@ -0,0 +1,346 @@
+"""
+Derived statistics views, kept current by a change-stream worker
+
+The company statistics page groups stock by category, sales by employee
+and sales by month. With DERIVED_VIEWS=true it reads these totals from
+prepared collections instead of aggregating the raw data on every view:
+
+    product_stock   {_id: product_id, product_category, quantity}
+    category_stock  {_id: category, quantity}
+    employee_sales  {performed_by, unit_id, total_sales, total_quantity, transactions_count}
+    monthly_sales   {unit_id, month, sale_count, sale_quantity, sale_amount, purchase_...}
+
+`flask aggregate-views` tails a change stream (replica set only) on
+unit_products, products_master, transactions and sales_rollups. Each event
+marks the keys it touches (a product, a seller, a unit and month), and
+every AGGREGATOR_INTERVAL_MS the marked keys are recomputed from their
+source. Recomputing is idempotent, so events replayed after a restart do
+no harm: the resume token is stored after each refresh and the worker
+continues from it. Deletes don't say which keys they touched, so they
+rebuild the affected view in full.
+
+Unit totals are not handled here: unit_summaries is already kept current
+on every stock change (see UnitSummaryModel).
+"""
+import os
+import time
+from datetime import datetime
+from pymongo import ReplaceOne, DeleteOne
+from pymongo.errors import OperationFailure
+from .database import db_instance
+from .models import product_model, transaction_model, sales_rollup_model, SalesRollupModel, top_seller_stages
+
+# Pages read the derived views (needs `flask aggregate-views` running)
+DERIVED_VIEWS = os.getenv('DERIVED_VIEWS', 'false').lower() in ('1', 'true', 'yes')
+
+# Marked keys are recomputed at most this often
+AGGREGATOR_INTERVAL_MS = int(os.getenv('AGGREGATOR_INTERVAL_MS', '1000'))
+
+# Time-series collections have no change streams: with TRANSACTIONS_STORAGE=timeseries
+# the employee sales are rebuilt in full this often instead
+AGGREGATOR_TIMESERIES_REFRESH_S = float(os.getenv('AGGREGATOR_TIMESERIES_REFRESH_S', '60'))
+
+# The resume token is stored at least this often while there is nothing to refresh
+TOKEN_SAVE_INTERVAL_S = 10
+
+# Error code of $changeStream on a standalone server
+CHANGE_STREAM_NOT_SUPPORTED = 40573
+
+def month_of(day):
+    """First day of the month of a date"""
+    return SalesRollupModel.day_of(day).replace(day=1)
+
+def next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+def _write_keys(collection, key_fields, totals, keys=None):
+    """Replace the documents of totals ({key tuple: fields}) and delete the
+    given keys that have no totals (keys=None: every other document)"""
+    requests = []
+    for key, fields in totals.items():
+        key_query = dict(zip(key_fields, key))
+        requests.append(ReplaceOne(key_query, dict(fields, **key_query), upsert=True))
+    if keys is None:
+        keys = [tuple(document[field] for field in key_fields)
+                for document in collection.find({}, {field: 1 for field in key_fields})]
+    requests += [DeleteOne(dict(zip(key_fields, key))) for key in keys if key not in totals]
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+
+class DerivedViews:
+    """Recomputes and reads the derived views"""
+    enabled = DERIVED_VIEWS
+
+    @property
+    def db(self):
+        return db_instance.db
+
+    def _product_totals(self, product_ids=None):
+        """{(product_id,): {product_category, quantity}} summed over the units"""
+        match = {"product_id": {"$in": product_ids}} if product_ids is not None else {}
+        quantities = {row["_id"]: row["quantity"] for row in product_model.unit_products_collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$product_quantity"}}}
+        ])}
+        categories = {p["product_id"]: p.get("product_category") for p in product_model.master_collection.find(
+            {"product_id": {"$in": list(quantities)}}, {"_id": 0, "product_id": 1, "product_category": 1})}
+        # Products missing from the catalog count as "Άλλα", as in ProductModel.aggregate_category_stock
+        return {(product_id,): {"product_category": categories.get(product_id) or "Άλλα", "quantity": quantity}
+                for product_id, quantity in quantities.items()}
+
+    def refresh_products(self, product_ids):
+        """Recompute the stock of some products and of their old and new categories"""
+        product_ids = list(product_ids)
+        categories = {row["product_category"] for row in
+                      self.db.product_stock.find({"_id": {"$in": product_ids}}, {"product_category": 1})}
+        totals = self._product_totals(product_ids)
+        _write_keys(self.db.product_stock, ("_id",), totals, [(product_id,) for product_id in product_ids])
+        categories |= {fields["product_category"] for fields in totals.values()}
+        self.refresh_categories(categories)
+
+    def refresh_categories(self, categories):
+        """Recompute the stock of some categories from product_stock"""
+        totals = {(row["_id"],): {"quantity": row["quantity"]} for row in self.db.product_stock.aggregate([
+            {"$match": {"product_category": {"$in": list(categories)}}},
+            {"$group": {"_id": "$product_category", "quantity": {"$sum": "$quantity"}}}
+        ])}
+        _write_keys(self.db.category_stock, ("_id",), totals, [(category,) for category in categories])
+
+    def rebuild_stock(self):
+        totals = self._product_totals()
+        _write_keys(self.db.product_stock, ("_id",), totals)
+        categories = {}
+        for fields in totals.values():
+            key = (fields["product_category"],)
+            categories[key] = {"quantity": categories.get(key, {"quantity": 0})["quantity"] + fields["quantity"]}
+        _write_keys(self.db.category_stock, ("_id",), categories)
+
+    def _seller_totals(self, match):
+        """{(performed_by, unit_id): totals} of the sales matching a query"""
+        rows = transaction_model.aggregate(transaction_model.seller_totals_stages(match))
+        return {(row["_id"]["performed_by"], row["_id"]["unit_id"]): {
+                    field: row[field] for field in ("total_sales", "total_quantity", "transactions_count")}
+                for row in rows}
+
+    def refresh_sellers(self, keys):
+        """Recompute the sales of some (performed_by, unit_id) pairs"""
+        keys = set(keys)
+        totals = self._seller_totals({"performed_by": {"$in": list({performed_by for performed_by, _ in keys})}})
+        totals = {key: fields for key, fields in totals.items() if key in keys}
+        _write_keys(self.db.employee_sales, ("performed_by", "unit_id"), totals, keys)
+
+    def rebuild_sellers(self):
+        _write_keys(self.db.employee_sales, ("performed_by", "unit_id"), self._seller_totals({}))
+
+    def _month_totals(self, match):
+        """{(unit_id, month): sale and purchase totals} of the daily rollups matching a query"""
+        sums = {}
+        for transaction_type in SalesRollupModel.TRANSACTION_TYPES:
+            for field in ("count", "quantity", "amount"):
+                sums[f"{transaction_type}_{field}"] = {"$sum": f"${transaction_type}_{field}"}
+        rows = sales_rollup_model.collection.aggregate([
+            {"$match": match},
+            {"$group": dict(sums, _id={"unit_id": "$unit_id", "year": {"$year": "$day"}, "month": {"$month": "$day"}})}
+        ])
+        return {(row["_id"]["unit_id"], datetime(row["_id"]["year"], row["_id"]["month"], 1)):
+                {field: row[field] for field in sums} for row in rows}
+
+    def refresh_months(self, keys):
+        """Recompute the totals of some (unit_id, month) pairs from the daily rollups"""
+        keys = set(keys)
+        months_by_unit = {}
+        for unit_id, month in keys:
+            months_by_unit.setdefault(unit_id, []).append(month)
+        totals = {}
+        for unit_id, months in months_by_unit.items():
+            totals.update(self._month_totals({
+                "unit_id": unit_id,
+                "day": {"$gte": min(months), "$lt": next_month(max(months))}
+            }))
+        totals = {key: fields for key, fields in totals.items() if key in keys}
+        _write_keys(self.db.monthly_sales, ("unit_id", "month"), totals, keys)
+
+    def rebuild_months(self):
+        _write_keys(self.db.monthly_sales, ("unit_id", "month"), self._month_totals({}))
+
+    def rebuild(self):
+        """Recompute every view from the raw collections"""
+        self.rebuild_stock()
+        self.rebuild_sellers()
+        self.rebuild_months()
+
+    def category_stock(self):
+        """Total stock per product category ({category: quantity})"""
+        if not self.enabled:
+            return product_model.aggregate_category_stock()
+        return {row["_id"]: row["quantity"] for row in self.db.category_stock.find().sort("_id", 1)}
+
+    def top_sellers(self, limit=10):
+        """Top employees by sales amount (as TransactionModel.get_top_sellers)"""
+        if not self.enabled:
+            return transaction_model.get_top_sellers(limit)
+        pipeline = [
+            {"$project": {
+                "_id": {"performed_by": "$performed_by", "unit_id": "$unit_id"},
+                "total_sales": 1,
+                "total_quantity": 1,
+                "transactions_count": 1
+            }}
+        ] + top_seller_stages(limit)
+        return list(self.db.employee_sales.aggregate(pipeline))
+
+    def monthly_totals(self, start_date, end_date, transaction_type="sale"):
+        """Totals per month of all units ({'YYYY-MM': {amount, quantity, count}}), as
+        SalesRollupModel.get_monthly_totals"""
+        if not self.enabled:
+            return sales_rollup_model.get_monthly_totals(start_date, end_date, transaction_type)
+        totals = {}
+        for row in self.db.monthly_sales.find({"month": {"$gte": month_of(start_date), "$lte": end_date}}):
+            month = totals.setdefault(f"{row['month']:%Y-%m}", {"amount": 0, "quantity": 0, "count": 0})
+            for field in month:
+                month[field] += row[f"{transaction_type}_{field}"]
+        return {key: month for key, month in sorted(totals.items()) if month["count"] > 0}
+
+class Aggregator:
+    """Change-stream worker keeping the derived views current"""
+    STATE_ID = "aggregator"
+
+    def __init__(self, views, interval_ms=None, echo=None):
+        self.views = views
+        self.interval = (interval_ms if interval_ms is not None else AGGREGATOR_INTERVAL_MS) / 1000
+        self.echo = echo or (lambda message: None)
+        self._clear()
+
+    def _clear(self):
+        self.products = set()
+        self.sellers = set()
+        self.months = set()
+        self.rebuild_stock = self.rebuild_sellers = self.rebuild_months = False
+
+    @property
+    def dirty(self):
+        return bool(self.products or self.sellers or self.months
+                    or self.rebuild_stock or self.rebuild_sellers or self.rebuild_months)
+
+    def watched_collections(self):
+        collections = [product_model.unit_products_collection.name, product_model.master_collection.name,
+                       sales_rollup_model.collection.name]
+        if not transaction_model.timeseries:
+            collections.append(transaction_model.collection.name)
+        return collections
+
+    def mark(self, change):
+        """Mark the keys a change event touches"""
+        collection = change.get("ns", {}).get("coll")
+        operation = change["operationType"]
+        document = change.get("fullDocument")
+        if operation not in ("insert", "update", "replace", "delete"):
+            # drop, rename, dropDatabase, invalidate
+            self.rebuild_stock = self.rebuild_sellers = self.rebuild_months = True
+        elif collection in (product_model.unit_products_collection.name, product_model.master_collection.name):
+            if document is None:
+                self.rebuild_stock = True
+            else:
+                self.products.add(document["product_id"])
+        elif collection == transaction_model.collection.name:
+            if document is None:
+                self.rebuild_sellers = True
+            elif document["transaction_type"] == "sale":
+                self.sellers.add((document["performed_by"], document["unit_id"]))
+        elif collection == sales_rollup_model.collection.name:
+            if document is None:
+                self.rebuild_months = True
+            else:
+                self.months.add((document["unit_id"], month_of(document["day"])))
+
+    def refresh(self):
+        """Recompute the marked keys"""
+        if self.rebuild_stock:
+            self.views.rebuild_stock()
+        elif self.products:
+            self.views.refresh_products(self.products)
+        if self.rebuild_sellers:
+            self.views.rebuild_sellers()
+        elif self.sellers:
+            self.views.refresh_sellers(self.sellers)
+        if self.rebuild_months:
+            self.views.rebuild_months()
+        elif self.months:
+            self.views.refresh_months(self.months)
+        self.echo(f"Refreshed {len(self.products)} products, {len(self.sellers)} sellers, {len(self.months)} unit months"
+                  + (" (full rebuild)" if self.rebuild_stock or self.rebuild_sellers or self.rebuild_months else ""))
+        self._clear()
+
+    def load_token(self):
+        state = db_instance.db.counters.find_one({"_id": self.STATE_ID})
+        return state.get("resume_token") if state else None
+
+    def save_token(self, token):
+        db_instance.db.counters.update_one(
+            {"_id": self.STATE_ID},
+            {"$set": {"resume_token": token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def open_stream(self, resume_token=None):
+        return db_instance.db.watch(
+            [{"$match": {"$or": [
+                {"ns.coll": {"$in": self.watched_collections()}},
+                {"operationType": {"$in": ["dropDatabase", "invalidate"]}}
+            ]}}],
+            full_document='updateLookup',
+            resume_after=resume_token,
+            max_await_time_ms=max(int(self.interval * 1000), 1)
+        )
+
+    def run(self, rebuild=False, stop=None):
+        """Tail the change stream until stop() returns True (forever by default).
+
+        Without a stored resume token (first start, or rebuild=True) the views
+        are rebuilt in full, after the stream is opened so that no change made
+        during the rebuild is missed.
+        """
+        token = None if rebuild else self.load_token()
+        while not (stop and stop()):
+            with self._start(token) as stream:
+                self._tail(stream, stop)
+            # The stream was invalidated (database dropped or renamed): start over
+            token = None
+
+    def _start(self, token):
+        if token is not None:
+            try:
+                stream = self.open_stream(token)
+                self.echo("Resumed from the stored token")
+                return stream
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_NOT_SUPPORTED:
+                    raise
+                # The token fell off the oplog
+                self.echo(f"Cannot resume ({e}), rebuilding the views")
+        stream = self.open_stream()
+        self.views.rebuild()
+        self.save_token(stream.resume_token)
+        self.echo("Rebuilt the views")
+        return stream
+
+    def _tail(self, stream, stop):
+        last_refresh = last_save = last_timeseries_refresh = time.monotonic()
+        while stream.alive and not (stop and stop()):
+            change = stream.try_next()
+            if change is not None:
+                self.mark(change)
+            now = time.monotonic()
+            if transaction_model.timeseries and now - last_timeseries_refresh >= AGGREGATOR_TIMESERIES_REFRESH_S:
+                self.rebuild_sellers = True
+                last_timeseries_refresh = now
+            # Refresh once the interval is up, or as soon as the stream goes quiet
+            if self.dirty and (change is None or now - last_refresh >= self.interval):
+                self.refresh()
+                self.save_token(stream.resume_token)
+                last_refresh = last_save = time.monotonic()
+            elif not self.dirty and now - last_save >= TOKEN_SAVE_INTERVAL_S:
+                self.save_token(stream.resume_token)
+                last_save = now
+
+derived_views = DerivedViews()
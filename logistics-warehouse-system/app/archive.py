@@ -0,0 +1,185 @@
+"""
+Transaction archival (cold storage) for the Logistics Warehouse System
+
+Transactions older than the archive horizon are moved out of the hot
+collection into gzip-compressed JSONL files, one per day:
+
+    ARCHIVE_DIR/transactions/YYYY/MM/YYYY-MM-DD.jsonl.gz
+
+Their daily per-(unit, product) totals stay in sales_rollups and their
+per-seller totals in archived_seller_sales, so reports over long ranges and
+the top sellers keep working, and the detail can still be read back with
+iter_archived_transactions().
+
+With the time-series ledger the days are deleted by timestamp, which
+MongoDB supports on time-series collections from 7.0.
+"""
+import gzip
+import itertools
+import json
+import os
+from datetime import datetime, timedelta
+from .database import db_instance
+from .models import transaction_model, sales_rollup_model
+
+# Where the archive files are kept; must be persistent storage (the archived
+# detail exists nowhere else), so there is no default
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+
+# Transactions older than this many days are archived
+ARCHIVE_HORIZON_DAYS = int(os.getenv('ARCHIVE_HORIZON_DAYS', '365'))
+
+# Deleting from a time-series collection by a field other than the metaField
+TIMESERIES_DELETE_MIN_VERSION = (7, 0)
+
+# Archived transactions deleted from the hot collection per delete_many
+ARCHIVE_DELETE_BATCH_SIZE = 1000
+
+class ArchiveUnsupported(Exception):
+    """Archiving can't run: ARCHIVE_DIR is not set, or the server can't delete
+    archived transactions from the ledger"""
+
+def _day_dir(day):
+    return os.path.join(ARCHIVE_DIR, 'transactions', f"{day.year:04d}", f"{day.month:02d}")
+
+def _serialize(transaction):
+    document = dict(transaction)
+    document["_id"] = str(document["_id"])
+    document["timestamp"] = document["timestamp"].isoformat()
+    return document
+
+def _deserialize(line):
+    document = json.loads(line)
+    document["timestamp"] = datetime.fromisoformat(document["timestamp"])
+    return document
+
+def _days_with_transactions(before):
+    """Days (oldest first) that have transactions older than before"""
+    rows = transaction_model.aggregate([
+        {"$match": {"timestamp": {"$lt": before}}},
+        {"$group": {"_id": {
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"}
+        }}}
+    ])
+    return sorted(datetime(r["_id"]["year"], r["_id"]["month"], r["_id"]["day"]) for r in rows)
+
+def _add_sale(seller_totals, transaction):
+    if transaction["transaction_type"] != "sale":
+        return
+    totals = seller_totals.setdefault((transaction["performed_by"], transaction["unit_id"]),
+                                      {"total_sales": 0, "total_quantity": 0, "transactions_count": 0})
+    totals["total_sales"] += transaction["total_amount"]
+    totals["total_quantity"] += transaction["quantity"]
+    totals["transactions_count"] += 1
+
+def archive_day(day):
+    """Write one day of transactions to its archive file, then delete them from
+    the hot collection. Returns the number of transactions newly archived.
+
+    Safe to re-run after an interruption: transactions already in the day's
+    file are kept and not written twice, the seller totals are recomputed
+    from the whole file, and only the transactions read in this run are
+    deleted, by _id.
+    """
+    query = {"timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}
+    transactions = transaction_model.iter_transactions(query, sort_direction=1, batch_size=5000)
+    first = next(transactions, None)
+    if first is None:
+        return 0
+
+    os.makedirs(_day_dir(day), exist_ok=True)
+    path = os.path.join(_day_dir(day), f"{day:%Y-%m-%d}.jsonl.gz")
+    archived_ids = set()
+    hot_ids = []
+    count = 0
+    seller_totals = {}
+    with gzip.open(path + ".tmp", 'wt', encoding='utf-8') as archive_file:
+        # Transactions of an earlier, interrupted run
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as previous_file:
+                for line in previous_file:
+                    transaction = json.loads(line)
+                    archive_file.write(line)
+                    archived_ids.add(transaction["_id"])
+                    _add_sale(seller_totals, transaction)
+        for transaction in itertools.chain([first], transactions):
+            hot_ids.append(transaction["_id"])
+            if str(transaction["_id"]) in archived_ids:
+                continue
+            archive_file.write(json.dumps(_serialize(transaction), ensure_ascii=False) + "\n")
+            count += 1
+            _add_sale(seller_totals, transaction)
+    os.replace(path + ".tmp", path)
+
+    transaction_model.store_archived_seller_sales(day, seller_totals)
+    for start in range(0, len(hot_ids), ARCHIVE_DELETE_BATCH_SIZE):
+        transaction_model.collection.delete_many({"_id": {"$in": hot_ids[start:start + ARCHIVE_DELETE_BATCH_SIZE]}})
+    return count
+
+def archive_transactions(horizon_days=None, progress=None):
+    """Archive all transactions older than horizon_days (whole days).
+
+    The sales rollups of those days are rebuilt from the detail first, so the
+    daily totals are complete before the detail leaves the collection.
+    Raises ArchiveUnsupported if ARCHIVE_DIR is not set, or for a time-series
+    ledger on MongoDB before 7.0.
+    progress(day, count) is called after every archived day.
+    Returns {"days", "transactions", "archived_before"}.
+    """
+    if not ARCHIVE_DIR:
+        raise ArchiveUnsupported("ARCHIVE_DIR is not set: point it at persistent storage for the archive files")
+    if transaction_model.timeseries:
+        version = tuple(db_instance.client.server_info()["versionArray"][:2])
+        if version < TIMESERIES_DELETE_MIN_VERSION:
+            raise ArchiveUnsupported(
+                f"deleting from the time-series ledger by timestamp needs MongoDB "
+                f"{'.'.join(map(str, TIMESERIES_DELETE_MIN_VERSION))}+ (server is {'.'.join(map(str, version))})"
+            )
+    horizon_days = ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    cutoff = sales_rollup_model.day_of(datetime.utcnow() - timedelta(days=horizon_days))
+    report = {"days": 0, "transactions": 0, "archived_before": cutoff}
+
+    days = _days_with_transactions(cutoff)
+    if days:
+        sales_rollup_model.backfill(start_date=days[0], end_date=cutoff)
+    for day in days:
+        count = archive_day(day)
+        report["days"] += 1
+        report["transactions"] += count
+        if progress:
+            progress(day, count)
+
+    transaction_model.set_archived_before(cutoff)
+    return report
+
+def iter_archived_transactions(start_date=None, end_date=None, unit_id=None, product_id=None, transaction_type=None):
+    """Yield archived transactions (oldest first), read from the archive files on demand.
+
+    end_date is exclusive; the other filters are optional.
+    """
+    root = os.path.join(ARCHIVE_DIR, 'transactions')
+    if not ARCHIVE_DIR or not os.path.isdir(root):
+        return
+    filters = {"unit_id": unit_id, "product_id": product_id, "transaction_type": transaction_type}
+    filters = {field: value for field, value in filters.items() if value}
+
+    for year in sorted(os.listdir(root)):
+        for month in sorted(os.listdir(os.path.join(root, year))):
+            month_dir = os.path.join(root, year, month)
+            for name in sorted(os.listdir(month_dir)):
+                if not name.endswith('.jsonl.gz'):
+                    continue
+                day = datetime.strptime(name[:10], '%Y-%m-%d')
+                if (start_date and day + timedelta(days=1) <= start_date) or (end_date and day >= end_date):
+                    continue
+                with gzip.open(os.path.join(month_dir, name), 'rt', encoding='utf-8') as archive_file:
+                    for line in archive_file:
+                        transaction = _deserialize(line)
+                        if start_date and transaction["timestamp"] < start_date:
+                            continue
+                        if end_date and transaction["timestamp"] >= end_date:
+                            continue
+                        if all(transaction.get(field) == value for field, value in filters.items()):
+                            yield transaction
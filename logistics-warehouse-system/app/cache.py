@@ -0,0 +1,76 @@
+"""
+In-process caches for the Logistics Warehouse System
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe bounded cache with least-recently-used eviction and optional TTL"""
+    def __init__(self, max_size=1000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get cached value (None on miss) and mark it as recently used"""
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Insert or replace a value, evicting the least recently used entry if full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Get size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0
+            }
+
+# Product master catalog cache, keyed by product_id.
+# Kept up to date by the ProductModel write methods of this process; other
+# processes see catalog edits once their entry expires (CATALOG_CACHE_TTL seconds).
+# Only read paths use it: stock writes read products_master directly.
+catalog_cache = LRUCache(
+    max_size=int(os.getenv('CATALOG_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', '60')) or None
+)
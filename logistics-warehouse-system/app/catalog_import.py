@@ -0,0 +1,280 @@
+"""
+Bulk product catalog import (CSV / JSONL) for the Logistics Warehouse System
+"""
+import csv
+import io
+import itertools
+import json
+import os
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .database import db_instance
+from .cache import catalog_cache
+from .search import search_fields, autocomplete_index
+from .models import product_model, unit_summary_model, stock_deltas
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+
+# Largest file imported from the admin page: the import runs inside the
+# request and holds a worker thread (and the client's connection, which a
+# proxy may time out) until it ends, so bigger catalogs go through
+# `flask import-catalog`
+IMPORT_WEB_MAX_ROWS = int(os.getenv('IMPORT_WEB_MAX_ROWS', '5000'))
+
+# Only the first rejected rows are kept with their error, the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+
+# Same fields as ProductModel.create_product
+TEXT_FIELDS = ("product_name", "product_category", "product_manufacturer")
+NUMBER_FIELDS = ("product_weight", "product_volume", "product_purchase_price", "product_selling_price")
+
+class CatalogTooLarge(Exception):
+    """The catalog has more rows than an import is allowed to process"""
+    def __init__(self, max_rows):
+        super().__init__(f"catalog has more than {max_rows} rows")
+        self.max_rows = max_rows
+
+def validate_product_row(row):
+    """Validate and convert one catalog row.
+
+    Returns (product_id, product_data, initial_quantity); product_id is None for
+    new products. Raises ValueError describing the first invalid field.
+    """
+    product_data = {}
+    for field in TEXT_FIELDS:
+        value = str(row.get(field) or "").strip()
+        if not value:
+            raise ValueError(f"missing {field}")
+        product_data[field] = value
+
+    for field in NUMBER_FIELDS:
+        try:
+            value = float(row.get(field))
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {field}: {row.get(field)!r}")
+        if value < 0:
+            raise ValueError(f"negative {field}")
+        product_data[field] = value
+
+    initial_quantity = row.get('initial_quantity') or 0
+    try:
+        initial_quantity = int(initial_quantity)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid initial_quantity: {initial_quantity!r}")
+    if initial_quantity < 0:
+        raise ValueError("negative initial_quantity")
+
+    product_id = str(row.get('product_id') or "").strip() or None
+    return product_id, product_data, initial_quantity
+
+def detect_format(filename):
+    """'csv' or 'jsonl' from a file name"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+class _RawStream(io.RawIOBase):
+    """Raw binary stream over any object with read(), for io.TextIOWrapper.
+
+    werkzeug's spooled upload files don't implement readable() on Python 3.9.
+    Closing it leaves the wrapped stream open.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def iter_rows(stream, file_format):
+    """Yield (line number, row dict) from a binary stream, one row at a time"""
+    # newline='' splits lines on \n, \r\n and \r only (codecs readers also
+    # split on U+2028 and similar), and lets csv handle newlines in quoted fields
+    text = io.TextIOWrapper(io.BufferedReader(_RawStream(stream)), encoding='utf-8-sig', newline='')
+    if file_format == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield line_number, row
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+def _add_deltas(unit_deltas, unit_id, deltas):
+    totals = unit_deltas.setdefault(unit_id, {})
+    for field, value in deltas.items():
+        totals[field] = totals.get(field, 0) + value
+
+class CatalogImport:
+    """Streams catalog rows into products_master and unit_products in batches.
+
+    Rows with a known product_id update that product, rows without one become
+    new products (IDs allocated per batch) and are added to every unit with
+    their initial_quantity.
+    """
+    def __init__(self, batch_size=None, progress=None):
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self.progress = progress
+        self.report = {
+            "rows": 0,
+            "inserted": 0,
+            "updated": 0,
+            "rejected": 0,
+            "errors": [],
+            "unit_rows": 0,
+            "failed_unit_rows": 0
+        }
+        self._unit_ids = None
+
+    def _reject(self, line_number, error):
+        self.report["rejected"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_number, "error": str(error)})
+
+    def run(self, rows):
+        """Import (line number, row) pairs and return the report"""
+        self._unit_ids = [u["unit_id"] for u in db_instance.db.units.find({}, {"_id": 0, "unit_id": 1})]
+        rows = iter(rows)
+        try:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self._import_batch(batch)
+                if self.progress:
+                    self.progress(self.report)
+        finally:
+            # Prices and names changed behind the caches
+            if self.report["inserted"] or self.report["updated"]:
+                catalog_cache.clear()
+                autocomplete_index.invalidate()
+        return self.report
+
+    def _import_batch(self, batch):
+        valid = []
+        for line_number, row in batch:
+            self.report["rows"] += 1
+            if not isinstance(row, dict):
+                self._reject(line_number, row if isinstance(row, Exception) else "row is not an object")
+                continue
+            try:
+                valid.append((line_number,) + validate_product_row(row))
+            except ValueError as e:
+                self._reject(line_number, e)
+
+        # Split into updates of existing products and new products
+        given_ids = [product_id for _, product_id, _, _ in valid if product_id]
+        existing = {
+            p["product_id"]
+            for p in product_model.master_collection.find({"product_id": {"$in": given_ids}}, {"_id": 0, "product_id": 1})
+        } if given_ids else set()
+
+        updates, inserts = [], []
+        for line_number, product_id, product_data, initial_quantity in valid:
+            if product_id is None:
+                inserts.append((line_number, product_data, initial_quantity))
+            elif product_id in existing:
+                updates.append((line_number, product_id, product_data))
+            else:
+                self._reject(line_number, f"unknown product_id {product_id}")
+
+        if updates:
+            self._write_updates(updates)
+        if inserts:
+            self._write_inserts(inserts)
+
+    def _write_updates(self, updates):
+        old_products = {p["product_id"]: p for p in product_model.master_collection.find(
+            {"product_id": {"$in": [product_id for _, product_id, _ in updates]}})}
+        requests = [
+            UpdateOne({"product_id": product_id}, {"$set": dict(product_data, **search_fields(product_data["product_name"]))})
+            for _, product_id, product_data in updates
+        ]
+        failed = set()
+        try:
+            self.report["updated"] += product_model.master_collection.bulk_write(requests, ordered=False).matched_count
+        except BulkWriteError as e:
+            self.report["updated"] += e.details.get("nMatched", 0)
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                self._reject(updates[error["index"]][0], error.get("errmsg", ""))
+
+        # New prices and volumes revalue the stock held in every unit (as in update_product)
+        changed = {product_id: (old_products[product_id], dict(old_products[product_id], **product_data))
+                   for index, (_, product_id, product_data) in enumerate(updates)
+                   if index not in failed and product_id in old_products}
+        unit_deltas = {}
+        for up in product_model.unit_products_collection.find(
+                {"product_id": {"$in": list(changed)}, "product_quantity": {"$ne": 0}},
+                {"unit_id": 1, "product_id": 1, "product_quantity": 1}):
+            old_product, new_product = changed[up["product_id"]]
+            old_values = stock_deltas(old_product, up["product_quantity"])
+            new_values = stock_deltas(new_product, up["product_quantity"])
+            _add_deltas(unit_deltas, up["unit_id"], {k: new_values[k] - old_values[k] for k in new_values})
+        unit_summary_model.apply_deltas(unit_deltas)
+
+    def _write_inserts(self, inserts):
+        product_ids = product_model.allocate_product_ids(len(inserts))
+        documents = []
+        for product_id, (_, product_data, _) in zip(product_ids, inserts):
+            document = dict(product_data, product_id=product_id)
+            document.update(search_fields(product_data["product_name"]))
+            documents.append(document)
+
+        failed = set()
+        try:
+            product_model.master_collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                self._reject(inserts[error["index"]][0], error.get("errmsg", ""))
+        self.report["inserted"] += len(documents) - len(failed)
+
+        # Add the new products to every unit
+        new_rows = (
+            (unit_id, product_id, initial_quantity)
+            for index, (product_id, (_, _, initial_quantity)) in enumerate(zip(product_ids, inserts))
+            if index not in failed
+            for unit_id in self._unit_ids
+        )
+        fanout = product_model.bulk_add_to_units(new_rows)
+        self.report["unit_rows"] += fanout["inserted"]
+        self.report["failed_unit_rows"] += len(fanout["failed"])
+
+        # Add the initial stock to the unit summaries, except for rows that were not written
+        stocked = {document["product_id"]: (document, initial_quantity)
+                   for index, (document, (_, _, initial_quantity)) in enumerate(zip(documents, inserts))
+                   if index not in failed and initial_quantity}
+        missing = set()
+        failed_rows = [row for row in fanout["failed"] if row["product_id"] in stocked]
+        if failed_rows:
+            written = {(up["unit_id"], up["product_id"]) for up in product_model.unit_products_collection.find(
+                {"product_id": {"$in": list({row["product_id"] for row in failed_rows})}},
+                {"unit_id": 1, "product_id": 1})}
+            missing = {(row["unit_id"], row["product_id"]) for row in failed_rows} - written
+        unit_deltas = {}
+        for unit_id in self._unit_ids:
+            for product_id, (document, initial_quantity) in stocked.items():
+                if (unit_id, product_id) not in missing:
+                    _add_deltas(unit_deltas, unit_id, stock_deltas(document, initial_quantity))
+        unit_summary_model.apply_deltas(unit_deltas)
+
+def import_catalog(stream, file_format='csv', batch_size=None, progress=None, max_rows=None):
+    """Import a CSV or JSONL catalog from a binary stream. Returns the import report.
+
+    With max_rows, a catalog with more rows raises CatalogTooLarge before
+    anything is written.
+    """
+    rows = iter_rows(stream, file_format)
+    if max_rows:
+        rows = list(itertools.islice(rows, max_rows + 1))
+        if len(rows) > max_rows:
+            raise CatalogTooLarge(max_rows)
+    return CatalogImport(batch_size, progress).run(rows)
@@ -0,0 +1,183 @@
+"""
+Management commands for the Logistics Warehouse System (run with `flask <command>`)
+"""
+from datetime import timedelta
+import click
+from pymongo.errors import OperationFailure
+from .models import product_model, unit_summary_model, sales_rollup_model, transaction_model
+from .catalog_import import import_catalog, detect_format
+from .export import EXPORT_FORMATS, EXPORT_SOURCES, transactions_query, stream_transactions_export
+from .archive import archive_transactions, ArchiveUnsupported
+from .aggregator import Aggregator, derived_views, CHANGE_STREAM_NOT_SUPPORTED
+from .init_db import initialize_database, check_database_health
+
+def register_commands(app):
+    """Register management commands on the Flask app"""
+    app.cli.add_command(setup_db)
+    app.cli.add_command(rebuild_unit_summaries)
+    app.cli.add_command(backfill_sales_rollups)
+    app.cli.add_command(reindex_product_search)
+    app.cli.add_command(add_product_to_units)
+    app.cli.add_command(add_products_to_unit)
+    app.cli.add_command(import_catalog_command)
+    app.cli.add_command(export_transactions)
+    app.cli.add_command(migrate_transactions_timeseries)
+    app.cli.add_command(archive_transactions_command)
+    app.cli.add_command(aggregate_views)
+
+@click.command('setup-db')
+def setup_db():
+    """Create the indexes and the default admin user (run on deploy, before starting the workers)"""
+    click.echo("\n" + "="*50)
+    click.echo("🏗️  LOGISTICS WAREHOUSE SYSTEM SETUP")
+    click.echo("="*50)
+    ok = check_database_health() and initialize_database()
+    click.echo("="*50 + "\n")
+    if not ok:
+        raise SystemExit(1)
+
+@click.command('rebuild-unit-summaries')
+@click.option('--unit-id', default=None, help='Rebuild only this unit (default: all units)')
+def rebuild_unit_summaries(unit_id):
+    """Recompute unit_summaries from unit_products to repair drift"""
+    summaries = unit_summary_model.rebuild(unit_id)
+    for uid, summary in sorted(summaries.items()):
+        click.echo(f"✓ Unit {uid}: gain {summary['realized_gain']:.2f}€, "
+                   f"stock cost {summary['stock_cost']:.2f}€, "
+                   f"volume {summary['volume_used']:.2f} m³")
+    click.echo(f"✅ Rebuilt {len(summaries)} unit summaries")
+
+@click.command('backfill-sales-rollups')
+@click.option('--start', 'start_date', type=click.DateTime(['%Y-%m-%d']), default=None, help='First day (inclusive)')
+@click.option('--end', 'end_date', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day (inclusive)')
+def backfill_sales_rollups(start_date, end_date):
+    """Rebuild the daily sales rollups from the transactions history (all days, or a range)"""
+    if end_date:
+        end_date += timedelta(days=1)
+    written = sales_rollup_model.backfill(start_date, end_date)
+    click.echo(f"✅ Wrote {written} daily rollup documents")
+
+@click.command('reindex-product-search')
+def reindex_product_search():
+    """Recompute the normalized name and n-gram search fields of all products"""
+    updated = product_model.reindex_search_fields()
+    click.echo(f"✅ Reindexed {updated} products")
+
+def _progress_bar(label):
+    """Progress callback for the fan-out commands"""
+    def progress(done, total):
+        click.echo(f"\r{label}: {done}/{total}", nl=False)
+    return progress
+
+def _echo_fanout_report(report):
+    click.echo()
+    for row in report['failed']:
+        click.echo(f"✗ {row['unit_id']}/{row['product_id']}: {row['error']}")
+    click.echo(f"✅ Inserted {report['inserted']} of {report['total']} rows, {len(report['failed'])} failed")
+
+@click.command('add-product-to-units')
+@click.argument('product_id')
+@click.option('--quantity', default=0, help='Initial quantity for units that do not have the product yet')
+def add_product_to_units(product_id, quantity):
+    """Add a product to every unit that is missing it"""
+    report = product_model.add_product_to_all_units(product_id, quantity, _progress_bar(product_id))
+    if quantity and report['inserted']:
+        unit_summary_model.rebuild()
+    _echo_fanout_report(report)
+
+@click.command('add-products-to-unit')
+@click.argument('unit_id')
+def add_products_to_unit(unit_id):
+    """Add every master product that a unit is missing (with 0 quantity)"""
+    report = product_model.add_all_products_to_unit(unit_id, 0, _progress_bar(unit_id))
+    _echo_fanout_report(report)
+
+@click.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format (default: from the file extension)')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (default: IMPORT_BATCH_SIZE)')
+def import_catalog_command(path, file_format, batch_size):
+    """Import products from a CSV or JSONL catalog file"""
+    def progress(report):
+        click.echo(f"\rRows: {report['rows']} (inserted {report['inserted']}, "
+                   f"updated {report['updated']}, rejected {report['rejected']})", nl=False)
+    
+    with open(path, 'rb') as stream:
+        report = import_catalog(stream, file_format or detect_format(path), batch_size, progress)
+    
+    click.echo()
+    for error in report['errors']:
+        click.echo(f"✗ Line {error['line']}: {error['error']}")
+    if report['failed_unit_rows']:
+        click.echo(f"✗ {report['failed_unit_rows']} unit product rows failed, re-run add-products-to-unit for the affected units")
+    click.echo(f"✅ Inserted {report['inserted']}, updated {report['updated']}, rejected {report['rejected']} "
+               f"of {report['rows']} rows ({report['unit_rows']} unit product rows)")
+
+@click.command('export-transactions')
+@click.option('--unit-id', default=None, help='Only this unit (default: all units)')
+@click.option('--start', 'start_date', type=click.DateTime(['%Y-%m-%d']), default=None, help='First day (inclusive)')
+@click.option('--end', 'end_date', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day (inclusive)')
+@click.option('--type', 'transaction_type', type=click.Choice(['sale', 'purchase']), default=None)
+@click.option('--format', 'file_format', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip-compress the output')
+@click.option('--batch-size', type=int, default=None, help='Cursor batch size (default: EXPORT_BATCH_SIZE)')
+@click.option('--source', type=click.Choice(EXPORT_SOURCES), default='hot',
+              help='hot: transactions collection, archive: archived days, all: both')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default: stdout)')
+def export_transactions(unit_id, start_date, end_date, transaction_type, file_format, compress, batch_size, source, output):
+    """Stream the transactions ledger to a CSV or JSONL file"""
+    if end_date:
+        end_date += timedelta(days=1)
+    query = transactions_query(unit_id, start_date, end_date, transaction_type)
+    for chunk in stream_transactions_export(query, file_format, compress, batch_size, source):
+        output.write(chunk)
+
+@click.command('migrate-transactions-timeseries')
+@click.option('--batch-size', type=int, default=1000, help='Transactions per insert')
+def migrate_transactions_timeseries(batch_size):
+    """Copy the transactions collection into the time-series collection transactions_ts"""
+    copied = transaction_model.migrate_to_timeseries(batch_size, _progress_bar("transactions"))
+    click.echo()
+    click.echo(f"✅ Copied {copied} transactions into transactions_ts")
+    if not transaction_model.timeseries:
+        click.echo("Set TRANSACTIONS_STORAGE=timeseries and restart the app to use it "
+                   "(run this command again right before switching to copy late transactions)")
+
+@click.command('archive-transactions')
+@click.option('--older-than-days', type=int, default=None, help='Archive horizon in days (default: ARCHIVE_HORIZON_DAYS)')
+def archive_transactions_command(older_than_days):
+    """Move old transactions to compressed archive files (keeps their daily rollups)"""
+    def progress(day, count):
+        click.echo(f"✓ {day:%Y-%m-%d}: {count} transactions")
+    
+    try:
+        report = archive_transactions(older_than_days, progress)
+    except ArchiveUnsupported as e:
+        click.echo(f"✗ {e}")
+        raise SystemExit(1)
+    click.echo(f"✅ Archived {report['transactions']} transactions of {report['days']} days "
+               f"(everything before {report['archived_before']:%Y-%m-%d})")
+
+@click.command('aggregate-views')
+@click.option('--rebuild', is_flag=True, help='Rebuild the views in full instead of resuming from the stored token')
+@click.option('--once', is_flag=True, help='Rebuild the views and exit (no change stream, works without a replica set)')
+@click.option('--interval-ms', type=int, default=None, help='Refresh interval (default: AGGREGATOR_INTERVAL_MS)')
+def aggregate_views(rebuild, once, interval_ms):
+    """Keep the derived statistics views current from the change stream (needs a replica set)"""
+    if once:
+        derived_views.rebuild()
+        click.echo("✅ Rebuilt the derived views")
+        return
+    
+    aggregator = Aggregator(derived_views, interval_ms, echo=lambda message: click.echo(f"✓ {message}"))
+    try:
+        aggregator.run(rebuild=rebuild)
+    except OperationFailure as e:
+        if e.code != CHANGE_STREAM_NOT_SUPPORTED:
+            raise
+        click.echo("✗ Change streams need a replica set: start MongoDB with --replSet "
+                   "(docker compose -f compose.yaml -f compose.replicaset.yaml up)")
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        click.echo("Stopped")
@@ -2,17 +2,75 @@
 Database connection and configuration
 """
 import os
+import threading
 from pymongo import MongoClient
-from datetime import datetime
-import bcrypt
+from pymongo.errors import CollectionInvalid
+from .metrics import METRICS_ENABLED, command_metrics
+from .profiling import command_recorder
+
+def client_options():
+    """MongoClient pool and timeout settings from the environment"""
+    options = {
+        "maxPoolSize": int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+        "minPoolSize": int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+        "maxIdleTimeMS": int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000')),
+        "serverSelectionTimeoutMS": int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        "connectTimeoutMS": int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        "waitQueueTimeoutMS": int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+    }
+    # No socket timeout by default: exports and migrations run long queries
+    socket_timeout = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0'))
+    if socket_timeout:
+        options["socketTimeoutMS"] = socket_timeout
+    return options
 
 class Database:
+    """MongoDB access. Nothing talks to the server until the first query:
+    indexes and seed data are created by `flask setup-db`, not on import.
+    
+    Each process gets its own MongoClient: a client inherited through fork()
+    (pre-forking servers such as gunicorn) must not be used in the child."""
     def __init__(self):
         self.mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/LogisticsDB')
-        self.client = MongoClient(self.mongodb_uri)
-        self.db = self.client.LogisticsDB
-        self.initialize_indexes()
-        self.create_admin_user()
+        self.client_options = client_options()
+        # Multi-document transactions need a replica set (or sharded cluster)
+        self.use_transactions = os.getenv('MONGODB_TRANSACTIONS', 'false').lower() in ('1', 'true', 'yes')
+        # Transactions ledger storage: "collection" (plain collection "transactions")
+        # or "timeseries" (time-series collection "transactions_ts", MongoDB 6.0+;
+        # archiving old transactions from it needs 7.0)
+        self.transactions_storage = os.getenv('TRANSACTIONS_STORAGE', 'collection').lower()
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """MongoClient of this process, created on first use"""
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = MongoClient(
+                        self.mongodb_uri,
+                        event_listeners=([command_metrics] if METRICS_ENABLED else []) + [command_recorder],
+                        **self.client_options
+                    )
+                    self._pid = os.getpid()
+        return self._client
+    
+    def reset_after_fork(self):
+        """Drop the client inherited from the parent process (the next query opens a new one).
+        
+        The parent's client is not closed: its sockets and monitor threads
+        belong to the parent. Meant to run right after fork, while the child
+        has a single thread, so the lock is replaced rather than acquired."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+    
+    @property
+    def db(self):
+        """Database named in MONGODB_URI (LogisticsDB if the URI names none)"""
+        return self.client.get_default_database('LogisticsDB')
     
     def initialize_indexes(self):
         """Create database indexes for performance"""
@@ -25,34 +83,60 @@ class Database:
         
         # Products master collection indexes
         self.db.products_master.create_index("product_id", unique=True)
-        self.db.products_master.create_index("product_name")
+        # Sort field + product_id tie-breaker, so keyset pages walk the index in order
+        self.db.products_master.create_index([("product_name", 1), ("product_id", 1)])
+        self.db.products_master.create_index([("product_category", 1), ("product_id", 1)])
+        self.db.products_master.create_index([("product_selling_price", 1), ("product_id", 1)])
+        self.db.products_master.create_index("product_name_normalized")
+        self.db.products_master.create_index("product_name_ngrams")
         
         # Unit products collection indexes
         self.db.unit_products.create_index([("unit_id", 1), ("product_id", 1)], unique=True)
         self.db.unit_products.create_index("unit_id")
+        self.db.unit_products.create_index([("unit_id", 1), ("product_quantity", 1), ("product_id", 1)])
+        
+        # Unit summaries collection indexes
+        self.db.unit_summaries.create_index("unit_id", unique=True)
         
         # Transactions collection indexes
         self.db.transactions.create_index("unit_id")
         self.db.transactions.create_index("product_id")
         self.db.transactions.create_index([("timestamp", -1)])
+        self.db.transactions.create_index([("unit_id", 1), ("timestamp", 1)])
+        self.db.transactions.create_index([("transaction_type", 1), ("performed_by", 1)])
+        if self.transactions_storage == 'timeseries':
+            self.create_transactions_timeseries()
+        
+        # Sales rollups collection indexes
+        self.db.sales_rollups.create_index([("unit_id", 1), ("product_id", 1), ("day", 1)], unique=True)
+        self.db.sales_rollups.create_index("day")
+        
+        # Sales totals per seller of the archived transactions
+        self.db.archived_seller_sales.create_index([("day", 1), ("performed_by", 1), ("unit_id", 1)], unique=True)
+        self.db.archived_seller_sales.create_index("performed_by")
+        
+        # Derived views of the aggregation worker (flask aggregate-views)
+        self.db.unit_products.create_index("product_id")
+        self.db.product_stock.create_index("product_category")
+        self.db.employee_sales.create_index([("performed_by", 1), ("unit_id", 1)], unique=True)
+        self.db.monthly_sales.create_index([("unit_id", 1), ("month", 1)], unique=True)
+        self.db.monthly_sales.create_index("month")
     
-    def create_admin_user(self):
-        """Create default admin user if not exists"""
-        admin_exists = self.db.users.find_one({"username": "admin"})
-        if not admin_exists:
-            hashed_password = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt())
-            admin_user = {
-                "username": "admin",
-                "password": hashed_password,
-                "name": "System",
-                "surname": "Administrator",
-                "role": "admin",
-                "unit_id": None,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            self.db.users.insert_one(admin_user)
-            print("Admin user created successfully")
+    def create_transactions_timeseries(self):
+        """Create the time-series transactions collection and its indexes if missing"""
+        if not self.db.list_collection_names(filter={"name": "transactions_ts"}):
+            try:
+                self.db.create_collection("transactions_ts", timeseries={
+                    "timeField": "timestamp",
+                    "metaField": "meta",
+                    "granularity": os.getenv('TRANSACTIONS_TS_GRANULARITY', 'hours')
+                })
+            except CollectionInvalid:
+                pass  # created concurrently by another process
+        
+        self.db.transactions_ts.create_index([("meta.unit_id", 1), ("timestamp", -1)])
+        self.db.transactions_ts.create_index([("meta.product_id", 1), ("timestamp", -1)])
+        self.db.transactions_ts.create_index([("meta.transaction_type", 1), ("performed_by", 1)])
 
 # Global database instance
 db_instance = Database()
\ No newline at end of file
@@ -4,6 +4,8 @@ Employee routes for the Logistics Warehouse System
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from .models import user_model, unit_model, product_model, transaction_model
 from .database import db_instance
+from .search import autocomplete_index
+from .pagination import page_size_from
 
 employee_bp = Blueprint('employee', __name__, url_prefix='/employee')
 
@@ -44,8 +46,9 @@ def dashboard():
     # Get recent products (top 10 by quantity)
     products = product_model.get_products_by_unit(
         unit_id, 
-        sort_params={'field': 'product_quantity', 'order': -1}
-    )[:10]
+        sort_params={'field': 'product_quantity', 'order': -1},
+        limit=10
+    )
     
     return render_template('employee/dashboard.html',
                          unit_info=unit_info,
@@ -92,11 +95,16 @@ def view_products():
     if sort_field in ['product_name', 'product_quantity']:
         sort_params = {'field': sort_field, 'order': sort_order}
     
-    # Get products
-    products = product_model.get_products_by_unit(unit_id, search_params, sort_params)
+    # Get one page of products (keyset pagination)
+    page = product_model.get_products_page(unit_id, search_params, sort_params,
+                                           page_size=page_size_from(request.args),
+                                           cursor=request.args.get('cursor'))
     
     return render_template('employee/view_products.html',
-                         products=products,
+                         products=page['items'],
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'],
+                         partial_page=page['partial'],
                          unit_info=unit_info,
                          search_params=request.args,
                          is_supervisor=session.get('role') in ['supervisor', 'admin'])
@@ -115,10 +123,7 @@ def view_product_details(product_id):
         return redirect(url_for('employee.view_products'))
     
     # Get recent transactions for this product
-    recent_transactions = list(db_instance.db.transactions.find({
-        "unit_id": unit_id,
-        "product_id": product_id
-    }).sort("timestamp", -1).limit(10))
+    recent_transactions = transaction_model.get_transactions_by_product(product_id, unit_id, limit=10)
     
     return render_template('employee/product_details.html',
                          product=product,
@@ -146,20 +151,14 @@ def sell_product(product_id):
             elif quantity > product['product_quantity']:
                 flash(f'Δεν υπάρχει αρκετή ποσότητα! Διαθέσιμα: {product["product_quantity"]} τεμάχια', 'error')
             else:
-                # Update product quantity
-                success = product_model.update_product_quantity(
-                    unit_id, product_id, quantity, 'sale'
+                # Update product quantity and record transaction
+                success = product_model.process_transaction(
+                    unit_id, product_id, 'sale', quantity,
+                    session['username'],
+                    f"Πώληση {quantity} τεμαχίων"
                 )
                 
                 if success:
-                    # Record transaction
-                    transaction_model.record_transaction(
-                        unit_id, product_id, 'sale', quantity,
-                        product['product_selling_price'],
-                        session['username'],
-                        f"Πώληση {quantity} τεμαχίων"
-                    )
-                    
                     flash(f'Πουλήθηκαν επιτυχώς {quantity} τεμάχια του προϊόντος!', 'success')
                     return redirect(url_for('employee.view_product_details', product_id=product_id))
                 else:
@@ -172,6 +171,28 @@ def sell_product(product_id):
                          product=product,
                          is_supervisor=session.get('role') in ['supervisor', 'admin'])
 
+@employee_bp.route('/order', methods=['POST'])
+def create_sale_order():
+    """API endpoint for a multi-line sale (JSON: {"lines": [{"product_id", "quantity"}], "notes"})"""
+    check = require_employee()
+    if check: return check
+    
+    unit_id = get_current_unit_id()
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = product_model.parse_order_lines(data.get('lines'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    result = product_model.process_order(
+        unit_id, lines, 'sale', session['username'],
+        data.get('notes') or f"Παραγγελία πώλησης {len(lines)} γραμμών"
+    )
+    
+    if result['errors']:
+        return jsonify({"success": False, "errors": result['errors']}), 409
+    return jsonify({"success": True, "transaction_ids": result['transaction_ids']})
+
 @employee_bp.route('/search_products')
 def search_products_api():
     """API endpoint for product search (AJAX)"""
@@ -184,26 +205,8 @@ def search_products_api():
     if len(search_term) < 2:
         return jsonify([])
     
-    # Search by name or ID
-    search_params = {}
-    if search_term.startswith('P') and search_term[1:].isdigit():
-        # Search by product ID
-        search_params['product_id'] = search_term
-    else:
-        # Search by name
-        search_params['product_name'] = search_term
-    
-    products = product_model.get_products_by_unit(unit_id, search_params)
-    
-    # Return simplified product data for AJAX
-    results = []
-    for product in products[:10]:  # Limit to 10 results
-        results.append({
-            'product_id': product['product_id'],
-            'product_name': product['product_name'],
-            'product_quantity': product['product_quantity'],
-            'product_category': product.get('product_category', 'N/A')
-        })
+    # Search by ID or name in the in-memory autocomplete index (no database round trip)
+    results = autocomplete_index.search(unit_id, search_term, limit=10)
     
     return jsonify(results)
 
@@ -0,0 +1,117 @@
+"""
+Streaming export of the transactions ledger for the Logistics Warehouse System
+"""
+import csv
+import io
+import itertools
+import json
+import os
+import zlib
+from .database import db_instance
+from .models import transaction_model
+from .archive import iter_archived_transactions
+
+# Documents fetched per cursor round trip
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '5000'))
+
+# Output is emitted in chunks of about this many bytes
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FIELDS = (
+    "timestamp", "unit_id", "unit_name", "product_id", "product_name", "transaction_type",
+    "quantity", "unit_price", "total_amount", "performed_by", "notes"
+)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+# hot: transactions collection, archive: archived days, all: archive then hot
+EXPORT_SOURCES = ("hot", "archive", "all")
+
+def transactions_query(unit_id=None, start_date=None, end_date=None, transaction_type=None):
+    """Filter for the transactions to export (end_date is exclusive)"""
+    query = {}
+    if unit_id:
+        query["unit_id"] = unit_id
+    if transaction_type:
+        query["transaction_type"] = transaction_type
+    if start_date or end_date:
+        query["timestamp"] = {}
+        if start_date:
+            query["timestamp"]["$gte"] = start_date
+        if end_date:
+            query["timestamp"]["$lt"] = end_date
+    return query
+
+def _archived_transactions(query):
+    """Archived transactions matching a transactions_query() filter"""
+    timestamp = query.get("timestamp", {})
+    return iter_archived_transactions(
+        timestamp.get("$gte"), timestamp.get("$lt"),
+        query.get("unit_id"), query.get("product_id"), query.get("transaction_type")
+    )
+
+def iter_transactions(query, batch_size=None, source="hot"):
+    """Yield export rows (dicts with EXPORT_FIELDS) in timestamp order.
+
+    Unit and product names come from maps loaded once up front; products
+    deleted from the catalog are exported with an empty name.
+    """
+    unit_names = {u["unit_id"]: u.get("unit_name", "") for u in db_instance.db.units.find({}, {"_id": 0, "unit_id": 1, "unit_name": 1})}
+    product_names = {
+        p["product_id"]: p.get("product_name", "")
+        for p in db_instance.db.products_master.find({}, {"_id": 0, "product_id": 1, "product_name": 1})
+    }
+
+    transactions = []
+    if source in ("archive", "all"):
+        transactions = _archived_transactions(query)
+    if source in ("hot", "all"):
+        transactions = itertools.chain(transactions, transaction_model.iter_transactions(
+            query, sort_direction=1, batch_size=batch_size or EXPORT_BATCH_SIZE))
+
+    for transaction in transactions:
+        transaction["unit_name"] = unit_names.get(transaction.get("unit_id"), "")
+        transaction["product_name"] = product_names.get(transaction.get("product_id"), "")
+        yield {field: transaction.get(field) for field in EXPORT_FIELDS}
+
+def _format_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def iter_lines(rows, file_format='csv'):
+    """Yield the export as text chunks of about EXPORT_CHUNK_SIZE characters"""
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write = lambda row: writer.writerow([_format_value(row[field]) for field in EXPORT_FIELDS])
+    else:
+        write = lambda row: buffer.write(json.dumps(
+            {field: _format_value(value) for field, value in row.items()}, ensure_ascii=False) + "\n")
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of byte chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_transactions_export(query, file_format='csv', compress=False, batch_size=None, source="hot"):
+    """Yield the export of the transactions matching query as bytes"""
+    chunks = (text.encode('utf-8') for text in iter_lines(iter_transactions(query, batch_size, source), file_format))
+    return gzip_chunks(chunks) if compress else chunks
+
+def export_filename(file_format='csv', compress=False, unit_id=None):
+    """Download file name for an export"""
+    name = f"transactions_{unit_id}" if unit_id else "transactions"
+    return f"{name}.{file_format}" + (".gz" if compress else "")
@@ -1,8 +1,8 @@
 """
 Database initialization script for the Logistics Warehouse System
-Creates default admin user and sets up initial data if needed
+Creates the indexes and the default admin user (run with `flask setup-db`)
 """
-from .models import user_model
+from .models import user_model, product_model, transaction_model, unit_summary_model, sales_rollup_model
 from .database import db_instance
 
 def initialize_admin():
@@ -38,6 +38,25 @@ def initialize_database():
     try:
         print("🚀 Initializing Logistics Warehouse System Database...")
         
+        # Create indexes (no-op for the ones that already exist)
+        db_instance.initialize_indexes()
+        print("✓ Indexes are in place")
+        
+        # Name search needs the search fields on every product (older products lack them)
+        reindexed = product_model.reindex_search_fields(missing_only=True)
+        if reindexed:
+            print(f"✓ Added search fields to {reindexed} products")
+        
+        # Units created before unit_summaries existed get their totals from unit_products
+        created = unit_summary_model.create_missing()
+        if created:
+            print(f"✓ Created financial summaries for {len(created)} units")
+        
+        # The sales charts read sales_rollups: build them once from an existing ledger
+        if sales_rollup_model.collection.find_one() is None and transaction_model.collection.find_one() is not None:
+            written = sales_rollup_model.backfill()
+            print(f"✓ Built {written} daily sales rollups from the transactions")
+        
         # Initialize admin user
         admin_success = initialize_admin()
         
@@ -61,11 +80,12 @@ def check_database_health():
         
         # Check collections
         collections = db_instance.db.list_collection_names()
-        required_collections = ['users', 'units', 'products_master', 'unit_products', 'transactions']
+        required_collections = ['users', 'units', 'products_master', 'unit_products', transaction_model.collection.name]
         
         for collection in required_collections:
             if collection in collections:
-                count = db_instance.db[collection].count_documents({})
+                # From collection metadata: a full count of the ledger takes too long
+                count = db_instance.db[collection].estimated_document_count()
                 print(f"✓ Collection '{collection}': {count} documents")
             else:
                 print(f"! Collection '{collection}' will be created on first use")
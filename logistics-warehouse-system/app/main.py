@@ -8,43 +8,58 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
-
-# Import models after app creation to avoid circular imports
 from .models import user_model, unit_model, product_model, transaction_model
-from .database import db_instance
-
-# Initialize database and admin user
-from .init_db import initialize_database, check_database_health
-
-# Initialize database on startup
-def setup_database():
-    """Setup database and admin user"""
-    print("\n" + "="*50)
-    print("🏗️  LOGISTICS WAREHOUSE SYSTEM STARTUP")
-    print("="*50)
-    
-    # Check database health
-    if check_database_health():
-        # Initialize admin and default data
-        initialize_database()
-    
-    print("="*50 + "\n")
-
-# Call setup on import
-setup_database()
+from .security import HashingUnavailable
 
-# Import and register blueprints
-from .admin_routes import admin_bp
-from .supervisor_routes import supervisor_bp
-from .employee_routes import employee_bp
+def create_app():
+    """Create and configure the Flask application.
+    
+    Has no side effects on the database: the connection is opened by the
+    first request, indexes and the admin user are created by `flask setup-db`.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
+    
+    app.add_url_rule('/', 'index', index, methods=['GET', 'POST'])
+    app.add_url_rule('/login', 'login', login, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+    app.add_url_rule('/dashboard', 'dashboard', dashboard)
+    app.add_url_rule('/admin', 'admin_dashboard', admin_dashboard)
+    app.add_url_rule('/supervisor', 'supervisor_dashboard', supervisor_dashboard)
+    app.add_url_rule('/employee', 'employee_dashboard', employee_dashboard)
+    app.add_url_rule('/profile', 'profile', profile, methods=['GET', 'POST'])
+    app.add_url_rule('/change_password', 'change_password', change_password, methods=['GET', 'POST'])
+    
+    # Import and register blueprints
+    from .admin_routes import admin_bp
+    from .supervisor_routes import supervisor_bp
+    from .employee_routes import employee_bp
+    
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(supervisor_bp)
+    app.register_blueprint(employee_bp)
+    
+    app.register_error_handler(HashingUnavailable, hashing_unavailable)
+    
+    # Register management commands
+    from .commands import register_commands
+    register_commands(app)
+    
+    # Request and MongoDB metrics on /metrics
+    from .metrics import register_metrics
+    register_metrics(app)
+    
+    # Stack profiles of slow (or ?profile=1) admin requests
+    from .profiling import register_profiling
+    register_profiling(app)
+    
+    return app
 
-app.register_blueprint(admin_bp)
-app.register_blueprint(supervisor_bp)
-app.register_blueprint(employee_bp)
+def hashing_unavailable(error):
+    """Password hashing pool saturated (e.g. login rush): ask the user to retry"""
+    flash('Το σύστημα είναι προσωρινά απασχολημένο. Παρακαλώ δοκιμάστε ξανά σε λίγα δευτερόλεπτα.', 'error')
+    return redirect(request.url)
 
-@app.route('/', methods=['GET', 'POST'])
 def index():
     """Main landing page"""
     if 'user_id' in session:
@@ -55,7 +70,6 @@ def index():
     
     return render_template('login.html')
 
-@app.route('/login', methods=['GET', 'POST'])
 def login():
     """User login"""
     if request.method == 'POST':
@@ -84,14 +98,12 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
 def logout():
     """User logout"""
     session.clear()
     flash('Αποσυνδεθήκατε επιτυχώς!', 'info')
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
 def dashboard():
     """Main dashboard - redirects based on role"""
     if 'user_id' not in session:
@@ -108,7 +120,6 @@ def dashboard():
         flash('Άγνωστος ρόλος χρήστη!', 'error')
         return redirect(url_for('logout'))
 
-@app.route('/admin')
 def admin_dashboard():
     """Admin dashboard"""
     if session.get('role') != 'admin':
@@ -117,7 +128,6 @@ def admin_dashboard():
     
     return redirect(url_for('admin.dashboard'))
 
-@app.route('/supervisor')
 def supervisor_dashboard():
     """Supervisor dashboard"""
     if session.get('role') not in ['supervisor', 'admin']:
@@ -126,7 +136,6 @@ def supervisor_dashboard():
     
     return redirect(url_for('supervisor.dashboard'))
 
-@app.route('/employee')
 def employee_dashboard():
     """Employee dashboard"""
     if session.get('role') not in ['employee', 'supervisor', 'admin']:
@@ -135,7 +144,6 @@ def employee_dashboard():
     
     return redirect(url_for('employee.dashboard'))
 
-@app.route('/profile', methods=['GET', 'POST'])
 def profile():
     """User profile"""
     if 'user_id' not in session:
@@ -172,7 +180,6 @@ def profile():
     
     return render_template('profile.html', user=user, unit_info=unit_info)
 
-@app.route('/change_password', methods=['GET', 'POST'])
 def change_password():
     """Change user password"""
     if 'user_id' not in session:
@@ -203,5 +210,7 @@ def change_password():
     
     return render_template('change_password.html')
 
+# No module-level application: gunicorn and the flask CLI call create_app()
+# (`flask --app app:create_app run`), so importing the package builds nothing
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+Request and MongoDB metrics for the Logistics Warehouse System
+
+Every MongoDB command is attributed to the Flask endpoint that issued it
+(pymongo's CommandListener runs in the calling thread). Together with the
+request latencies this is exported in Prometheus text format on /metrics.
+Metrics are kept per process, like the caches. With METRICS_DIR set, every
+process also saves them there, and /metrics adds up all the workers (the
+others as of their last save), so consecutive scrapes don't jump between
+the counters of different workers.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from pymongo import monitoring
+
+# Collect request and command metrics (the listener runs on every command)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; without a token
+# it is disabled, unless METRICS_PUBLIC=true opens it to anyone
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'false').lower() in ('1', 'true', 'yes')
+
+# Directory shared by the worker processes (gunicorn) to sum their metrics;
+# empty: each process reports only its own
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL_S = float(os.getenv('METRICS_FLUSH_INTERVAL_S', '5'))
+
+# Add X-DB-Query-Count / X-DB-Time-Ms headers to every response
+DB_QUERY_HEADER = os.getenv('DB_QUERY_HEADER', 'false').lower() in ('1', 'true', 'yes')
+
+# Commands issued outside a request (CLI commands, background threads)
+BACKGROUND = "<background>"
+
+# Requests that matched no route (404s), kept under one label
+UNMATCHED = "<unmatched>"
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+class Histogram:
+    """Cumulative histogram, Prometheus style (latency buckets in seconds by default)"""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """{"buckets": [(upper bound label, cumulative count)...], "count", "sum"}"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+class MetricsRegistry:
+    """Counters and histograms keyed by endpoint (and method/status or command name)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}              # (endpoint, method, status) -> count
+        self.request_duration = {}      # endpoint -> Histogram
+        self.queries_per_request = {}   # endpoint -> Histogram
+        self.commands = {}              # (endpoint, command) -> {"count", "errors", "documents"}
+        self.command_duration = {}      # (endpoint, command) -> Histogram
+
+    def _histogram(self, table, key, buckets=None):
+        with self._lock:
+            histogram = table.get(key)
+            if histogram is None:
+                histogram = table[key] = Histogram(buckets)
+            return histogram
+
+    def observe_request(self, endpoint, method, status, seconds, queries):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+        self._histogram(self.request_duration, endpoint).observe(seconds)
+        self._histogram(self.queries_per_request, endpoint, QUERY_COUNT_BUCKETS).observe(queries)
+
+    def observe_command(self, endpoint, command, seconds, documents=0, failed=False):
+        with self._lock:
+            totals = self.commands.setdefault((endpoint, command), {"count": 0, "errors": 0, "documents": 0})
+            totals["count"] += 1
+            totals["documents"] += documents
+            if failed:
+                totals["errors"] += 1
+        self._histogram(self.command_duration, (endpoint, command)).observe(seconds)
+
+    def items(self, table):
+        with self._lock:
+            return sorted(table.items())
+
+registry = MetricsRegistry()
+
+def current_endpoint():
+    """Metrics label for the code running in this thread"""
+    if not has_request_context():
+        return BACKGROUND
+    return request.endpoint or UNMATCHED
+
+def _returned_documents(command, reply):
+    """Number of documents a command reply carries back to the app"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if command == "distinct":
+        return len(reply.get("values") or ())
+    if command == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+class CommandMetrics(monitoring.CommandListener):
+    """Attributes every MongoDB command to the current endpoint and request"""
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event, _returned_documents(event.command_name, event.reply), False)
+
+    def failed(self, event):
+        self._observe(event, 0, True)
+
+    def _observe(self, event, documents, failed):
+        seconds = event.duration_micros / 1e6
+        registry.observe_command(current_endpoint(), event.command_name, seconds, documents, failed)
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_time = g.get('db_time', 0.0) + seconds
+
+command_metrics = CommandMetrics()
+
+def _before_request():
+    if METRICS_DIR:
+        _start_flusher()
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+def _after_request(response):
+    if 'request_started' not in g:
+        return response
+    if DB_QUERY_HEADER:
+        response.headers['X-DB-Query-Count'] = str(g.db_queries)
+        response.headers['X-DB-Time-Ms'] = f"{g.db_time * 1000:.1f}"
+
+    # Recorded when the response is closed, so streamed bodies (exports)
+    # count with their full duration and all their cursor batches
+    context = g._get_current_object()
+    endpoint, method, status = current_endpoint(), request.method, response.status_code
+    response.call_on_close(lambda: registry.observe_request(
+        endpoint, method, status, time.perf_counter() - context.request_started, context.db_queries))
+    return response
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+
+class Samples:
+    """Metric families of one process, in a form that can be saved as JSON and summed"""
+    def __init__(self, families=None):
+        self.families = families if families is not None else {}
+
+    def family(self, name, kind, help_text):
+        self.families.setdefault(name, {"kind": kind, "help": help_text, "samples": []})
+
+    def add(self, name, value, suffix="", **labels):
+        self.families[name]["samples"].append([suffix, [[label, str(v)] for label, v in labels.items()], value])
+
+    def histogram(self, name, snapshot, **labels):
+        for bound, count in snapshot["buckets"]:
+            self.add(name, count, "_bucket", **labels, le=bound)
+        self.add(name, snapshot["sum"], "_sum", **labels)
+        self.add(name, snapshot["count"], "_count", **labels)
+
+    def merge(self, other, gauges=True):
+        """Add the samples of another process (its gauges only if gauges is true)"""
+        for name, family in other.families.items():
+            if family["kind"] == "gauge" and not gauges:
+                continue
+            self.family(name, family["kind"], family["help"])
+            samples = self.families[name]["samples"]
+            index = {(sample[0], tuple(map(tuple, sample[1]))): sample for sample in samples}
+            for suffix, labels, value in family["samples"]:
+                sample = index.get((suffix, tuple(map(tuple, labels))))
+                if sample is None:
+                    samples.append([suffix, labels, value])
+                else:
+                    sample[2] += value
+
+    def render(self):
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for suffix, labels, value in family["samples"]:
+                lines.append(f"{name}{suffix}{{{_labels(labels)}}} {value}" if labels else f"{name}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+def collect():
+    """All metrics of this process"""
+    # Imported here: security builds its histograms from this module
+    from .cache import catalog_cache
+    from .security import password_hasher
+
+    samples = Samples()
+    samples.family("wms_http_requests_total", "counter", "HTTP requests by endpoint, method and status")
+    for (endpoint, method, status), count in registry.items(registry.requests):
+        samples.add("wms_http_requests_total", count, endpoint=endpoint, method=method, status=status)
+
+    samples.family("wms_http_request_duration_seconds", "histogram", "HTTP request latency by endpoint")
+    for endpoint, histogram in registry.items(registry.request_duration):
+        samples.histogram("wms_http_request_duration_seconds", histogram.snapshot(), endpoint=endpoint)
+
+    samples.family("wms_http_request_db_queries", "histogram", "MongoDB commands issued per request by endpoint")
+    for endpoint, histogram in registry.items(registry.queries_per_request):
+        samples.histogram("wms_http_request_db_queries", histogram.snapshot(), endpoint=endpoint)
+
+    commands = registry.items(registry.commands)
+    for name, field, help_text in (
+        ("wms_db_commands_total", "count", "MongoDB commands by endpoint and command"),
+        ("wms_db_command_errors_total", "errors", "Failed MongoDB commands by endpoint and command"),
+        ("wms_db_documents_returned_total", "documents", "Documents returned by MongoDB commands by endpoint and command")
+    ):
+        samples.family(name, "counter", help_text)
+        for (endpoint, command), totals in commands:
+            samples.add(name, totals[field], endpoint=endpoint, command=command)
+
+    samples.family("wms_db_command_duration_seconds", "histogram", "MongoDB command latency by endpoint and command")
+    for (endpoint, command), histogram in registry.items(registry.command_duration):
+        samples.histogram("wms_db_command_duration_seconds", histogram.snapshot(), endpoint=endpoint, command=command)
+
+    cache = catalog_cache.stats()
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+        name = f"wms_catalog_cache_{field}" + ("_total" if kind == "counter" else "")
+        samples.family(name, kind, f"Product catalog cache {field}")
+        samples.add(name, cache[field])
+
+    hasher = password_hasher.stats()
+    for field, kind in (("rejected", "counter"), ("timeouts", "counter"), ("in_flight", "gauge")):
+        name = f"wms_password_hash_{field}" + ("_total" if kind == "counter" else "")
+        samples.family(name, kind, f"Password hashing jobs {field.replace('_', ' ')}")
+        samples.add(name, hasher[field])
+    for field in ("hash_latency", "queue_wait"):
+        name = f"wms_password_{field}_seconds"
+        samples.family(name, "histogram", f"Password hashing {field.replace('_', ' ')}")
+        samples.histogram(name, hasher[field])
+
+    return samples
+
+def _sample_file(pid):
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+def flush():
+    """Save the metrics of this process to METRICS_DIR (replacing its previous file)"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _sample_file(os.getpid())
+    with open(path + ".tmp", 'w') as sample_file:
+        json.dump(collect().families, sample_file)
+    os.replace(path + ".tmp", path)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _flush_loop(pid):
+    while os.getpid() == pid:
+        time.sleep(METRICS_FLUSH_INTERVAL_S)
+        try:
+            flush()
+        except OSError:
+            pass
+
+_flusher = {"pid": None}
+_flusher_lock = threading.Lock()
+
+def _start_flusher():
+    """Save this process' metrics every METRICS_FLUSH_INTERVAL_S (one thread per process)"""
+    pid = os.getpid()
+    if _flusher["pid"] == pid:
+        return
+    with _flusher_lock:
+        if _flusher["pid"] != pid:
+            _flusher["pid"] = pid
+            threading.Thread(target=_flush_loop, args=(pid,), name="metrics-flush", daemon=True).start()
+            atexit.register(flush)
+
+def render_prometheus():
+    """Metrics in Prometheus text exposition format.
+
+    With METRICS_DIR, the saved metrics of the other workers are added to this
+    process' own: counters and histograms of every worker that ever ran
+    (so they don't go back when a worker is recycled), gauges of the live ones.
+    """
+    samples = collect()
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for name in sorted(os.listdir(METRICS_DIR)):
+            pid = name[:-len(".json")]
+            if not name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as sample_file:
+                    other = Samples(json.load(sample_file))
+            except (OSError, ValueError):
+                continue
+            samples.merge(other, gauges=_alive(int(pid)))
+    return samples.render()
+
+def metrics():
+    """Prometheus scrape endpoint"""
+    if not METRICS_TOKEN and not METRICS_PUBLIC:
+        return Response("set METRICS_TOKEN (or METRICS_PUBLIC=true) to enable /metrics\n",
+                        status=403, mimetype='text/plain')
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return Response("unauthorized\n", status=401, mimetype='text/plain')
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def register_metrics(app):
+    """Install the request hooks and the /metrics endpoint on the Flask app"""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -1,19 +1,46 @@
 """
 Database models for the Logistics Warehouse System
 """
+import itertools
+import os
 from datetime import datetime
 from bson import ObjectId
-import bcrypt
+from pymongo import ReturnDocument, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from .database import db_instance
+from .cache import catalog_cache
+from .search import search_fields, build_search_pipeline, autocomplete_index
+from .pagination import DEFAULT_PAGE_SIZE, decode_cursor, keyset_filter, build_page
+from .security import password_hasher, HashingUnavailable
+
+# unit_products fan-out writes are sent as unordered bulk writes of this many rows
+FANOUT_CHUNK_SIZE = int(os.getenv('FANOUT_CHUNK_SIZE', '1000'))
+
+class FanOutError(Exception):
+    """Raised when some unit_products rows of a fan-out could not be written"""
+    def __init__(self, report):
+        super().__init__(f"{len(report['failed'])} of {report['total']} unit product rows failed")
+        self.report = report
+
+# products_master batches scanned for one page sorted by a catalog field; a
+# sparse filter then returns a partial page that continues on the next one
+KEYSET_MAX_BATCHES = int(os.getenv('KEYSET_MAX_BATCHES', '10'))
+
+# Largest basket accepted by the order endpoints
+MAX_ORDER_LINES = int(os.getenv('MAX_ORDER_LINES', '200'))
+
+class OrderRejected(Exception):
+    """A stock change of an order did not apply (stock changed concurrently)"""
 
 class UserModel:
-    def __init__(self):
-        self.collection = db_instance.db.users
+    @property
+    def collection(self):
+        return db_instance.db.users
     
     def create_user(self, username, password, name, surname, role, unit_id=None):
         """Create a new user"""
         # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = password_hasher.hash_password(password)
         
         user_data = {
             "username": username,
@@ -37,13 +64,25 @@ class UserModel:
         return str(result.inserted_id)
     
     def authenticate_user(self, username, password, unit_id=None):
-        """Authenticate user credentials"""
+        """Authenticate user credentials.
+        
+        Hashes made with an outdated work factor are replaced on a successful login.
+        Raises HashingUnavailable if the hashing pool is saturated.
+        """
         query = {"username": username}
         if unit_id:
             query["unit_id"] = unit_id
             
         user = self.collection.find_one(query)
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+        if user and password_hasher.check_password(password, user['password']):
+            if password_hasher.needs_rehash(user['password']):
+                try:
+                    self.collection.update_one(
+                        {"_id": user["_id"], "password": user["password"]},
+                        {"$set": {"password": password_hasher.hash_password(password)}}
+                    )
+                except HashingUnavailable:
+                    pass  # try again on the next login
             return user
         return None
     
@@ -55,13 +94,24 @@ class UserModel:
         """Get all users in a specific unit"""
         return list(self.collection.find({"unit_id": unit_id}))
     
+    def count_users_by_unit(self, role=None):
+        """Count users per unit ({unit_id: count}) with a single aggregation"""
+        match = {"unit_id": {"$ne": None}}
+        if role:
+            match["role"] = role
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$unit_id", "count": {"$sum": 1}}}
+        ]
+        return {row["_id"]: row["count"] for row in self.collection.aggregate(pipeline)}
+    
     def get_all_supervisors(self):
         """Get all supervisors"""
         return list(self.collection.find({"role": "supervisor"}))
     
     def update_password(self, username, new_password):
         """Update user password"""
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = password_hasher.hash_password(new_password)
         result = self.collection.update_one(
             {"username": username},
             {"$set": {"password": hashed_password, "updated_at": datetime.utcnow()}}
@@ -71,7 +121,7 @@ class UserModel:
     def verify_password(self, username, password):
         """Verify user password"""
         user = self.collection.find_one({"username": username})
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+        if user and password_hasher.check_password(password, user['password']):
             return True
         return False
     
@@ -97,8 +147,9 @@ class UserModel:
         return self.collection.delete_one({"username": username})
 
 class UnitModel:
-    def __init__(self):
-        self.collection = db_instance.db.units
+    @property
+    def collection(self):
+        return db_instance.db.units
     
     def create_unit(self, unit_name, unit_volume):
         """Create a new warehouse unit"""
@@ -119,6 +170,7 @@ class UnitModel:
         }
         
         result = self.collection.insert_one(unit_data)
+        unit_summary_model.create_summary(unit_id)
         return unit_id
     
     def get_unit_by_id(self, unit_id):
@@ -131,24 +183,31 @@ class UnitModel:
     
     def delete_unit(self, unit_id):
         """Delete unit"""
+        unit_summary_model.delete_summary(unit_id)
         return self.collection.delete_one({"unit_id": unit_id})
 
 class ProductModel:
-    def __init__(self):
-        self.master_collection = db_instance.db.products_master
-        self.unit_products_collection = db_instance.db.unit_products
+    # Fields stored on unit_products rows (everything else comes from products_master)
+    UNIT_PRODUCT_FIELDS = ("unit_id", "product_id", "product_quantity", "product_unit_gain")
+    
+    @property
+    def master_collection(self):
+        return db_instance.db.products_master
+    
+    @property
+    def unit_products_collection(self):
+        return db_instance.db.unit_products
     
     def create_product(self, product_name, product_weight, product_volume, 
                       product_category, product_purchase_price, product_selling_price,
-                      product_manufacturer, initial_quantity=0):
-        """Create a new product in master catalog"""
+                      product_manufacturer, initial_quantity=0, progress=None):
+        """Create a new product in master catalog and add it to every unit.
+        
+        progress(done, total) is called while the unit rows are written. Raises
+        FanOutError (after the product itself was created) if some units failed.
+        """
         # Generate product_id
-        last_product = self.master_collection.find().sort("product_id", -1).limit(1)
-        try:
-            last_id = int(list(last_product)[0]["product_id"][1:])  # Remove 'P' prefix
-            product_id = f"P{str(last_id + 1).zfill(4)}"
-        except (IndexError, ValueError):
-            product_id = "P0001"
+        product_id = self.allocate_product_ids(1)[0]
         
         product_data = {
             "product_id": product_id,
@@ -160,16 +219,121 @@ class ProductModel:
             "product_selling_price": product_selling_price,
             "product_manufacturer": product_manufacturer
         }
+        product_data.update(search_fields(product_name))
         
         result = self.master_collection.insert_one(product_data)
+        catalog_cache.put(product_id, product_data)
+        autocomplete_index.upsert_product(product_data)
         
         # Add product to all existing units with specified initial quantity
-        units = db_instance.db.units.find()
-        for unit in units:
-            self.add_product_to_unit(unit["unit_id"], product_id, initial_quantity)
+        report = self.add_product_to_all_units(product_id, initial_quantity, progress)
+        failed_units = {row["unit_id"] for row in report["failed"]}
+        
+        if initial_quantity:
+            # Every unit received the same stock, so one update covers all summaries;
+            # it is taken back from the units whose row was not written after all
+            unit_summary_model.apply_delta_all(stock_deltas(product_data, initial_quantity))
+            written = {up["unit_id"] for up in self.unit_products_collection.find(
+                {"product_id": product_id, "unit_id": {"$in": list(failed_units)}}, {"unit_id": 1})}
+            unit_summary_model.apply_deltas({
+                unit_id: stock_deltas(product_data, -initial_quantity)
+                for unit_id in failed_units - written
+            })
+        
+        if failed_units:
+            autocomplete_index.invalidate()
+            raise FanOutError(report)
+        autocomplete_index.set_quantity_all(product_id, initial_quantity)
         
         return product_id
     
+    def allocate_product_ids(self, count):
+        """Reserve count consecutive product IDs (P0001, P0002, ...) with one counter update"""
+        counters = db_instance.db.counters
+        if counters.find_one({"_id": "product_id"}) is None:
+            # First use: continue after the highest existing ID
+            last_id = 0
+            for product in self.master_collection.find({}, {"_id": 0, "product_id": 1}):
+                try:
+                    last_id = max(last_id, int(product["product_id"][1:]))  # Remove 'P' prefix
+                except (KeyError, ValueError):
+                    pass
+            counters.update_one({"_id": "product_id"}, {"$max": {"seq": last_id}}, upsert=True)
+        
+        counter = counters.find_one_and_update(
+            {"_id": "product_id"},
+            {"$inc": {"seq": count}},
+            return_document=ReturnDocument.AFTER
+        )
+        first_id = counter["seq"] - count + 1
+        return [f"P{str(n).zfill(4)}" for n in range(first_id, counter["seq"] + 1)]
+    
+    def get_master_product(self, product_id, cached=True):
+        """Get product from master catalog (served from the catalog cache).
+        
+        Write paths pass cached=False: the cache is per process, so another
+        worker may still hold the prices from before an update_product, and
+        stock values computed from them would leave the unit summaries off.
+        """
+        product = catalog_cache.get(product_id) if cached else None
+        if product is None:
+            product = self.master_collection.find_one({"product_id": product_id})
+            if not product:
+                return None
+            catalog_cache.put(product_id, product)
+        # Return a copy so callers can't modify the cached document
+        return dict(product)
+    
+    def update_product(self, product_id, update_data):
+        """Update product in master catalog"""
+        if "product_name" in update_data:
+            update_data = dict(update_data, **search_fields(update_data["product_name"]))
+        
+        old_product = self.master_collection.find_one_and_update(
+            {"product_id": product_id},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not old_product:
+            catalog_cache.invalidate(product_id)
+            return None
+        
+        product = dict(old_product, **update_data)
+        catalog_cache.put(product_id, product)
+        autocomplete_index.upsert_product(product)
+        
+        # Price/volume changes revalue the stock held in every unit
+        unit_deltas = {}
+        for up in self.unit_products_collection.find(
+                {"product_id": product_id, "product_quantity": {"$ne": 0}},
+                {"unit_id": 1, "product_quantity": 1}):
+            new_values = stock_deltas(product, up["product_quantity"])
+            old_values = stock_deltas(old_product, up["product_quantity"])
+            unit_deltas[up["unit_id"]] = {k: new_values[k] - old_values[k] for k in new_values}
+        unit_summary_model.apply_deltas(unit_deltas)
+        
+        return product
+    
+    def delete_product(self, product_id):
+        """Delete product from master catalog, all units and transactions"""
+        master_product = self.get_master_product(product_id, cached=False)
+        if master_product:
+            # Remove the product's stock and realized gain from the unit summaries
+            unit_deltas = {}
+            for up in self.unit_products_collection.find({"product_id": product_id}):
+                deltas = stock_deltas(master_product, -up.get("product_quantity", 0))
+                deltas["realized_gain"] = -up.get("product_unit_gain", 0.0)
+                unit_deltas[up["unit_id"]] = deltas
+            unit_summary_model.apply_deltas(unit_deltas)
+        
+        self.unit_products_collection.delete_many({"product_id": product_id})
+        transaction_model.delete_transactions(product_id=product_id)
+        sales_rollup_model.delete_rollups(product_id=product_id)
+        result = self.master_collection.delete_one({"product_id": product_id})
+        catalog_cache.invalidate(product_id)
+        autocomplete_index.remove_product(product_id)
+        return result
+    
     def add_product_to_unit(self, unit_id, product_id, quantity=0):
         """Add product to specific unit"""
         unit_product_data = {
@@ -186,18 +350,92 @@ class ProductModel:
             upsert=True
         )
     
-    def get_products_by_unit(self, unit_id, search_params=None, sort_params=None, limit=None):
-        """Get products for specific unit with optional search and sort"""
+    def bulk_add_to_units(self, rows, total=None, progress=None, chunk_size=None):
+        """Insert (unit_id, product_id, quantity) rows into unit_products.
+        
+        Rows are written as unordered bulk upserts of chunk_size rows; rows that
+        already exist are left untouched, so a failed fan-out can simply be re-run.
+        progress(done, total) is called after every chunk.
+        Returns {"total", "inserted", "failed": [{"unit_id", "product_id", "error"}]}.
+        """
+        chunk_size = chunk_size or FANOUT_CHUNK_SIZE
+        report = {"total": total, "inserted": 0, "failed": []}
+        done = 0
+        rows = iter(rows)
+        
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            
+            requests = [
+                UpdateOne(
+                    {"unit_id": unit_id, "product_id": product_id},
+                    {"$setOnInsert": {
+                        "unit_id": unit_id,
+                        "product_id": product_id,
+                        "product_quantity": quantity,
+                        "product_unit_gain": 0.0
+                    }},
+                    upsert=True
+                )
+                for unit_id, product_id, quantity in chunk
+            ]
+            try:
+                result = self.unit_products_collection.bulk_write(requests, ordered=False)
+                report["inserted"] += result.upserted_count
+            except BulkWriteError as e:
+                # Unordered: everything except the reported rows was applied
+                report["inserted"] += e.details.get("nUpserted", 0)
+                for error in e.details.get("writeErrors", []):
+                    unit_id, product_id, _ = chunk[error["index"]]
+                    report["failed"].append({
+                        "unit_id": unit_id,
+                        "product_id": product_id,
+                        "error": error.get("errmsg", "")
+                    })
+            except PyMongoError as e:
+                # The outcome of the chunk is unknown; report all of it
+                report["failed"].extend(
+                    {"unit_id": unit_id, "product_id": product_id, "error": str(e)}
+                    for unit_id, product_id, _ in chunk
+                )
+            
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+        
+        if report["total"] is None:
+            report["total"] = done
+        return report
+    
+    def add_product_to_all_units(self, product_id, quantity=0, progress=None):
+        """Add one product to every unit (bulk fan-out), returns the bulk_add_to_units report"""
+        units = db_instance.db.units.find({}, {"_id": 0, "unit_id": 1})
+        rows = ((unit["unit_id"], product_id, quantity) for unit in units)
+        return self.bulk_add_to_units(rows, db_instance.db.units.count_documents({}), progress)
+    
+    def add_all_products_to_unit(self, unit_id, quantity=0, progress=None):
+        """Add every master product to one unit (bulk fan-out), returns the bulk_add_to_units report"""
+        products = self.master_collection.find({}, {"_id": 0, "product_id": 1})
+        rows = ((unit_id, product["product_id"], quantity) for product in products)
+        return self.bulk_add_to_units(rows, self.master_collection.estimated_document_count(), progress)
+    
+    def _build_unit_query(self, unit_id, search_params=None, search_limit=None):
+        """Build the unit_products query for search filters.
+        
+        Returns (query, product_ids) where product_ids is the ranked result of a
+        name search (None when no name search was requested).
+        """
         # Base query
         query = {"unit_id": unit_id}
+        product_ids = None
         
         # Add search filters if provided
         if search_params:
             if 'product_name' in search_params:
-                # Get product_ids from master that match name
-                name_regex = {"$regex": search_params['product_name'], "$options": "i"}
-                matching_products = self.master_collection.find({"product_name": name_regex})
-                product_ids = [p["product_id"] for p in matching_products]
+                # Get product_ids from master that match name (indexed search, best match first)
+                product_ids = self.search_product_ids(search_params['product_name'], search_limit)
                 query["product_id"] = {"$in": product_ids}
             
             if 'product_id' in search_params:
@@ -211,27 +449,206 @@ class ProductModel:
                     quantity_filter["$lte"] = search_params['quantity_max']
                 query["product_quantity"] = quantity_filter
         
-        # Execute query
-        cursor = self.unit_products_collection.find(query)
+        return query, product_ids
+    
+    def get_products_by_unit(self, unit_id, search_params=None, sort_params=None, limit=None, projection=None):
+        """Get products for specific unit with optional search, sort and projection"""
+        # Without other filters or sorting the search limit already gives the top rows
+        search_limit = None
+        if limit and not sort_params and search_params and len(search_params) == 1:
+            search_limit = limit
+        query, product_ids = self._build_unit_query(unit_id, search_params, search_limit)
+        
+        pipeline = [{"$match": query}]
         
-        # Add sorting if provided
+        # Sort and limit before the join when the sort key lives in unit_products,
+        # so that only the rows actually returned get enriched
+        sort_stage = None
         if sort_params:
-            cursor = cursor.sort(sort_params['field'], sort_params['order'])
+            sort_stage = {"$sort": {sort_params['field']: sort_params['order'], "product_id": 1}}
+        sort_before_join = not sort_params or sort_params['field'] in self.UNIT_PRODUCT_FIELDS
         
-        # Add limit if provided
-        if limit:
-            cursor = cursor.limit(limit)
+        if sort_before_join:
+            if sort_stage:
+                pipeline.append(sort_stage)
+            if limit:
+                pipeline.append({"$limit": limit})
         
-        unit_products = list(cursor)
+        # Enrich with master product data in the same round trip
+        pipeline.extend(self._master_lookup_stages())
         
-        # Enrich with master product data
-        for up in unit_products:
-            master_product = self.master_collection.find_one({"product_id": up["product_id"]})
-            if master_product:
-                up.update(master_product)
+        if not sort_before_join:
+            pipeline.append(sort_stage)
+            if limit:
+                pipeline.append({"$limit": limit})
+        
+        # Return only the requested fields
+        if projection:
+            if not isinstance(projection, dict):
+                projection = {field: 1 for field in projection}
+            pipeline.append({"$project": projection})
+        
+        unit_products = list(self.unit_products_collection.aggregate(pipeline))
+        
+        # Name searches without explicit sorting keep the search ranking
+        if product_ids is not None and not sort_params:
+            rank = {product_id: i for i, product_id in enumerate(product_ids)}
+            unit_products.sort(key=lambda up: rank.get(up.get("product_id"), len(rank)))
         
         return unit_products
     
+    def get_products_page(self, unit_id, search_params=None, sort_params=None,
+                          page_size=DEFAULT_PAGE_SIZE, cursor=None):
+        """Get one page of a unit's products using keyset pagination.
+        
+        Rows are ordered by the sort field with product_id as tie-breaker.
+        Returns {"items", "next_cursor", "prev_cursor"}; pass a returned cursor
+        back to get the next or previous page.
+        """
+        field = sort_params['field'] if sort_params else "product_id"
+        order = sort_params['order'] if sort_params else 1
+        direction, key = decode_cursor(cursor) if cursor else ("next", None)
+        if direction == "prev":
+            order = -order
+        
+        resume_key = None
+        if field in self.UNIT_PRODUCT_FIELDS:
+            rows = self._unit_keyset_rows(unit_id, search_params, field, order, key, page_size + 1)
+        else:
+            rows, resume_key = self._master_keyset_rows(unit_id, search_params, field, order, key, page_size + 1)
+        
+        return build_page(rows, field, order, page_size, direction, key is not None, resume_key)
+    
+    def _unit_keyset_rows(self, unit_id, search_params, field, order, key, limit):
+        """Page rows ordered by a unit_products field: seek, sort and limit before the join"""
+        query, _ = self._build_unit_query(unit_id, search_params)
+        if key is not None:
+            query = {"$and": [query, keyset_filter(field, order, key)]}
+        pipeline = [
+            {"$match": query},
+            {"$sort": {field: order, "product_id": order}},
+            {"$limit": limit}
+        ]
+        pipeline.extend(self._master_lookup_stages())
+        return list(self.unit_products_collection.aggregate(pipeline))
+    
+    def _master_keyset_rows(self, unit_id, search_params, field, order, key, limit):
+        """Page rows ordered by a master field: walk products_master in index order
+        and fetch the matching unit rows in batches with one $in query each.
+        
+        At most KEYSET_MAX_BATCHES batches are scanned. Returns (rows, resume_key):
+        resume_key is the key of the last scanned product if the scan stopped
+        before finding limit rows and before the end of the catalog, else None.
+        """
+        unit_query, product_ids = self._build_unit_query(unit_id, search_params)
+        master_query = {}
+        if product_ids is not None:
+            master_query["product_id"] = {"$in": product_ids}
+        if search_params and 'product_id' in search_params:
+            master_query["product_id"] = search_params['product_id']
+        if key is not None:
+            master_query = {"$and": [master_query, keyset_filter(field, order, key)]}
+        
+        master_cursor = self.master_collection.find(
+            master_query, {"product_name_ngrams": 0}
+        ).sort([(field, order), ("product_id", order)]).limit(limit * KEYSET_MAX_BATCHES).batch_size(limit)
+        
+        rows = []
+        resume_key = None
+        for batches in itertools.count(1):
+            batch = [product for _, product in zip(range(limit), master_cursor)]
+            if not batch:
+                break
+            unit_rows = {
+                up["product_id"]: up
+                for up in self.unit_products_collection.find(dict(
+                    unit_query, product_id={"$in": [p["product_id"] for p in batch]}
+                ))
+            }
+            for product in batch:
+                unit_row = unit_rows.get(product["product_id"])
+                if unit_row is not None:
+                    unit_row.update(product)
+                    rows.append(unit_row)
+                    if len(rows) >= limit:
+                        break
+            if len(rows) >= limit:
+                break
+            if batches >= KEYSET_MAX_BATCHES and len(batch) == limit:
+                resume_key = [batch[-1].get(field), batch[-1]["product_id"]]
+                break
+        master_cursor.close()
+        return rows, resume_key
+    
+    def get_master_products_page(self, page_size=DEFAULT_PAGE_SIZE, cursor=None):
+        """Get one page of the master catalog ordered by product_id, with total
+        quantity across all units (one aggregation for the whole page)"""
+        direction, key = decode_cursor(cursor) if cursor else ("next", None)
+        order = -1 if direction == "prev" else 1
+        query = keyset_filter("product_id", order, key) if key is not None else {}
+        products = list(self.master_collection.find(query, {"product_name_ngrams": 0})
+                        .sort("product_id", order).limit(page_size + 1))
+        
+        page = build_page(products, "product_id", order, page_size, direction, key is not None)
+        totals = {
+            row["_id"]: row["total_quantity"]
+            for row in self.unit_products_collection.aggregate([
+                {"$match": {"product_id": {"$in": [p["product_id"] for p in page["items"]]}}},
+                {"$group": {"_id": "$product_id", "total_quantity": {"$sum": "$product_quantity"}}}
+            ])
+        }
+        for product in page["items"]:
+            product["total_quantity"] = totals.get(product["product_id"], 0)
+        return page
+    
+    def search_product_ids(self, term, limit=None):
+        """Find product_ids whose name contains term (accent/case-insensitive), best match first"""
+        pipeline = build_search_pipeline(term, limit)
+        if pipeline is None:
+            return []
+        pipeline.append({"$project": {"_id": 0, "product_id": 1}})
+        return [p["product_id"] for p in self.master_collection.aggregate(pipeline)]
+    
+    def reindex_search_fields(self, batch_size=1000, missing_only=False):
+        """Recompute the search fields of every master product (only of those
+        without them if missing_only). Returns the number updated."""
+        query = {"$or": [
+            {"product_name_normalized": {"$exists": False}},
+            {"product_name_ngrams": {"$exists": False}}
+        ]} if missing_only else {}
+        updated = 0
+        batch = []
+        for product in self.master_collection.find(query, {"product_id": 1, "product_name": 1}):
+            batch.append(UpdateOne(
+                {"_id": product["_id"]},
+                {"$set": search_fields(product.get("product_name", ""))}
+            ))
+            if len(batch) >= batch_size:
+                updated += self.master_collection.bulk_write(batch, ordered=False).matched_count
+                batch = []
+        if batch:
+            updated += self.master_collection.bulk_write(batch, ordered=False).matched_count
+        if updated:
+            catalog_cache.clear()
+            autocomplete_index.invalidate()
+        return updated
+    
+    def _master_lookup_stages(self):
+        """Aggregation stages that merge master product data into unit_products rows"""
+        return [
+            {"$lookup": {
+                "from": self.master_collection.name,
+                "localField": "product_id",
+                "foreignField": "product_id",
+                "as": "master_product"
+            }},
+            # Master fields override unit fields, same as dict.update() on the row
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+                "$$ROOT", {"$arrayElemAt": ["$master_product", 0]}
+            ]}}},
+            {"$project": {"master_product": 0, "product_name_ngrams": 0}}
+        ]
+    
     def get_product_details(self, unit_id, product_id):
         """Get complete product details for specific unit"""
         unit_product = self.unit_products_collection.find_one({
@@ -240,90 +657,614 @@ class ProductModel:
         })
         
         if unit_product:
-            master_product = self.master_collection.find_one({"product_id": product_id})
+            master_product = self.get_master_product(product_id)
             if master_product:
                 unit_product.update(master_product)
         
         return unit_product
     
-    def update_product_quantity(self, unit_id, product_id, quantity_change, transaction_type):
-        """Update product quantity and gain"""
-        unit_product = self.unit_products_collection.find_one({
-            "unit_id": unit_id,
-            "product_id": product_id
-        })
-        
-        if not unit_product:
-            return False
+    def update_product_quantity(self, unit_id, product_id, quantity_change, transaction_type, session=None,
+                                master_product=None):
+        """Update product quantity and gain in a single atomic write.
         
-        master_product = self.master_collection.find_one({"product_id": product_id})
+        master_product is read from the database unless the caller already did.
+        Returns the updated unit product, or None if the product doesn't exist
+        in the unit or there is not enough stock for a sale.
+        """
+        master_product = master_product or self.get_master_product(product_id, cached=False)
         if not master_product:
-            return False
+            return None
         
-        # Calculate new values
-        new_quantity = unit_product["product_quantity"]
-        new_gain = unit_product["product_unit_gain"]
+        change = self._stock_change(master_product, unit_id, quantity_change, transaction_type)
+        if change is None:
+            return None
+        query, update, summary_deltas = change
+        
+        unit_product = self.unit_products_collection.find_one_and_update(
+            query, update,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if unit_product:
+            unit_summary_model.apply_delta(unit_id, summary_deltas, session=session)
+            autocomplete_index.set_quantity(unit_id, product_id, unit_product["product_quantity"])
+        return unit_product
+    
+    @staticmethod
+    def _stock_change(master_product, unit_id, quantity_change, transaction_type):
+        """Query, update and unit summary deltas of one sale or purchase line
+        (None for an unknown transaction type)"""
+        query = {"unit_id": unit_id, "product_id": master_product["product_id"]}
         
         if transaction_type == "sale":
-            if new_quantity >= quantity_change:
-                new_quantity -= quantity_change
-                # Κέρδος = (Τιμή Πώλησης - Τιμή Αγοράς) * Ποσότητα
-                profit_per_unit = master_product["product_selling_price"] - master_product["product_purchase_price"]
-                new_gain += quantity_change * profit_per_unit
-            else:
-                return False  # Not enough stock
+            # Ο έλεγχος αποθέματος γίνεται στο ίδιο το query, ώστε ταυτόχρονες
+            # πωλήσεις να μην οδηγούν σε αρνητικό απόθεμα ή χαμένες ενημερώσεις
+            query["product_quantity"] = {"$gte": quantity_change}
+            # Κέρδος = (Τιμή Πώλησης - Τιμή Αγοράς) * Ποσότητα
+            profit_per_unit = master_product["product_selling_price"] - master_product["product_purchase_price"]
+            gain = quantity_change * profit_per_unit
+            update = {"$inc": {
+                "product_quantity": -quantity_change,
+                "product_unit_gain": gain
+            }}
+            summary_deltas = stock_deltas(master_product, -quantity_change)
+            summary_deltas["realized_gain"] = gain
         
         elif transaction_type == "purchase":
-            new_quantity += quantity_change
             # Δεν αλλάζουμε το gain στην αγορά - το κέρδος υπολογίζεται μόνο στην πώληση
+            update = {"$inc": {"product_quantity": quantity_change}}
+            summary_deltas = stock_deltas(master_product, quantity_change)
         
-        # Update database
-        return self.unit_products_collection.update_one(
-            {"unit_id": unit_id, "product_id": product_id},
-            {"$set": {
-                "product_quantity": new_quantity,
-                "product_unit_gain": new_gain
-            }}
+        else:
+            return None
+        
+        return query, update, summary_deltas
+    
+    def process_transaction(self, unit_id, product_id, transaction_type, quantity, performed_by, notes=""):
+        """Apply a sale or purchase to stock and record it in the transactions log.
+        
+        When MongoDB transactions are enabled both writes commit together in
+        one session. Returns the transaction id, or None if the stock update
+        was rejected.
+        """
+        master_product = self.get_master_product(product_id, cached=False)
+        if not master_product:
+            return None
+        
+        if transaction_type == "sale":
+            unit_price = master_product["product_selling_price"]
+        else:
+            unit_price = master_product["product_purchase_price"]
+        transaction = transaction_model.build_transaction(
+            unit_id, product_id, transaction_type, quantity, unit_price, performed_by, notes
         )
+        
+        def apply(session=None):
+            if not self.update_product_quantity(unit_id, product_id, quantity, transaction_type, session=session,
+                                                master_product=master_product):
+                return None
+            return transaction_model.record_transactions([transaction], session=session)[0]
+        
+        if not db_instance.use_transactions:
+            return apply()
+        
+        with db_instance.client.start_session() as session:
+            transaction_id = session.with_transaction(apply)
+        if transaction_id:
+            transaction_model.insert_deferred_ledger([transaction])
+        return transaction_id
     
-    def calculate_unit_financial_summary(self, unit_id):
-        """Calculate detailed financial summary for a unit"""
-        unit_products = self.get_products_by_unit(unit_id)
+    @staticmethod
+    def parse_order_lines(raw_lines):
+        """Order lines from a JSON payload ([{"product_id", "quantity"}, ...])
+        as (product_id, quantity) pairs. Raises ValueError if malformed."""
+        if not isinstance(raw_lines, list) or not raw_lines:
+            raise ValueError("lines must be a non-empty list")
+        if len(raw_lines) > MAX_ORDER_LINES:
+            raise ValueError(f"at most {MAX_ORDER_LINES} lines per order")
+        lines = []
+        for raw_line in raw_lines:
+            if not isinstance(raw_line, dict) or not raw_line.get("product_id"):
+                raise ValueError("every line needs a product_id")
+            quantity = raw_line.get("quantity")
+            try:
+                if isinstance(quantity, bool) or not isinstance(quantity, (int, str)):
+                    raise ValueError
+                quantity = int(quantity)
+                if quantity <= 0:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"invalid quantity for {raw_line['product_id']}")
+            lines.append((str(raw_line["product_id"]), quantity))
+        return lines
+    
+    def process_order(self, unit_id, lines, transaction_type, performed_by, notes=""):
+        """Apply a multi-line sale or purchase (basket) to one unit.
         
-        total_gain = 0.0
-        total_investment = 0.0  # Κόστος αποθέματος
-        total_potential_revenue = 0.0  # Πιθανά έσοδα αν πουληθεί όλο το απόθεμα
+        lines is a list of (product_id, quantity); repeated products are merged.
+        Either every line is applied and recorded or none is: with MongoDB
+        transactions the stock changes go in one bulk_write inside the session,
+        otherwise applied lines are rolled back if a later line is rejected.
+        Returns {"transaction_ids": [...], "errors": [...]}; errors are
+        {"product_id", "error"[, "available"]} and mean nothing was written.
+        """
+        if transaction_type not in ("sale", "purchase"):
+            raise ValueError(f"unknown transaction type {transaction_type!r}")
         
-        for product in unit_products:
-            # Συνολικό κέρδος από πωλήσεις
-            total_gain += product.get("product_unit_gain", 0.0)
-            
-            # Κόστος τρέχοντος αποθέματος
-            current_stock_cost = product["product_quantity"] * product["product_purchase_price"]
-            total_investment += current_stock_cost
+        # Merge repeated products, keeping the order of first appearance
+        quantities = {}
+        for product_id, quantity in lines:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        
+        errors = []
+        masters = {}
+        for product_id, quantity in quantities.items():
+            master_product = self.get_master_product(product_id, cached=False)
+            if not master_product:
+                errors.append({"product_id": product_id, "error": "unknown_product"})
+            elif quantity <= 0:
+                errors.append({"product_id": product_id, "error": "invalid_quantity"})
+            else:
+                masters[product_id] = master_product
+        if errors:
+            return {"transaction_ids": [], "errors": errors}
+        
+        # Check stock up front with one query; the conditional writes below
+        # still guard against concurrent changes
+        stock = self._unit_stock(unit_id, quantities)
+        errors = self._order_stock_errors(quantities, stock, transaction_type)
+        if errors:
+            return {"transaction_ids": [], "errors": errors}
+        
+        timestamp = datetime.utcnow()
+        changes = []
+        transactions = []
+        summary_deltas = {}
+        for product_id, quantity in quantities.items():
+            master_product = masters[product_id]
+            query, update, deltas = self._stock_change(master_product, unit_id, quantity, transaction_type)
+            changes.append((query, update))
+            for field, value in deltas.items():
+                summary_deltas[field] = summary_deltas.get(field, 0) + value
             
-            # Πιθανά έσοδα από τρέχον απόθεμα
-            potential_revenue = product["product_quantity"] * product["product_selling_price"]
-            total_potential_revenue += potential_revenue
+            if transaction_type == "sale":
+                unit_price = master_product["product_selling_price"]
+            else:
+                unit_price = master_product["product_purchase_price"]
+            transactions.append(transaction_model.build_transaction(
+                unit_id, product_id, transaction_type, quantity, unit_price,
+                performed_by, notes, timestamp
+            ))
+        
+        try:
+            if db_instance.use_transactions:
+                with db_instance.client.start_session() as session:
+                    transaction_ids = session.with_transaction(
+                        lambda s: self._apply_order(unit_id, changes, transactions, summary_deltas, s)
+                    )
+                transaction_model.insert_deferred_ledger(transactions)
+            else:
+                self._apply_stock_changes_with_rollback(changes)
+                transaction_ids = self._record_order(unit_id, transactions, summary_deltas)
+        except OrderRejected:
+            # Stock changed since the check above; report it from fresh values
+            stock = self._unit_stock(unit_id, quantities)
+            return {"transaction_ids": [], "errors": self._order_stock_errors(quantities, stock, transaction_type)}
+        
+        sign = -1 if transaction_type == "sale" else 1
+        for product_id, quantity in quantities.items():
+            autocomplete_index.set_quantity(unit_id, product_id, stock[product_id] + sign * quantity)
+        return {"transaction_ids": transaction_ids, "errors": []}
+    
+    def _unit_stock(self, unit_id, product_ids):
+        """Current quantities of some products in a unit ({product_id: quantity})"""
+        return {
+            up["product_id"]: up.get("product_quantity", 0)
+            for up in self.unit_products_collection.find(
+                {"unit_id": unit_id, "product_id": {"$in": list(product_ids)}},
+                {"_id": 0, "product_id": 1, "product_quantity": 1}
+            )
+        }
+    
+    @staticmethod
+    def _order_stock_errors(quantities, stock, transaction_type):
+        errors = []
+        for product_id, quantity in quantities.items():
+            if product_id not in stock:
+                errors.append({"product_id": product_id, "error": "not_in_unit"})
+            elif transaction_type == "sale" and stock[product_id] < quantity:
+                errors.append({"product_id": product_id, "error": "insufficient_stock",
+                               "available": stock[product_id]})
+        return errors
+    
+    def _apply_order(self, unit_id, changes, transactions, summary_deltas, session):
+        """All stock changes in one ordered bulk_write, then the records (inside a transaction)"""
+        result = self.unit_products_collection.bulk_write(
+            [UpdateOne(query, update) for query, update in changes],
+            ordered=True, session=session
+        )
+        if result.matched_count != len(changes):
+            # Aborts the transaction
+            raise OrderRejected()
+        return self._record_order(unit_id, transactions, summary_deltas, session)
+    
+    def _apply_stock_changes_with_rollback(self, changes):
+        """Apply stock changes without a transaction in one ordered bulk_write,
+        undoing the applied ones if a line is rejected.
+        
+        Each change is an upsert: a sale whose stock check fails then collides
+        with the unique (unit_id, product_id) index, which stops the ordered
+        batch at that line. A row that was deleted meanwhile gets upserted and
+        is removed again.
+        """
+        failed_at = len(changes)
+        try:
+            result = self.unit_products_collection.bulk_write(
+                [UpdateOne(query, update, upsert=True) for query, update in changes],
+                ordered=True
+            )
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            error = e.details["writeErrors"][0]
+            if error.get("code") != 11000:
+                raise
+            failed_at = error["index"]
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
         
-        # Πιθανό κέρδος από τρέχον απόθεμα
-        potential_profit_from_stock = total_potential_revenue - total_investment
+        if failed_at == len(changes) and not upserted:
+            return
         
+        if upserted:
+            self.unit_products_collection.delete_many({"_id": {"$in": list(upserted.values())}})
+        undo = [
+            UpdateOne(
+                {"unit_id": query["unit_id"], "product_id": query["product_id"]},
+                {"$inc": {field: -value for field, value in update["$inc"].items()}}
+            )
+            for index, (query, update) in enumerate(changes[:failed_at])
+            if index not in upserted
+        ]
+        if undo:
+            self.unit_products_collection.bulk_write(undo, ordered=False)
+        raise OrderRejected()
+    
+    def _record_order(self, unit_id, transactions, summary_deltas, session=None):
+        transaction_ids = transaction_model.record_transactions(transactions, session=session)
+        unit_summary_model.apply_delta(unit_id, summary_deltas, session=session)
+        return transaction_ids
+    
+    def calculate_unit_financial_summary(self, unit_id):
+        """Get detailed financial summary for a unit (from its unit_summaries document)"""
+        return build_financial_summary(unit_summary_model.get_summary(unit_id))
+    
+    def calculate_all_financial_summaries(self, units=None):
+        """Get financial summaries keyed by unit_id (of the given units, or all units)
+        with a single query, plus one aggregation for units without a summary"""
+        unit_ids = [unit["unit_id"] for unit in units] if units is not None else None
+        return {
+            unit_id: build_financial_summary(summary)
+            for unit_id, summary in unit_summary_model.get_all_summaries(unit_ids).items()
+        }
+    
+    def aggregate_unit_totals(self, unit_ids=None):
+        """Compute financial and volume totals per unit from unit_products (full scan if unit_ids is None)"""
+        pipeline = []
+        if unit_ids is not None:
+            pipeline.append({"$match": {"unit_id": {"$in": list(unit_ids)}}})
+        pipeline.extend(self._master_lookup_stages())
+        pipeline.append({"$group": {
+            "_id": "$unit_id",
+            "realized_gain": {"$sum": {"$ifNull": ["$product_unit_gain", 0]}},
+            "stock_cost": {"$sum": {"$multiply": [
+                "$product_quantity", {"$ifNull": ["$product_purchase_price", 0]}]}},
+            "potential_revenue": {"$sum": {"$multiply": [
+                "$product_quantity", {"$ifNull": ["$product_selling_price", 0]}]}},
+            "volume_used": {"$sum": {"$multiply": [
+                "$product_quantity", {"$ifNull": ["$product_volume", 0]}]}}
+        }})
+        return {row.pop("_id"): row for row in self.unit_products_collection.aggregate(pipeline)}
+
+    def aggregate_category_stock(self):
+        """Total stock per product category across all units ({category: quantity})"""
+        pipeline = [
+            # Collapse to one row per product before joining the master catalog
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$product_quantity"}}},
+            {"$lookup": {
+                "from": self.master_collection.name,
+                "localField": "_id",
+                "foreignField": "product_id",
+                "as": "master_product"
+            }},
+            {"$group": {
+                "_id": {"$ifNull": [{"$arrayElemAt": ["$master_product.product_category", 0]}, "Άλλα"]},
+                "quantity": {"$sum": "$quantity"}
+            }},
+            {"$sort": {"_id": 1}}
+        ]
+        return {row["_id"]: row["quantity"] for row in self.unit_products_collection.aggregate(pipeline)}
+
+def build_financial_summary(summary):
+    """Build the detailed financial summary of a unit from its unit_summaries document"""
+    total_gain = summary["realized_gain"]
+    total_investment = summary["stock_cost"]  # Κόστος αποθέματος
+    total_potential_revenue = summary["potential_revenue"]  # Πιθανά έσοδα αν πουληθεί όλο το απόθεμα
+    
+    # Πιθανό κέρδος από τρέχον απόθεμα
+    potential_profit_from_stock = total_potential_revenue - total_investment
+    
+    return {
+        "total_realized_gain": total_gain,  # Πραγματοποιηθέν κέρδος από πωλήσεις
+        "total_investment": total_investment,  # Κόστος τρέχοντος αποθέματος
+        "total_potential_revenue": total_potential_revenue,  # Πιθανά έσοδα
+        "potential_profit_from_stock": potential_profit_from_stock,  # Πιθανό κέρδος από απόθεμα
+        "total_potential_gain": total_gain + potential_profit_from_stock,  # Συνολικό πιθανό κέρδος
+        "total_volume_used": summary["volume_used"]  # Όγκος που καταλαμβάνει το απόθεμα
+    }
+
+def stock_deltas(master_product, quantity):
+    """Unit summary changes caused by adding (or, if negative, removing) stock of a product"""
+    return {
+        "stock_cost": quantity * master_product.get("product_purchase_price", 0),
+        "potential_revenue": quantity * master_product.get("product_selling_price", 0),
+        "volume_used": quantity * master_product.get("product_volume", 0)
+    }
+
+class UnitSummaryModel:
+    """Materialized per-unit totals, kept current with $inc deltas on every stock change"""
+    FIELDS = ("realized_gain", "stock_cost", "potential_revenue", "volume_used")
+    
+    @property
+    def collection(self):
+        return db_instance.db.unit_summaries
+    
+    def _inc(self, deltas):
+        """Build the update for a set of deltas"""
         return {
-            "total_realized_gain": total_gain,  # Πραγματοποιηθέν κέρδος από πωλήσεις
-            "total_investment": total_investment,  # Κόστος τρέχοντος αποθέματος
-            "total_potential_revenue": total_potential_revenue,  # Πιθανά έσοδα
-            "potential_profit_from_stock": potential_profit_from_stock,  # Πιθανό κέρδος από απόθεμα
-            "total_potential_gain": total_gain + potential_profit_from_stock  # Συνολικό πιθανό κέρδος
+            "$inc": {field: deltas.get(field, 0.0) for field in self.FIELDS},
+            "$set": {"updated_at": datetime.utcnow()}
         }
+    
+    def apply_delta(self, unit_id, deltas, session=None):
+        """Apply deltas to one unit summary.
+        
+        Missing summaries are not created here; create_missing builds them in
+        full from unit_products, which already includes the change.
+        """
+        return self.collection.update_one({"unit_id": unit_id}, self._inc(deltas), session=session)
+    
+    def apply_deltas(self, unit_deltas):
+        """Apply per-unit deltas ({unit_id: deltas}) in one bulk write"""
+        if not unit_deltas:
+            return None
+        return self.collection.bulk_write([
+            UpdateOne({"unit_id": unit_id}, self._inc(deltas))
+            for unit_id, deltas in unit_deltas.items()
+        ], ordered=False)
+    
+    def apply_delta_all(self, deltas):
+        """Apply the same deltas to every unit summary"""
+        return self.collection.update_many({}, self._inc(deltas))
+    
+    def create_summary(self, unit_id):
+        """Create an empty summary for a new unit"""
+        summary = {field: 0.0 for field in self.FIELDS}
+        summary["updated_at"] = datetime.utcnow()
+        return self.collection.update_one({"unit_id": unit_id}, {"$setOnInsert": summary}, upsert=True)
+    
+    def get_summary(self, unit_id):
+        """Get unit summary, creating it from unit_products if it doesn't exist yet"""
+        summary = self.collection.find_one({"unit_id": unit_id})
+        if summary is None:
+            summary = self.create_missing([unit_id]).get(unit_id)
+        return summary
+    
+    def create_missing(self, unit_ids=None):
+        """Compute and store the summaries of units that have none (all units
+        if unit_ids is None), with one aggregation. Returns them keyed by unit_id.
+        
+        Summaries are inserted with $setOnInsert, so one created meanwhile by
+        another process is kept as is.
+        """
+        if unit_ids is None:
+            unit_ids = [u["unit_id"] for u in db_instance.db.units.find({}, {"unit_id": 1})]
+        existing = {s["unit_id"] for s in self.collection.find({"unit_id": {"$in": list(unit_ids)}}, {"unit_id": 1})}
+        missing = [unit_id for unit_id in unit_ids if unit_id not in existing]
+        if not missing:
+            return {}
+        
+        summaries = self.compute(missing)
+        self.collection.bulk_write([
+            UpdateOne({"unit_id": unit_id}, {"$setOnInsert": summary}, upsert=True)
+            for unit_id, summary in summaries.items()
+        ], ordered=False)
+        return {summary["unit_id"]: summary for summary in self.collection.find({"unit_id": {"$in": missing}})}
+    
+    def get_all_summaries(self, unit_ids=None):
+        """Get summaries keyed by unit_id (all units if unit_ids is None), creating any that are missing"""
+        if unit_ids is None:
+            unit_ids = [u["unit_id"] for u in db_instance.db.units.find({}, {"unit_id": 1})]
+        summaries = {summary["unit_id"]: summary
+                     for summary in self.collection.find({"unit_id": {"$in": list(unit_ids)}})}
+        missing = [unit_id for unit_id in unit_ids if unit_id not in summaries]
+        if missing:
+            summaries.update(self.create_missing(missing))
+        return summaries
+    
+    def delete_summary(self, unit_id):
+        """Delete unit summary"""
+        return self.collection.delete_one({"unit_id": unit_id})
+    
+    def compute(self, unit_ids=None):
+        """Summaries computed from unit_products (all units if unit_ids is None), without storing them"""
+        totals = product_model.aggregate_unit_totals(unit_ids)
+        if unit_ids is None:
+            unit_ids = [u["unit_id"] for u in db_instance.db.units.find({}, {"unit_id": 1})]
+        
+        summaries = {}
+        for uid in unit_ids:
+            summary = {field: float(totals.get(uid, {}).get(field, 0.0)) for field in self.FIELDS}
+            summary["unit_id"] = uid
+            summary["updated_at"] = datetime.utcnow()
+            summaries[uid] = summary
+        return summaries
+    
+    def rebuild(self, unit_id=None):
+        """Recompute and store summaries (all units if unit_id is None) to repair drift.
+        
+        The stored summary replaces the incremental one, so a stock change
+        landing between the aggregation and the write is lost: this runs from
+        `flask rebuild-unit-summaries` only, when no sales are being made.
+        """
+        summaries = self.compute([unit_id] if unit_id else None)
+        requests = [ReplaceOne({"unit_id": uid}, summary, upsert=True) for uid, summary in summaries.items()]
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+        return summaries
+
+def top_seller_stages(limit):
+    """Pipeline stages from per-seller totals ({_id: {performed_by, unit_id}, total_sales, ...})
+    to the top employees, selling in their own unit, with their names"""
+    return [
+        {"$match": {"total_sales": {"$gt": 0}}},
+        {"$sort": {"total_sales": -1}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "_id.performed_by",
+            "foreignField": "username",
+            "as": "user"
+        }},
+        {"$unwind": "$user"},
+        {"$match": {
+            "user.role": "employee",
+            "$expr": {"$eq": ["$user.unit_id", "$_id.unit_id"]}
+        }},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "username": "$_id.performed_by",
+            "unit_id": "$_id.unit_id",
+            "name": "$user.name",
+            "surname": "$user.surname",
+            "total_sales": 1,
+            "total_quantity": 1,
+            "transactions_count": 1
+        }}
+    ]
 
 class TransactionModel:
+    """Transactions ledger.
+    
+    With TRANSACTIONS_STORAGE=timeseries the ledger lives in the time-series
+    collection transactions_ts: timestamp is the timeField and unit_id,
+    product_id and transaction_type are stored in the "meta" subdocument.
+    Readers should go through this model, which maps queries and flattens the
+    returned documents, so both layouts look the same to callers.
+    """
+    # Fields stored in the metaField of the time-series collection
+    META_FIELDS = ("unit_id", "product_id", "transaction_type")
+    
+    # Sales totals of each employee in each unit
+    SELLER_TOTALS = {"$group": {
+        "_id": {"performed_by": "$performed_by", "unit_id": "$unit_id"},
+        "total_sales": {"$sum": "$total_amount"},
+        "total_quantity": {"$sum": "$quantity"},
+        "transactions_count": {"$sum": 1}
+    }}
+    
     def __init__(self):
-        self.collection = db_instance.db.transactions
+        self.timeseries = db_instance.transactions_storage == "timeseries"
     
-    def record_transaction(self, unit_id, product_id, transaction_type, quantity, unit_price, performed_by, notes=""):
-        """Record a transaction"""
-        transaction_data = {
+    @property
+    def collection(self):
+        return db_instance.db.transactions_ts if self.timeseries else db_instance.db.transactions
+    
+    @property
+    def archived_sales_collection(self):
+        return db_instance.db.archived_seller_sales
+    
+    @classmethod
+    def timeseries_document(cls, transaction):
+        """Copy of a transaction document in the time-series layout"""
+        document = {field: value for field, value in transaction.items() if field not in cls.META_FIELDS}
+        document["meta"] = {field: transaction.get(field) for field in cls.META_FIELDS}
+        return document
+    
+    def to_storage(self, transaction):
+        return self.timeseries_document(transaction) if self.timeseries else transaction
+    
+    @staticmethod
+    def from_storage(document):
+        """Transaction document in the flat layout"""
+        meta = document.pop("meta", None)
+        if meta:
+            document.update(meta)
+        return document
+    
+    def storage_query(self, query):
+        """Map a query on flat transaction fields to the storage layout"""
+        if not self.timeseries:
+            return query
+        mapped = {}
+        for field, condition in query.items():
+            if field in ("$and", "$or", "$nor"):
+                mapped[field] = [self.storage_query(q) for q in condition]
+            elif field in self.META_FIELDS:
+                mapped["meta." + field] = condition
+            else:
+                mapped[field] = condition
+        return mapped
+    
+    def iter_transactions(self, query=None, sort_direction=-1, limit=None, batch_size=None):
+        """Yield transactions matching query, ordered by timestamp"""
+        cursor = self.collection.find(self.storage_query(query or {})).sort("timestamp", sort_direction)
+        if limit:
+            cursor = cursor.limit(limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        try:
+            for document in cursor:
+                yield self.from_storage(document)
+        finally:
+            cursor.close()
+    
+    def aggregate(self, pipeline, **kwargs):
+        """Run an aggregation over transactions written against the flat layout.
+        
+        A leading $match is mapped to the storage layout (so it can use the
+        indexes) and the meta fields are flattened before the other stages.
+        """
+        if self.timeseries:
+            stages = list(pipeline)
+            head = []
+            if stages and "$match" in stages[0]:
+                head.append({"$match": self.storage_query(stages.pop(0)["$match"])})
+            head.append({"$addFields": {field: f"$meta.{field}" for field in self.META_FIELDS}})
+            pipeline = head + stages
+        return self.collection.aggregate(pipeline, **kwargs)
+    
+    def delete_transactions(self, unit_id=None, product_id=None):
+        """Delete the transactions of a unit and/or product"""
+        query = {}
+        if unit_id:
+            query["unit_id"] = unit_id
+        if product_id:
+            query["product_id"] = product_id
+        return self.collection.delete_many(self.storage_query(query))
+    
+    def archived_before(self):
+        """Start of the oldest day still in the hot collection after archival (None if never archived)"""
+        state = db_instance.db.counters.find_one({"_id": "transactions_archive"})
+        return state["archived_before"] if state else None
+    
+    def set_archived_before(self, day):
+        db_instance.db.counters.update_one(
+            {"_id": "transactions_archive"}, {"$max": {"archived_before": day}}, upsert=True
+        )
+    
+    @staticmethod
+    def build_transaction(unit_id, product_id, transaction_type, quantity, unit_price, performed_by, notes="", timestamp=None):
+        """Build a transaction document"""
+        return {
             "unit_id": unit_id,
             "product_id": product_id,
             "transaction_type": transaction_type,
@@ -331,21 +1272,302 @@ class TransactionModel:
             "unit_price": unit_price,
             "total_amount": quantity * unit_price,
             "performed_by": performed_by,
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp or datetime.utcnow(),
             "notes": notes
         }
+    
+    def record_transaction(self, unit_id, product_id, transaction_type, quantity, unit_price, performed_by, notes="", session=None):
+        """Record a transaction"""
+        transaction_data = self.build_transaction(
+            unit_id, product_id, transaction_type, quantity, unit_price, performed_by, notes
+        )
+        return self.record_transactions([transaction_data], session=session)[0]
+    
+    def record_transactions(self, transactions, session=None):
+        """Record many transaction documents with one insert. Returns their ids.
         
-        result = self.collection.insert_one(transaction_data)
-        return str(result.inserted_id)
+        Time-series collections can't be written inside multi-document
+        transactions: with a session and the time-series ledger only the
+        rollups are written here, and the caller passes the same documents to
+        insert_deferred_ledger() once the transaction has committed. The ids
+        are assigned up front, so a retried transaction keeps them.
+        """
+        for transaction in transactions:
+            transaction.setdefault("_id", ObjectId())
+        if session is None or not self.timeseries:
+            self.collection.insert_many([self.to_storage(transaction) for transaction in transactions],
+                                        session=session)
+        sales_rollup_model.record_many(transactions, session=session)
+        return [str(transaction["_id"]) for transaction in transactions]
+    
+    def insert_deferred_ledger(self, transactions):
+        """Insert the time-series ledger rows of a committed MongoDB transaction"""
+        if self.timeseries:
+            self.collection.insert_many([self.to_storage(transaction) for transaction in transactions])
+    
+    def store_archived_seller_sales(self, day, totals):
+        """Keep the seller totals ({(performed_by, unit_id): totals}) of an archived
+        day, before its transactions leave the collection (replaces earlier ones)"""
+        requests = [
+            ReplaceOne(
+                {"day": day, "performed_by": performed_by, "unit_id": unit_id},
+                dict(fields, day=day, performed_by=performed_by, unit_id=unit_id),
+                upsert=True
+            )
+            for (performed_by, unit_id), fields in totals.items()
+        ]
+        if requests:
+            self.archived_sales_collection.bulk_write(requests, ordered=False)
+    
+    def seller_totals_stages(self, match=None):
+        """Stages grouping the sales matching a query per (performed_by, unit_id),
+        archived sales included (same output as SELLER_TOTALS)"""
+        match = match or {}
+        return [
+            {"$match": dict(match, transaction_type="sale")},
+            self.SELLER_TOTALS,
+            {"$unionWith": {"coll": "archived_seller_sales", "pipeline": [
+                {"$match": match},
+                {"$project": {
+                    "_id": {"performed_by": "$performed_by", "unit_id": "$unit_id"},
+                    "total_sales": 1,
+                    "total_quantity": 1,
+                    "transactions_count": 1
+                }}
+            ]}},
+            {"$group": {
+                "_id": "$_id",
+                "total_sales": {"$sum": "$total_sales"},
+                "total_quantity": {"$sum": "$total_quantity"},
+                "transactions_count": {"$sum": "$transactions_count"}
+            }}
+        ]
+    
+    def get_top_sellers(self, limit=10):
+        """Top employees by sales amount, aggregated on the server.
+        
+        Only sales made by an employee in their own unit are counted.
+        """
+        return list(self.aggregate(self.seller_totals_stages() + top_seller_stages(limit)))
     
     def get_transactions_by_unit(self, unit_id, limit=100):
         """Get recent transactions for unit"""
-        return list(self.collection.find({"unit_id": unit_id})
-                   .sort("timestamp", -1)
-                   .limit(limit))
+        return list(self.iter_transactions({"unit_id": unit_id}, limit=limit))
+    
+    def get_transactions_by_product(self, product_id, unit_id=None, limit=20):
+        """Get recent transactions for a product (in one unit or all units)"""
+        query = {"product_id": product_id}
+        if unit_id:
+            query["unit_id"] = unit_id
+        return list(self.iter_transactions(query, limit=limit))
+    
+    def migrate_to_timeseries(self, batch_size=1000, progress=None):
+        """Copy the plain transactions collection into transactions_ts in batches.
+        
+        Progress is saved after every batch, so an interrupted or repeated run
+        continues after the last copied transaction. Returns the number copied.
+        """
+        db_instance.create_transactions_timeseries()
+        source = db_instance.db.transactions
+        target = db_instance.db.transactions_ts
+        counters = db_instance.db.counters
+        
+        state = counters.find_one({"_id": "transactions_ts_migration"}) or {}
+        query = {"_id": {"$gt": state["last_id"]}} if state.get("last_id") else {}
+        total = source.count_documents(query)
+        copied = 0
+        # The run that saved the progress may have stopped right after an insert,
+        # so the first batch of a resumed run skips transactions already copied
+        check_existing = bool(state.get("last_id"))
+        
+        def flush(batch):
+            nonlocal copied, check_existing
+            last_id = batch[-1]["_id"]
+            if check_existing:
+                ids = [document["_id"] for document in batch]
+                existing = {d["_id"] for d in target.find({"_id": {"$in": ids}}, {"_id": 1})}
+                batch = [document for document in batch if document["_id"] not in existing]
+                check_existing = False
+            if batch:
+                target.insert_many(batch, ordered=False)
+            counters.update_one({"_id": "transactions_ts_migration"}, {"$set": {"last_id": last_id}}, upsert=True)
+            copied += len(batch)
+            if progress:
+                progress(copied, total)
+        
+        batch = []
+        for transaction in source.find(query).sort("_id", 1).batch_size(batch_size):
+            batch.append(self.timeseries_document(transaction))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        return copied
+
+class SalesRollupModel:
+    """Daily totals per (unit, product), kept current with $inc on every recorded transaction"""
+    TRANSACTION_TYPES = ("sale", "purchase")
+    
+    @property
+    def collection(self):
+        return db_instance.db.sales_rollups
+    
+    @staticmethod
+    def day_of(timestamp):
+        """Start of the (UTC) day a timestamp belongs to"""
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def record(self, transaction, session=None):
+        """Add a transaction to its daily rollup"""
+        transaction_type = transaction["transaction_type"]
+        return self.collection.update_one(
+            {
+                "unit_id": transaction["unit_id"],
+                "product_id": transaction["product_id"],
+                "day": self.day_of(transaction["timestamp"])
+            },
+            {"$inc": {
+                f"{transaction_type}_count": 1,
+                f"{transaction_type}_quantity": transaction["quantity"],
+                f"{transaction_type}_amount": transaction["total_amount"]
+            }},
+            upsert=True,
+            session=session
+        )
+    
+    def record_many(self, transactions, session=None):
+        """Add many transactions to their daily rollups with one bulk write"""
+        increments = {}
+        for transaction in transactions:
+            key = (transaction["unit_id"], transaction["product_id"], self.day_of(transaction["timestamp"]))
+            inc = increments.setdefault(key, {})
+            transaction_type = transaction["transaction_type"]
+            for field, value in ((f"{transaction_type}_count", 1),
+                                 (f"{transaction_type}_quantity", transaction["quantity"]),
+                                 (f"{transaction_type}_amount", transaction["total_amount"])):
+                inc[field] = inc.get(field, 0) + value
+        if not increments:
+            return None
+        return self.collection.bulk_write([
+            UpdateOne({"unit_id": unit_id, "product_id": product_id, "day": day}, {"$inc": inc}, upsert=True)
+            for (unit_id, product_id, day), inc in increments.items()
+        ], ordered=False, session=session)
+    
+    def get_monthly_totals(self, start_date, end_date, transaction_type="sale", unit_id=None):
+        """Totals per month ({'YYYY-MM': {amount, quantity, count}}) for a date range"""
+        return self._grouped_totals(
+            {"year": {"$year": "$day"}, "month": {"$month": "$day"}},
+            start_date, end_date, transaction_type, unit_id,
+            lambda key: f"{key['year']}-{key['month']:02d}"
+        )
+    
+    def get_daily_totals(self, start_date, end_date, transaction_type="sale", unit_id=None, product_id=None):
+        """Totals per day ({'YYYY-MM-DD': {amount, quantity, count}}) for a date range"""
+        return self._grouped_totals(
+            "$day", start_date, end_date, transaction_type, unit_id,
+            lambda day: day.strftime('%Y-%m-%d'), product_id
+        )
+    
+    def _grouped_totals(self, group_key, start_date, end_date, transaction_type, unit_id, format_key, product_id=None):
+        """Group rollups in a date range by group_key on the server"""
+        match = {"day": {"$gte": self.day_of(start_date), "$lte": end_date}}
+        if unit_id:
+            match["unit_id"] = unit_id
+        if product_id:
+            match["product_id"] = product_id
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": group_key,
+                "amount": {"$sum": f"${transaction_type}_amount"},
+                "quantity": {"$sum": f"${transaction_type}_quantity"},
+                "count": {"$sum": f"${transaction_type}_count"}
+            }},
+            {"$match": {"count": {"$gt": 0}}},
+            {"$sort": {"_id": 1}}
+        ]
+        return {
+            format_key(row.pop("_id")): row
+            for row in self.collection.aggregate(pipeline)
+        }
+    
+    def delete_rollups(self, unit_id=None, product_id=None):
+        """Delete rollups of a unit and/or product"""
+        query = {}
+        if unit_id:
+            query["unit_id"] = unit_id
+        if product_id:
+            query["product_id"] = product_id
+        return self.collection.delete_many(query)
+    
+    def backfill(self, start_date=None, end_date=None, batch_size=1000):
+        """Rebuild rollups from the transactions collection (optionally for a range of whole days).
+        
+        Days that were archived are skipped: their detail is no longer in the
+        transactions collection, so their rollups are the only totals left.
+        Returns the number of rollup documents written.
+        """
+        archived_before = transaction_model.archived_before()
+        if archived_before and (start_date is None or start_date < archived_before):
+            start_date = archived_before
+        if start_date and end_date and start_date >= end_date:
+            return 0
+        
+        time_filter = {}
+        if start_date:
+            time_filter["$gte"] = self.day_of(start_date)
+        if end_date:
+            time_filter["$lt"] = end_date
+        match = {"timestamp": time_filter} if time_filter else {}
+        
+        # Replace rollups of the rebuilt range instead of adding to them
+        self.collection.delete_many({"day": time_filter} if time_filter else {})
+        
+        totals = {}
+        for transaction_type in self.TRANSACTION_TYPES:
+            is_type = {"$eq": ["$transaction_type", transaction_type]}
+            totals[f"{transaction_type}_count"] = {"$sum": {"$cond": [is_type, 1, 0]}}
+            totals[f"{transaction_type}_quantity"] = {"$sum": {"$cond": [is_type, "$quantity", 0]}}
+            totals[f"{transaction_type}_amount"] = {"$sum": {"$cond": [is_type, "$total_amount", 0]}}
+        
+        pipeline = [
+            {"$match": match},
+            {"$group": dict(totals, _id={
+                "unit_id": "$unit_id",
+                "product_id": "$product_id",
+                "year": {"$year": "$timestamp"},
+                "month": {"$month": "$timestamp"},
+                "day": {"$dayOfMonth": "$timestamp"}
+            })}
+        ]
+        
+        written = 0
+        batch = []
+        for row in transaction_model.aggregate(pipeline, allowDiskUse=True):
+            key = row.pop("_id")
+            row.update({
+                "unit_id": key["unit_id"],
+                "product_id": key["product_id"],
+                "day": datetime(key["year"], key["month"], key["day"])
+            })
+            batch.append(ReplaceOne(
+                {"unit_id": row["unit_id"], "product_id": row["product_id"], "day": row["day"]},
+                row, upsert=True
+            ))
+            if len(batch) >= batch_size:
+                self.collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            self.collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+        return written
 
 # Initialize model instances
 user_model = UserModel()
 unit_model = UnitModel()
 product_model = ProductModel()
-transaction_model = TransactionModel()
\ No newline at end of file
+unit_summary_model = UnitSummaryModel()
+transaction_model = TransactionModel()
+sales_rollup_model = SalesRollupModel()
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination helpers for the Logistics Warehouse System
+"""
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_size_from(args):
+    """Page size from request args, bounded to 1..MAX_PAGE_SIZE"""
+    try:
+        page_size = int(args.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def encode_cursor(direction, key):
+    """Opaque token for the page after ('next') or before ('prev') key = [sort value, product_id]"""
+    raw = json.dumps({"d": direction, "k": key}, ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    """Decode a cursor token into (direction, key); invalid tokens start from the first page"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        direction, key = data["d"], data["k"]
+        if direction in ("next", "prev") and isinstance(key, list) and len(key) == 2:
+            return direction, key
+    except (ValueError, KeyError, TypeError):
+        pass
+    return "next", None
+
+def keyset_filter(field, order, key):
+    """Query for rows strictly after key in (field, product_id) order, both ascending if order is 1"""
+    value, product_id = key
+    op = "$gt" if order == 1 else "$lt"
+    if field == "product_id":
+        return {"product_id": {op: product_id}}
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "product_id": {op: product_id}}
+    ]}
+
+def build_page(rows, field, order, page_size, direction, has_cursor, resume_key=None):
+    """Turn rows fetched in page order (page_size + 1 at most) into a page with next/prev tokens.
+
+    For 'prev' pages the rows were fetched in reverse order and are flipped here.
+    resume_key is the key where a bounded scan stopped before filling the
+    page: "partial" is then the direction the page continues in, from that key.
+    """
+    has_more = len(rows) > page_size or resume_key is not None
+    rows = rows[:page_size]
+    if direction == "prev":
+        rows.reverse()
+        has_next, has_prev = has_cursor, has_more
+    else:
+        has_next, has_prev = has_more, has_cursor
+
+    def key_of(row):
+        return [row.get(field), row.get("product_id")]
+
+    next_cursor = encode_cursor("next", key_of(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor("prev", key_of(rows[0])) if rows and has_prev else None
+    if resume_key is not None:
+        if direction == "prev":
+            prev_cursor = encode_cursor("prev", resume_key)
+        else:
+            next_cursor = encode_cursor("next", resume_key)
+    return {
+        "items": rows,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "partial": direction if resume_key is not None else None
+    }
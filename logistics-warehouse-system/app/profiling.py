@@ -0,0 +1,323 @@
+"""
+Request profiling for the admin routes of the Logistics Warehouse System
+
+A request on an admin route is profiled when an admin asks for it
+(`?profile=1`) or, while PROFILE_SLOW_MS is set, always: the capture is
+kept only if the request turns out slower than the threshold. A capture
+holds a sampled Python stack profile and the MongoDB commands the request
+issued, with the plan of the slowest reads (from `explain`, run by a
+background thread after the response). The last PROFILE_KEEP captures of
+this process are kept in memory.
+"""
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from bson import json_util
+from flask import g, has_request_context, request, session
+from pymongo import monitoring
+
+# Admin requests slower than this are captured (0, the default, disables slow capture)
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0') or 0)
+
+# Stack sampling interval
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+
+# Captures kept per process
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+
+# MongoDB commands recorded per request, and how many of them are explained.
+# Reads of requested captures are explained with executionStats (which runs
+# them again), those of slow captures only with queryPlanner
+PROFILE_MAX_COMMANDS = 500
+PROFILE_MAX_EXPLAINS = 5
+
+# Read commands that can be explained; the others are listed with their timings only
+EXPLAINABLE = ("find", "aggregate", "count", "distinct")
+
+# Command fields that belong to the session or the wire protocol, not to the query
+_PROTOCOL_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction")
+
+class StackSampler:
+    """Samples the Python stacks of registered threads from a background thread"""
+    def __init__(self, interval):
+        self.interval = interval
+        self._threads = {}   # thread id -> Counter of stacks (tuples of frames, root first)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_running(self):
+        # One sampling thread per process (threads don't survive a fork)
+        if self._thread is None or self._pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._threads[thread_id] = Counter()
+            self._ensure_running()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its stack counts"""
+        with self._lock:
+            return self._threads.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_stack(frame)] += 1
+
+def _stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+
+captures = deque(maxlen=PROFILE_KEEP)
+_capture_ids = itertools.count(1)
+
+def _json(document, limit=2000):
+    text = json_util.dumps(document, ensure_ascii=False)
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def _query_of(command_name, command):
+    """The part of a command that describes what it reads or writes"""
+    if command_name == "aggregate":
+        return command.get("pipeline")
+    for field in ("filter", "query", "q", "updates", "deletes"):
+        if field in command:
+            return command[field]
+    return None
+
+class CommandRecorder(monitoring.CommandListener):
+    """Records the MongoDB commands of requests that are being profiled"""
+    def started(self, event):
+        profile = g.get('profile') if has_request_context() else None
+        if not profile or not profile["recording"] or len(profile["commands"]) >= PROFILE_MAX_COMMANDS:
+            return
+        command = {
+            field: value for field, value in event.command.items()
+            if not field.startswith('$') and field not in _PROTOCOL_FIELDS
+        }
+        collection = event.command.get(event.command_name)
+        profile["pending"][event.request_id] = {
+            "command": event.command_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "database": event.database_name,
+            "query": _json(_query_of(event.command_name, command)),
+            "document": command if event.command_name in EXPLAINABLE else None,
+            "offset_ms": (time.perf_counter() - profile["started"]) * 1000
+        }
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "")) if isinstance(event.failure, dict) else "error")
+
+    def _finish(self, event, error):
+        profile = g.get('profile') if has_request_context() else None
+        if not profile:
+            return
+        command = profile["pending"].pop(event.request_id, None)
+        if command is not None:
+            command["duration_ms"] = event.duration_micros / 1000
+            command["error"] = error
+            profile["commands"].append(command)
+
+command_recorder = CommandRecorder()
+
+def _find_key(document, key):
+    """First value of key found anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+def explain_commands(commands, verbosity="queryPlanner"):
+    """Add the winning plan (and with executionStats, docs/keys examined) to the slowest read commands"""
+    from .database import db_instance
+    explainable = sorted((c for c in commands if c["document"]), key=lambda c: c["duration_ms"], reverse=True)
+    for command in explainable[:PROFILE_MAX_EXPLAINS]:
+        try:
+            explain = db_instance.client[command["database"]].command(
+                {"explain": command["document"], "verbosity": verbosity})
+        except Exception as e:
+            command["explain_error"] = str(e)
+            continue
+        command["docs_examined"] = _find_key(explain, "totalDocsExamined")
+        command["keys_examined"] = _find_key(explain, "totalKeysExamined")
+        command["returned"] = _find_key(explain, "nReturned")
+        winning_plan = _find_key(explain, "winningPlan")
+        command["plan"] = _find_key(winning_plan, "stage") if winning_plan else None
+    for command in commands:
+        command.pop("document", None)
+
+class Explainer:
+    """Explains the commands of kept captures in a background thread, so the
+    worker thread that served the request is free as soon as it responds"""
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=PROFILE_KEEP)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, capture):
+        with self._lock:
+            # One thread per process (threads don't survive a fork)
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=PROFILE_KEEP)
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name="profile-explain", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            try:
+                self._queue.put_nowait(capture)
+            except queue.Full:
+                capture["explained"] = True
+                for command in capture["commands"]:
+                    command.pop("document", None)
+
+    def _run(self, jobs):
+        while True:
+            capture = jobs.get()
+            try:
+                explain_commands(capture["commands"], "executionStats" if capture["reason"] == "requested" else "queryPlanner")
+            finally:
+                capture["explained"] = True
+
+explainer = Explainer()
+
+def _profiled(endpoint):
+    return endpoint and endpoint.startswith('admin.') and not endpoint.startswith('admin.profile')
+
+def _before_request():
+    if not _profiled(request.endpoint):
+        return
+    requested = request.args.get('profile') == '1' and session.get('role') == 'admin'
+    if not requested and not PROFILE_SLOW_MS:
+        return
+    g.profile = {
+        "requested": requested,
+        "started": time.perf_counter(),
+        "started_at": datetime.utcnow(),
+        "thread": threading.get_ident(),
+        "recording": True,
+        "pending": {},
+        "commands": []
+    }
+    sampler.start(g.profile["thread"])
+
+def _after_request(response):
+    profile = g.get('profile')
+    if profile:
+        details = {
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.full_path.rstrip('?'),
+            "status": response.status_code,
+            "user": session.get('username')
+        }
+        response.call_on_close(lambda: _finish_capture(profile, details))
+    return response
+
+def _finish_capture(profile, details):
+    """Stop sampling and keep the capture if it was requested or the request was slow"""
+    profile["recording"] = False
+    stacks = sampler.stop(profile["thread"])
+    duration_ms = (time.perf_counter() - profile["started"]) * 1000
+    slow = PROFILE_SLOW_MS and duration_ms >= PROFILE_SLOW_MS
+    if not (profile["requested"] or slow):
+        return
+    capture = dict(
+        details,
+        id=next(_capture_ids),
+        reason="requested" if profile["requested"] else "slow",
+        started_at=profile["started_at"],
+        duration_ms=duration_ms,
+        interval_ms=PROFILE_INTERVAL_MS,
+        samples=stacks,
+        commands=profile["commands"],
+        db_time_ms=sum(c["duration_ms"] for c in profile["commands"]),
+        explained=False
+    )
+    captures.append(capture)
+    explainer.submit(capture)
+
+def get_capture(capture_id):
+    for capture in captures:
+        if capture["id"] == capture_id:
+            return capture
+    return None
+
+def _frame_name(frame):
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def collapsed_stacks(capture):
+    """Capture profile in collapsed-stack format (flamegraph.pl, speedscope, ...)"""
+    lines = [
+        ";".join(_frame_name(frame) for frame in stack) + f" {count}"
+        for stack, count in capture["samples"].most_common()
+    ]
+    return "\n".join(lines) + "\n"
+
+def speedscope_profile(capture):
+    """Capture profile as a speedscope (https://www.speedscope.app) JSON document"""
+    frames = {}
+    samples = []
+    weights = []
+    for stack, count in capture["samples"].items():
+        samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+        weights.append(count * capture["interval_ms"])
+    name = f"{capture['method']} {capture['path']} ({capture['duration_ms']:.0f} ms)"
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "logistics-warehouse-system",
+        "activeProfileIndex": 0,
+        "shared": {"frames": [
+            {"name": frame[0], "file": frame[1], "line": frame[2]} for frame in frames
+        ]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights
+        }]
+    })
+
+def register_profiling(app):
+    """Install the profiling request hooks on the Flask app"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
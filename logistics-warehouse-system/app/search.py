@@ -0,0 +1,255 @@
+"""
+Product name search and autocomplete for the Logistics Warehouse System
+"""
+import bisect
+import itertools
+import os
+import re
+import threading
+import time
+import unicodedata
+from .database import db_instance
+
+# Substring search uses n-grams of these sizes (bigrams serve 2-letter queries)
+NGRAM_SIZES = (2, 3)
+
+def normalize_name(text):
+    """Normalize a name for searching: case-folded, accents removed, single spaces.
+
+    Greek accents (τόνος, διαλυτικά) are folded and final sigma becomes σ,
+    so "Καρέκλα" and "καρεκλα" normalize to the same string.
+    """
+    decomposed = unicodedata.normalize('NFD', text.casefold())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.split())
+
+def name_ngrams(normalized):
+    """All n-grams of a normalized name, taken per word"""
+    grams = set()
+    for word in normalized.split():
+        for size in NGRAM_SIZES:
+            for i in range(len(word) - size + 1):
+                grams.add(word[i:i + size])
+    return sorted(grams)
+
+def query_ngrams(normalized):
+    """N-grams that every name containing the (normalized) query must have"""
+    grams = set()
+    for word in normalized.split():
+        size = min(len(word), max(NGRAM_SIZES))
+        if size < min(NGRAM_SIZES):
+            continue
+        for i in range(len(word) - size + 1):
+            grams.add(word[i:i + size])
+    return sorted(grams)
+
+def search_fields(product_name):
+    """Derived search fields stored on products_master documents"""
+    normalized = normalize_name(product_name)
+    return {
+        "product_name_normalized": normalized,
+        "product_name_ngrams": name_ngrams(normalized)
+    }
+
+def build_search_pipeline(term, limit=None):
+    """Aggregation pipeline over products_master returning matches for term, best first.
+
+    Ranking: names starting with the term, then names with a word starting
+    with it, then any other substring match; ties are broken by name.
+    Returns None if the term is empty after normalization.
+    """
+    normalized = normalize_name(term)
+    if not normalized:
+        return None
+    escaped = re.escape(normalized)
+
+    # Anchored prefix match uses the product_name_normalized index,
+    # substring candidates come from the multikey n-gram index
+    candidates = [{"product_name_normalized": {"$regex": "^" + escaped}}]
+    grams = query_ngrams(normalized)
+    if grams:
+        candidates.append({"product_name_ngrams": {"$all": grams}})
+
+    pipeline = [
+        {"$match": {
+            "$or": candidates,
+            # Confirm the n-gram candidates really contain the term
+            "product_name_normalized": {"$regex": escaped}
+        }},
+        {"$addFields": {"search_rank": {"$switch": {
+            "branches": [
+                {"case": {"$eq": [{"$indexOfCP": ["$product_name_normalized", normalized]}, 0]}, "then": 0},
+                {"case": {"$gte": [{"$indexOfCP": ["$product_name_normalized", " " + normalized]}, 0]}, "then": 1}
+            ],
+            "default": 2
+        }}}},
+        {"$sort": {"search_rank": 1, "product_name_normalized": 1, "product_id": 1}}
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+class AutocompleteIndex:
+    """Per-process autocomplete index over product names and IDs.
+
+    Names are kept in sorted arrays (full name and every word start) so a
+    prefix lookup is a binary search. Stock comes from per-unit quantity maps
+    that are reloaded every quantity_ttl seconds and updated in place by the
+    stock writes of this process. The catalog itself is refreshed on
+    catalog writes of this process and fully reloaded every catalog_ttl
+    seconds to pick up changes made by other processes.
+    """
+    def __init__(self, catalog_ttl=300, quantity_ttl=30):
+        self.catalog_ttl = catalog_ttl
+        self.quantity_ttl = quantity_ttl
+        self._lock = threading.RLock()
+        self._products = {}      # product_id -> {"product_name", "product_category"}
+        self._name_keys = []     # sorted (normalized full name, product_id)
+        self._word_keys = []     # sorted (normalized name from a word start, product_id)
+        self._id_keys = []       # sorted (lowercase product_id, product_id)
+        self._built_at = None
+        self._quantities = {}    # unit_id -> (loaded_at, {product_id: quantity})
+
+    @staticmethod
+    def _keys_for(product_id, normalized):
+        """Name and word-start keys of one product"""
+        words = normalized.split(' ')
+        word_keys = [(' '.join(words[i:]), product_id) for i in range(1, len(words))]
+        return (normalized, product_id), word_keys
+
+    def build(self):
+        """(Re)load the catalog from products_master"""
+        products = {}
+        name_keys, word_keys, id_keys = [], [], []
+        projection = {"_id": 0, "product_id": 1, "product_name": 1, "product_category": 1}
+        for product in db_instance.db.products_master.find({}, projection):
+            product_id = product["product_id"]
+            products[product_id] = {
+                "product_name": product.get("product_name", ""),
+                "product_category": product.get("product_category", "N/A")
+            }
+            name_key, product_word_keys = self._keys_for(product_id, normalize_name(products[product_id]["product_name"]))
+            name_keys.append(name_key)
+            word_keys.extend(product_word_keys)
+            id_keys.append((product_id.lower(), product_id))
+
+        with self._lock:
+            self._products = products
+            self._name_keys = sorted(name_keys)
+            self._word_keys = sorted(word_keys)
+            self._id_keys = sorted(id_keys)
+            self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.catalog_ttl:
+            self.build()
+
+    def upsert_product(self, product):
+        """Add or refresh one catalog product (after create/edit)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            product_id = product["product_id"]
+            self._remove_keys(product_id)
+            self._products[product_id] = {
+                "product_name": product.get("product_name", ""),
+                "product_category": product.get("product_category", "N/A")
+            }
+            name_key, word_keys = self._keys_for(product_id, normalize_name(product.get("product_name", "")))
+            bisect.insort(self._name_keys, name_key)
+            for key in word_keys:
+                bisect.insort(self._word_keys, key)
+            bisect.insort(self._id_keys, (product_id.lower(), product_id))
+
+    def remove_product(self, product_id):
+        """Remove one catalog product (after delete)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove_keys(product_id)
+            for _, quantities in self._quantities.values():
+                quantities.pop(product_id, None)
+
+    def _remove_keys(self, product_id):
+        if product_id not in self._products:
+            return
+        del self._products[product_id]
+        self._name_keys = [key for key in self._name_keys if key[1] != product_id]
+        self._word_keys = [key for key in self._word_keys if key[1] != product_id]
+        self._id_keys = [key for key in self._id_keys if key[1] != product_id]
+
+    def invalidate(self):
+        """Drop everything; the next search reloads the catalog"""
+        with self._lock:
+            self._built_at = None
+            self._quantities = {}
+
+    def _unit_quantities(self, unit_id):
+        entry = self._quantities.get(unit_id)
+        if entry is None or time.monotonic() - entry[0] > self.quantity_ttl:
+            quantities = {
+                up["product_id"]: up.get("product_quantity", 0)
+                for up in db_instance.db.unit_products.find(
+                    {"unit_id": unit_id}, {"_id": 0, "product_id": 1, "product_quantity": 1})
+            }
+            entry = (time.monotonic(), quantities)
+            with self._lock:
+                self._quantities[unit_id] = entry
+        return entry[1]
+
+    def set_quantity(self, unit_id, product_id, quantity):
+        """Record a stock change made by this process"""
+        with self._lock:
+            entry = self._quantities.get(unit_id)
+            if entry is not None:
+                entry[1][product_id] = quantity
+
+    def set_quantity_all(self, product_id, quantity):
+        """Record a new product stocked with the same quantity in every unit"""
+        with self._lock:
+            for _, quantities in self._quantities.values():
+                quantities[product_id] = quantity
+
+    @staticmethod
+    def _prefix_matches(keys, prefix):
+        """Product ids whose key starts with prefix, in key order"""
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            yield keys[i][1]
+            i += 1
+
+    def search(self, unit_id, term, limit=10):
+        """Products of a unit matching term: ID prefix, then name prefix, then word prefix"""
+        self._ensure_built()
+        quantities = self._unit_quantities(unit_id)
+        normalized = normalize_name(term)
+        if not normalized:
+            return []
+
+        with self._lock:
+            candidates = itertools.chain(
+                self._prefix_matches(self._id_keys, term.strip().lower()),
+                self._prefix_matches(self._name_keys, normalized),
+                self._prefix_matches(self._word_keys, normalized)
+            )
+            results = []
+            seen = set()
+            for product_id in candidates:
+                if product_id in seen or product_id not in quantities:
+                    continue
+                seen.add(product_id)
+                product = self._products[product_id]
+                results.append({
+                    "product_id": product_id,
+                    "product_name": product["product_name"],
+                    "product_quantity": quantities[product_id],
+                    "product_category": product["product_category"]
+                })
+                if len(results) >= limit:
+                    break
+            return results
+
+autocomplete_index = AutocompleteIndex(
+    catalog_ttl=float(os.getenv('AUTOCOMPLETE_CATALOG_TTL', '300')),
+    quantity_ttl=float(os.getenv('AUTOCOMPLETE_QUANTITY_TTL', '30'))
+)
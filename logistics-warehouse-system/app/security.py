@@ -0,0 +1,164 @@
+"""
+Password hashing for the Logistics Warehouse System
+
+bcrypt is deliberately slow, so hashing and verification run in a small
+process pool instead of the request worker. The number of jobs in flight is
+bounded: when the pool is saturated new jobs are rejected at once
+(HashingUnavailable) instead of queueing behind hundreds of logins.
+
+The pool forks its workers. Forking a process that already runs other
+threads can leave a worker stuck on a lock held by one of them, so servers
+call PasswordHasher.start() right after forking each worker, before it
+starts any thread (see post_fork in gunicorn.conf.py). Elsewhere (flask run,
+CLI commands) the pool starts on first use.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+from .metrics import Histogram
+
+# bcrypt work factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+# Worker processes (0 hashes inline in the request thread)
+HASH_POOL_SIZE = int(os.getenv('HASH_POOL_SIZE', str(min(os.cpu_count() or 1, 4))))
+
+# Jobs allowed in flight (running or waiting for a worker) per process
+HASH_QUEUE_LIMIT = int(os.getenv('HASH_QUEUE_LIMIT', '32'))
+
+# Seconds a request waits for its hashing job
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', '10'))
+
+class HashingUnavailable(Exception):
+    """The hashing pool is saturated or the job timed out; the request can be retried"""
+
+def _timed(function, *args):
+    """Run function in a worker and report when it started and finished"""
+    started = time.time()
+    result = function(*args)
+    return result, started, time.time()
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+class PasswordHasher:
+    """bcrypt hashing and verification through a bounded process pool"""
+    def __init__(self, rounds=12, pool_size=4, queue_limit=32, timeout=10.0):
+        self.rounds = rounds
+        self.pool_size = pool_size
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hash_latency = Histogram()
+        self.queue_wait = Histogram()
+
+    def _get_executor(self):
+        # One pool per process: a pool inherited through fork (e.g. from a
+        # pre-forking server master) is not usable in the child
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Workers are forked so they don't import (and start) the web app;
+                # they only ever run bcrypt
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('fork')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def start(self):
+        """Start this process's worker processes now (no-op when hashing inline).
+
+        The fork context starts all workers on the first job, before the pool
+        starts its own threads.
+        """
+        if self.pool_size:
+            self._get_executor().submit(int).result()
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingUnavailable("password hashing queue is full")
+        with self._lock:
+            self.in_flight += 1
+
+        submitted = time.time()
+        if not self.pool_size:
+            try:
+                result, started, finished = _timed(function, *args)
+            finally:
+                self._release()
+        else:
+            try:
+                future = self._get_executor().submit(_timed, function, *args)
+            except Exception:
+                self._release()
+                raise
+            # The slot is freed when the job really ends, even after a timeout
+            future.add_done_callback(self._release)
+            try:
+                result, started, finished = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise HashingUnavailable("password hashing timed out")
+
+        self.queue_wait.observe(max(started - submitted, 0.0))
+        self.hash_latency.observe(finished - started)
+        return result
+
+    def hash_password(self, password):
+        """bcrypt hash of password with the configured work factor"""
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds)
+
+    def check_password(self, password, hashed):
+        """Verify password against a bcrypt hash"""
+        return self._run(_checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """True if hashed was made with a different work factor than the configured one"""
+        try:
+            return int(hashed[4:6]) != self.rounds  # $2b$12$...
+        except (TypeError, ValueError):
+            return True
+
+    def stats(self):
+        """Pool state, counters and latency histograms of this process"""
+        with self._lock:
+            stats = {
+                "rounds": self.rounds,
+                "pool_size": self.pool_size,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts
+            }
+        stats["hash_latency"] = self.hash_latency.snapshot()
+        stats["queue_wait"] = self.queue_wait.snapshot()
+        return stats
+
+password_hasher = PasswordHasher(
+    rounds=BCRYPT_ROUNDS,
+    pool_size=HASH_POOL_SIZE,
+    queue_limit=HASH_QUEUE_LIMIT,
+    timeout=HASH_TIMEOUT
+)
@@ -42,17 +42,9 @@ def dashboard():
     employees = user_model.get_users_by_unit(unit_id)
     employees = [emp for emp in employees if emp['role'] == 'employee']
     
-    # Get unit statistics
-    unit_products = product_model.get_products_by_unit(unit_id)
-    
-    # Calculate financial summary
+    # Get financial summary (includes volume usage)
     financial_summary = product_model.calculate_unit_financial_summary(unit_id)
-    
-    # Calculate volume usage
-    total_volume_used = 0
-    for p in unit_products:
-        if 'product_volume' in p and 'product_quantity' in p:
-            total_volume_used += p['product_volume'] * p['product_quantity']
+    total_volume_used = financial_summary['total_volume_used']
     
     volume_usage_percentage = (total_volume_used / unit_info['unit_volume'] * 100) if unit_info['unit_volume'] > 0 else 0
     
@@ -172,14 +164,9 @@ def unit_statistics():
     employees = user_model.get_users_by_unit(unit_id)
     employees = [emp for emp in employees if emp['role'] == 'employee']
     
-    # Calculate financial summary
+    # Get financial summary (includes volume usage)
     financial_summary = product_model.calculate_unit_financial_summary(unit_id)
-    
-    # Calculate volume usage
-    total_volume_used = 0
-    for p in unit_products:
-        if 'product_volume' in p and 'product_quantity' in p:
-            total_volume_used += p['product_volume'] * p['product_quantity']
+    total_volume_used = financial_summary['total_volume_used']
     
     volume_usage_percentage = (total_volume_used / unit_info['unit_volume'] * 100) if unit_info['unit_volume'] > 0 else 0
     
@@ -216,20 +203,14 @@ def purchase_product(product_id):
             if quantity <= 0:
                 flash('Η ποσότητα πρέπει να είναι μεγαλύτερη από 0!', 'error')
             else:
-                # Update product quantity
-                success = product_model.update_product_quantity(
-                    unit_id, product_id, quantity, 'purchase'
+                # Update product quantity and record transaction
+                success = product_model.process_transaction(
+                    unit_id, product_id, 'purchase', quantity,
+                    session['username'],
+                    f"Αγορά {quantity} τεμαχίων"
                 )
                 
                 if success:
-                    # Record transaction
-                    transaction_model.record_transaction(
-                        unit_id, product_id, 'purchase', quantity,
-                        product['product_purchase_price'],
-                        session['username'],
-                        f"Αγορά {quantity} τεμαχίων"
-                    )
-                    
                     flash(f'Αγοράστηκαν επιτυχώς {quantity} τεμάχια του προϊόντος!', 'success')
                     return redirect(url_for('employee.view_product_details', product_id=product_id))
                 else:
@@ -242,6 +223,28 @@ def purchase_product(product_id):
                          product=product,
                          is_admin_access=session.get('role') == 'admin')
 
+@supervisor_bp.route('/order', methods=['POST'])
+def create_purchase_order():
+    """API endpoint for a multi-line purchase (JSON: {"lines": [{"product_id", "quantity"}], "notes"})"""
+    check = require_supervisor()
+    if check: return check
+    
+    unit_id = get_current_unit_id()
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = product_model.parse_order_lines(data.get('lines'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    result = product_model.process_order(
+        unit_id, lines, 'purchase', session['username'],
+        data.get('notes') or f"Παραγγελία αγοράς {len(lines)} γραμμών"
+    )
+    
+    if result['errors']:
+        return jsonify({"success": False, "errors": result['errors']}), 409
+    return jsonify({"success": True, "transaction_ids": result['transaction_ids']})
+
 @supervisor_bp.route('/return_to_admin')
 def return_to_admin():
     """Return to admin dashboard from temporary unit access"""
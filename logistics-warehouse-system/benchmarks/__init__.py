@@ -0,0 +1,15 @@
+"""
+Route-level benchmarks for the Logistics Warehouse System
+
+    python -m benchmarks seed --profile small
+    python -m benchmarks run --profile small
+
+The benchmarks always use their own database (BENCH_MONGODB_URI, default
+mongodb://localhost:27017/LogisticsBench), never the one in MONGODB_URI.
+"""
+import os
+
+# Set before the app is imported: the app reads its configuration at import time
+os.environ['MONGODB_URI'] = os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017/LogisticsBench')
+os.environ['DB_QUERY_HEADER'] = 'true'
+os.environ.setdefault('PROFILE_SLOW_MS', '0')
@@ -0,0 +1,205 @@
+"""
+Benchmark command line
+
+    python -m benchmarks seed --profile medium
+    python -m benchmarks seed --profile large --transactions 30000000 --workers 16
+    python -m benchmarks run --profile medium --requests 300 --concurrency 4
+    python -m benchmarks run --profile medium --mode http --url http://localhost:5000 --concurrency 32
+    python -m benchmarks run --profile medium --save-baseline
+    python -m benchmarks stress --skus 3 --processes 4 --threads 8 --operations 5000 --initial-stock 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from . import dataset, scenarios, runner, stress
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# Latency changes below this many milliseconds are treated as noise
+LATENCY_NOISE_MS = 2.0
+
+def baseline_path(profile, mode):
+    return os.path.join(BASELINE_DIR, f"{profile}-{mode}.json")
+
+def _fmt(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_report(results):
+    print(f"\nProfile {results['profile']}, {results['mode']} driver, concurrency {results['concurrency']}")
+    header = f"{'route':<38} {'reqs':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'queries':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, route in results["routes"].items():
+        print(f"{name:<38} {route['requests']:>6} {route['errors']:>5} {_fmt(route['p50_ms']):>9} "
+              f"{_fmt(route['p95_ms']):>9} {_fmt(route['p99_ms']):>9} {_fmt(route['throughput_rps']):>8} "
+              f"{_fmt(route['queries_per_request']):>8}")
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against a baseline run, as printable strings"""
+    regressions = []
+    for name, current in results["routes"].items():
+        base = baseline["routes"].get(name)
+        if not base:
+            continue
+        if (current["p95_ms"] is not None and base["p95_ms"] is not None
+                and current["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - base["p95_ms"] > LATENCY_NOISE_MS):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} ms -> {current['p95_ms']:.1f} ms")
+        if (current["queries_per_request"] is not None and base["queries_per_request"] is not None
+                and current["queries_per_request"] > base["queries_per_request"] + 0.5):
+            regressions.append(f"{name}: queries/request {base['queries_per_request']:.1f} -> {current['queries_per_request']:.1f}")
+        if current["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {base['error_rate']:.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+def command_seed(args):
+    last_label = [None]
+    def progress(label, count):
+        if last_label[0] not in (None, label):
+            print()
+        last_label[0] = label
+        print(f"\r  {label}: {count}", end="", flush=True)
+    scale = dict(dataset.SCALE_PROFILES[args.profile])
+    for field in ("units", "products", "transactions", "years"):
+        if getattr(args, field) is not None:
+            scale[field] = getattr(args, field)
+    print(f"Seeding {scale['units']} units, {scale['products']} products, "
+          f"{scale['transactions']} transactions over {scale['years']} years")
+    started = time.perf_counter()
+    counts = dataset.seed(scale, args.seed, args.workers, progress)
+    print()
+    for collection, count in counts.items():
+        print(f"✓ {collection}: {count}")
+    print(f"✅ Seeded profile {args.profile} in {time.perf_counter() - started:.0f}s")
+
+def command_run(args):
+    if args.mode == "http":
+        driver = runner.HttpDriver(args.url)
+    else:
+        from app import create_app
+        driver = runner.TestClientDriver(create_app())
+
+    ctx = runner.load_context()
+    results = {
+        "profile": args.profile,
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "created_at": datetime.utcnow().isoformat(),
+        "routes": {}
+    }
+    for scenario in scenarios.select(args.scenario):
+        print(f"… {scenario.name}", flush=True)
+        results["routes"][scenario.name] = runner.run_scenario(
+            driver, scenario, ctx, args.requests, args.concurrency, args.warmup, args.seed)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    path = args.baseline or baseline_path(args.profile, args.mode)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"\n✅ Saved baseline {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"\nNo baseline at {path} (save one with --save-baseline)")
+        return 0
+
+    with open(path) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance)
+    if regressions:
+        print(f"\n✗ Regressions against {path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\n✅ No regressions against {path}")
+    return 0
+
+def command_stress(args):
+    report = stress.run(args.mode, args.url, args.unit_id, args.skus, args.processes, args.threads,
+                        args.operations, args.sale_ratio, args.max_quantity, args.initial_stock, args.seed)
+    print(f"\nUnit {report['unit_id']}, products {', '.join(report['products'])}, {report['mode']} driver, "
+          f"{report['processes']} processes x {report['threads']} threads, {report['wall_seconds']:.1f}s")
+    header = f"{'operation':<10} {'reqs':>6} {'rejected':>8} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, op in report["operations"].items():
+        print(f"{name:<10} {op['requests']:>6} {op['rejected']:>8} {op['errors']:>5} {_fmt(op['p50_ms']):>9} "
+              f"{_fmt(op['p95_ms']):>9} {_fmt(op['p99_ms']):>9} {_fmt(op['throughput_rps']):>8}")
+    print()
+    for product_id, stock in report["stock"].items():
+        print(f"  {product_id}: {stock['initial']} + {stock['bought']} bought - {stock['sold']} sold -> {stock['final']}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if report["drift"]:
+        print("\n✗ Drift between the stock and the ledger:")
+        for drift in report["drift"]:
+            print(f"  {drift}")
+        return 1
+    print("\n✅ Stock, gain, rollups and unit summary agree with the ledger")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Route-level benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Drop and seed the benchmark database")
+    seed_parser.add_argument("--profile", choices=dataset.SCALE_PROFILES, default="small")
+    seed_parser.add_argument("--seed", type=int, default=42, help="Random seed of the generated data")
+    seed_parser.add_argument("--units", type=int, help="Override the number of units of the profile")
+    seed_parser.add_argument("--products", type=int, help="Override the number of products of the profile")
+    seed_parser.add_argument("--transactions", type=int, help="Override the number of transactions of the profile")
+    seed_parser.add_argument("--years", type=float, help="Override the years of history of the profile")
+    seed_parser.add_argument("--workers", type=int, help="Generator processes (default: one per core)")
+
+    run_parser = commands.add_parser("run", help="Benchmark the routes against the seeded database")
+    run_parser.add_argument("--profile", choices=dataset.SCALE_PROFILES, default="small",
+                            help="Profile the database was seeded with (names the baseline)")
+    run_parser.add_argument("--mode", choices=("client", "http"), default="client",
+                            help="Flask test client in-process, or HTTP against --url")
+    run_parser.add_argument("--url", default="http://localhost:5000")
+    run_parser.add_argument("--requests", type=int, default=200, help="Measured requests per route")
+    run_parser.add_argument("--concurrency", type=int, default=1, help="Concurrent logged-in workers per route")
+    run_parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per worker before measuring")
+    run_parser.add_argument("--scenario", action="append", help=f"Route to run (repeatable): {', '.join(scenarios.scenario_names())}")
+    run_parser.add_argument("--seed", type=int, default=42, help="Random seed of the request parameters")
+    run_parser.add_argument("--output", help="Write the results as JSON")
+    run_parser.add_argument("--baseline", help="Baseline file (default benchmarks/baselines/<profile>-<mode>.json)")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+
+    stress_parser = commands.add_parser("stress", help="Concurrent sells and purchases of hot products, then check the stock")
+    stress_parser.add_argument("--mode", choices=("client", "http"), default="client",
+                               help="Flask test client in each process, or HTTP against --url")
+    stress_parser.add_argument("--url", default="http://localhost:5000")
+    stress_parser.add_argument("--unit-id", help="Unit under test (default: the first unit)")
+    stress_parser.add_argument("--skus", type=int, default=3, help="Hot products all workers sell and buy")
+    stress_parser.add_argument("--processes", type=int, default=4)
+    stress_parser.add_argument("--threads", type=int, default=8, help="Threads per process")
+    stress_parser.add_argument("--operations", type=int, default=5000, help="Total sells and purchases")
+    stress_parser.add_argument("--sale-ratio", type=float, default=0.7, help="Share of the operations that are sells")
+    stress_parser.add_argument("--max-quantity", type=int, default=3, help="Largest quantity of one operation")
+    stress_parser.add_argument("--initial-stock", type=int,
+                               help="Set the stock of the hot products first (low values force refused sells)")
+    stress_parser.add_argument("--seed", type=int, default=42, help="Random seed of the operations")
+    stress_parser.add_argument("--output", help="Write the report as JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == "seed":
+        return command_seed(args)
+    if args.command == "stress":
+        return command_stress(args)
+    return command_run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
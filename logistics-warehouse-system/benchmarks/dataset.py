@@ -0,0 +1,159 @@
+"""
+Synthetic warehouse datasets for the benchmarks
+
+Seeds the database of MONGODB_URI (by default LogisticsBench, never the
+production LogisticsDB) with units, products, users, stock and a
+multi-year transactions history of a given scale profile (see generator).
+Generation is seeded, so the same profile always produces the same data.
+"""
+import random
+from datetime import datetime
+from app.database import db_instance
+from app.init_db import initialize_admin
+from app.models import transaction_model
+from app.search import search_fields
+from app.security import password_hasher
+from . import generator
+
+# Units, products, transactions and years of history of each scale profile
+SCALE_PROFILES = {
+    "small": {"units": 10, "products": 1000, "transactions": 100_000, "years": 2},
+    "medium": {"units": 100, "products": 10_000, "transactions": 1_000_000, "years": 3},
+    "large": {"units": 500, "products": 50_000, "transactions": 10_000_000, "years": 3},
+}
+
+# Password of every generated supervisor and employee
+BENCH_PASSWORD = "benchmark123"
+
+EMPLOYEES_PER_UNIT = 5
+
+INSERT_BATCH_SIZE = 10_000
+
+CATEGORIES = ("Έπιπλα", "Ηλεκτρονικά", "Εργαλεία", "Συσκευασία", "Ανταλλακτικά", "Χαρτικά", "Φωτισμός", "Ένδυση")
+MANUFACTURERS = ("Alfa", "Beta Industries", "Gamma ΑΕ", "Delta Logistics", "Epsilon", "Zeta Hellas")
+NAME_WORDS = (
+    "Καρέκλα", "Τραπέζι", "Ράφι", "Κουτί", "Παλέτα", "Λάμπα", "Καλώδιο", "Βίδα", "Κατσαβίδι", "Σφυρί",
+    "Οθόνη", "Πληκτρολόγιο", "Ποντίκι", "Φάκελος", "Ταινία", "Μπαταρία", "Φορτιστής", "Σακίδιο",
+    "Chair", "Desk", "Shelf", "Cable", "Monitor", "Drill", "Printer", "Router", "Scanner", "Label"
+)
+NAME_QUALIFIERS = ("Mini", "Pro", "Max", "Μεγάλο", "Μικρό", "Βιομηχανικό", "Eco", "Plus", "Lite", "XL")
+
+def unit_ids(units):
+    return [str(i).zfill(3) for i in range(1, units + 1)]
+
+def product_ids(products):
+    width = max(4, len(str(products)))
+    return [f"P{str(i).zfill(width)}" for i in range(1, products + 1)]
+
+def supervisor_username(unit_id):
+    return f"bench_sup_{unit_id}"
+
+def employee_username(unit_id, index):
+    return f"bench_emp_{unit_id}_{index}"
+
+def _insert(collection, documents, progress=None, label=None):
+    """insert_many in batches; returns the number of documents inserted"""
+    batch = []
+    total = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+            if progress:
+                progress(label, total)
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    if progress:
+        progress(label, total)
+    return total
+
+def generate_products(rng, products):
+    for product_id in product_ids(products):
+        purchase_price = round(rng.uniform(1, 500), 2)
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_QUALIFIERS)} {product_id[1:]}"
+        product = {
+            "product_id": product_id,
+            "product_name": name,
+            "product_weight": round(rng.uniform(0.1, 50), 2),
+            "product_volume": round(rng.uniform(0.001, 0.5), 3),
+            "product_category": rng.choice(CATEGORIES),
+            "product_purchase_price": purchase_price,
+            "product_selling_price": round(purchase_price * rng.uniform(1.1, 1.8), 2),
+            "product_manufacturer": rng.choice(MANUFACTURERS)
+        }
+        product.update(search_fields(name))
+        yield product
+
+def generate_users(units, password_hash):
+    now = datetime.utcnow()
+    for unit_id in unit_ids(units):
+        accounts = [(supervisor_username(unit_id), "supervisor")]
+        accounts += [(employee_username(unit_id, i), "employee") for i in range(1, EMPLOYEES_PER_UNIT + 1)]
+        for username, role in accounts:
+            yield {
+                "username": username,
+                "employee_username": username,
+                "password": password_hash,
+                "name": "Bench",
+                "surname": username,
+                "employee_name": f"Bench {username}",
+                "role": role,
+                "unit_id": unit_id,
+                "employee_unit": unit_id,
+                "employee_phone": "",
+                "employee_email": "",
+                "employee_address": "",
+                "last_login": None,
+                "created_at": now,
+                "updated_at": now
+            }
+
+def check_target():
+    """Refuse to seed the production database"""
+    name = db_instance.db.name
+    if name == "LogisticsDB":
+        raise SystemExit("Refusing to seed LogisticsDB: point MONGODB_URI at a benchmark database")
+    return name
+
+def seed(scale, seed_value=42, workers=None, progress=None):
+    """Drop the benchmark database and fill it with a dataset of the given scale
+    ({"units", "products", "transactions", "years"}).
+
+    The catalog and the users are written here; the history, stock and
+    totals of the units by the parallel generator. progress(label, count)
+    is called while the collections are written. Returns the document counts.
+    """
+    rng = random.Random(seed_value)
+    name = check_target()
+    db_instance.client.drop_database(name)
+    db = db_instance.db
+    counts = {}
+
+    initialize_admin()
+    products = list(generate_products(rng, scale["products"]))
+    counts["products_master"] = _insert(db.products_master, products, progress, "products_master")
+    db.counters.update_one({"_id": "product_id"}, {"$set": {"seq": scale["products"]}}, upsert=True)
+
+    password_hash = password_hasher.hash_password(BENCH_PASSWORD)
+    counts["users"] = _insert(db.users, generate_users(scale["units"], password_hash), progress, "users")
+
+    if transaction_model.timeseries:
+        db_instance.create_transactions_timeseries()
+    units = {
+        unit_id: ([employee_username(unit_id, i) for i in range(1, EMPLOYEES_PER_UNIT + 1)], supervisor_username(unit_id))
+        for unit_id in unit_ids(scale["units"])
+    }
+    counts["transactions"] = generator.generate(
+        products, units, scale["transactions"], scale["years"], seed_value, workers,
+        progress=(lambda done, written: progress("transactions", written)) if progress else None
+    )
+    counts["units"] = scale["units"]
+    counts["unit_products"] = scale["units"] * scale["products"]
+    counts["sales_rollups"] = db.sales_rollups.estimated_document_count()
+
+    # Indexes after the bulk load (much faster than maintaining them per insert)
+    db_instance.initialize_indexes()
+    return counts
@@ -0,0 +1,226 @@
+"""
+Parallel generator of the stock and transactions history of the benchmark units
+
+Every unit is generated independently by a worker process, from its own
+random stream, so the output does not depend on the number of workers:
+
+- product popularity follows a Zipf law (a few products sell most),
+- the daily volume follows the season (December peak, quiet weekends)
+  and a yearly growth, and each unit has its own size,
+- sales are shared unevenly among the unit's employees; purchases are
+  restocks made by the supervisor when a sale finds too little stock.
+
+Each unit's history is replayed in time order, the same way
+update_product_quantity applies it. Stock therefore never goes negative,
+and the final unit_products rows (product_quantity, product_unit_gain),
+unit_summaries and sales_rollups match the generated transactions.
+Everything is written with large unordered batches.
+"""
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pymongo import WriteConcern
+from app.database import db_instance
+from app.models import transaction_model
+
+# Documents per insert_many
+GENERATOR_BATCH_SIZE = 20_000
+
+# Zipf exponent of product popularity
+ZIPF_EXPONENT = 1.1
+
+# Daily volume by weekday (Monday first) and yearly growth of the volume
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.05, 1.15, 0.8, 0.25)
+ANNUAL_GROWTH = 0.15
+
+# Opening hours: transactions are timestamped between these hours (UTC)
+OPENING_HOUR, CLOSING_HOUR = 8, 20
+
+# Initial stock per product and size of a restock
+INITIAL_STOCK = (20, 200)
+RESTOCK_LOT = (50, 300)
+
+# Catalog shared with the forked workers: set by generate() before the pool starts
+_catalog = {}
+
+def day_weight(day, first_day):
+    """Relative transaction volume of a day"""
+    season = 1 + 0.25 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 350) / 365.25)
+    growth = (1 + ANNUAL_GROWTH) ** ((day - first_day).days / 365.25)
+    return season * growth * WEEKDAY_WEIGHTS[day.weekday()]
+
+def zipf_cum_weights(count, exponent=ZIPF_EXPONENT):
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+def _cumulative(weights):
+    total = 0.0
+    for weight in weights:
+        total += weight
+        yield total
+
+def _sale_quantity(rng):
+    """Mostly 1-3 items, occasionally a bulk sale"""
+    return min(1 + int(rng.expovariate(0.6)), 50)
+
+class _Writer:
+    """Buffers documents of one collection and inserts them in unordered batches"""
+    def __init__(self, collection, batch_size):
+        self.collection = collection.with_options(write_concern=WriteConcern(w=1, j=False))
+        self.batch_size = batch_size
+        self.buffer = []
+        self.written = 0
+
+    def add(self, document):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.collection.insert_many(self.buffer, ordered=False)
+            self.written += len(self.buffer)
+            self.buffer = []
+
+def generate_unit(unit_id, transactions, employees, supervisor, seed, batch_size):
+    """Generate and write the history, stock, rollups, summary and unit document of one unit.
+
+    Returns the number of transactions written.
+    """
+    catalog = _catalog
+    product_ids, purchase_prices, selling_prices, volumes = (
+        catalog["product_ids"], catalog["purchase_prices"], catalog["selling_prices"], catalog["volumes"])
+    popularity_order, popularity_cum = catalog["popularity_order"], catalog["popularity_cum"]
+    days, day_cum = catalog["days"], catalog["day_cum"]
+    rng = random.Random(f"{seed}:{unit_id}")
+    db = db_instance.db
+
+    stock = [rng.randint(*INITIAL_STOCK) for _ in product_ids]
+    gain = [0.0] * len(product_ids)
+    rollups = {}
+
+    employee_cum = list(_cumulative(rng.paretovariate(1.2) for _ in employees))
+    transactions_writer = _Writer(transaction_model.collection, batch_size)
+
+    # Transactions per day: the unit's total spread by the day weights
+    per_day = [0] * len(days)
+    for day_index in rng.choices(range(len(days)), cum_weights=day_cum, k=transactions):
+        per_day[day_index] += 1
+
+    ranks = range(len(product_ids))
+    for day_index, count in enumerate(per_day):
+        if not count:
+            continue
+        day = days[day_index]
+        seconds = sorted(rng.randint(OPENING_HOUR * 3600, CLOSING_HOUR * 3600 - 1) for _ in range(count))
+        products = rng.choices(ranks, cum_weights=popularity_cum, k=count)
+        sellers = rng.choices(employees, cum_weights=employee_cum, k=count)
+        for second, rank, seller in zip(seconds, products, sellers):
+            p = popularity_order[rank]
+            quantity = _sale_quantity(rng)
+            if stock[p] >= quantity:
+                transaction_type, unit_price, performed_by = "sale", selling_prices[p], seller
+                stock[p] -= quantity
+                gain[p] += quantity * (selling_prices[p] - purchase_prices[p])
+            else:
+                # Not enough stock for the sale: the supervisor restocks instead
+                quantity = max(quantity, rng.randint(*RESTOCK_LOT))
+                transaction_type, unit_price, performed_by = "purchase", purchase_prices[p], supervisor
+                stock[p] += quantity
+            transaction = transaction_model.build_transaction(
+                unit_id, product_ids[p], transaction_type, quantity, unit_price, performed_by,
+                notes="generated", timestamp=day + timedelta(seconds=second)
+            )
+            transactions_writer.add(transaction_model.to_storage(transaction))
+
+            rollup = rollups.setdefault((p, day_index), {})
+            for field, value in ((f"{transaction_type}_count", 1),
+                                 (f"{transaction_type}_quantity", quantity),
+                                 (f"{transaction_type}_amount", transaction["total_amount"])):
+                rollup[field] = rollup.get(field, 0) + value
+    transactions_writer.flush()
+
+    rollups_writer = _Writer(db.sales_rollups, batch_size)
+    for (p, day_index), totals in rollups.items():
+        rollups_writer.add(dict(totals, unit_id=unit_id, product_id=product_ids[p], day=days[day_index]))
+    rollups_writer.flush()
+
+    stock_writer = _Writer(db.unit_products, batch_size)
+    summary = {"realized_gain": 0.0, "stock_cost": 0.0, "potential_revenue": 0.0, "volume_used": 0.0}
+    for p, product_id in enumerate(product_ids):
+        stock_writer.add({
+            "unit_id": unit_id,
+            "product_id": product_id,
+            "product_quantity": stock[p],
+            "product_unit_gain": gain[p]
+        })
+        summary["realized_gain"] += gain[p]
+        summary["stock_cost"] += stock[p] * purchase_prices[p]
+        summary["potential_revenue"] += stock[p] * selling_prices[p]
+        summary["volume_used"] += stock[p] * volumes[p]
+    stock_writer.flush()
+
+    now = datetime.utcnow()
+    db.unit_summaries.insert_one(dict(summary, unit_id=unit_id, updated_at=now))
+    db.units.insert_one({
+        "unit_id": unit_id,
+        "unit_name": f"Αποθήκη {unit_id}",
+        "unit_volume": float(math.ceil(max(summary["volume_used"] * 1.5, 1000))),
+        "created_at": days[0],
+        "updated_at": now
+    })
+    return transactions_writer.written
+
+def generate(products, units, transactions, years, seed=42, workers=None, batch_size=None, progress=None):
+    """Generate the history of all units with a pool of worker processes.
+
+    products: the catalog documents already written to products_master.
+    units: {unit_id: (employee usernames, supervisor username)}.
+    progress(done_units, written_transactions) is called as units finish.
+    Returns the number of transactions written.
+    """
+    rng = random.Random(f"{seed}:catalog")
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [today - timedelta(days=offset) for offset in range(int(years * 365), 0, -1)]
+
+    popularity_order = list(range(len(products)))
+    rng.shuffle(popularity_order)
+    _catalog.update(
+        product_ids=[p["product_id"] for p in products],
+        purchase_prices=[p["product_purchase_price"] for p in products],
+        selling_prices=[p["product_selling_price"] for p in products],
+        volumes=[p["product_volume"] for p in products],
+        popularity_order=popularity_order,
+        popularity_cum=zipf_cum_weights(len(products)),
+        days=days,
+        day_cum=list(_cumulative(day_weight(day, days[0]) for day in days))
+    )
+
+    # Unit sizes vary: a few large warehouses, many small ones
+    unit_ids = sorted(units)
+    sizes = [rng.lognormvariate(0, 0.6) for _ in unit_ids]
+    shares = [int(transactions * size / sum(sizes)) for size in sizes]
+    shares[0] += transactions - sum(shares)
+
+    written = 0
+    done = 0
+    # Forked workers inherit _catalog and open their own MongoDB client
+    with ProcessPoolExecutor(max_workers=workers or multiprocessing.cpu_count(),
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [
+            pool.submit(generate_unit, unit_id, share, units[unit_id][0], units[unit_id][1],
+                        seed, batch_size or GENERATOR_BATCH_SIZE)
+            for unit_id, share in zip(unit_ids, shares)
+        ]
+        for future in as_completed(futures):
+            written += future.result()
+            done += 1
+            if progress:
+                progress(done, written)
+    return written
@@ -0,0 +1,160 @@
+"""
+Benchmark drivers and statistics
+
+Two drivers send the scenario requests: the Flask test client (in-process,
+no network, isolates the cost of the app and the database) and an HTTP
+load generator against a running server (gunicorn, with real concurrency).
+Both read the per-request MongoDB command count from the X-DB-Query-Count
+header (DB_QUERY_HEADER=true on the server).
+"""
+import http.client
+import itertools
+import math
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from app.database import db_instance
+from app.search import normalize_name
+from .scenarios import credentials
+
+# Distinct products the scenarios pick from
+CONTEXT_PRODUCTS = 1000
+
+def load_context():
+    """Units, product ids and search terms of the seeded dataset"""
+    db = db_instance.db
+    unit_ids = sorted(u["unit_id"] for u in db.units.find({}, {"_id": 0, "unit_id": 1}))
+    products = list(db.products_master.find({}, {"_id": 0, "product_id": 1, "product_name": 1})
+                    .sort("product_id", 1).limit(CONTEXT_PRODUCTS))
+    if not unit_ids or not products:
+        raise SystemExit("The benchmark database is empty: run `python -m benchmarks seed` first")
+    # Prefixes of name words, as typed into the search box
+    terms = sorted({normalize_name(word)[:4] for p in products for word in p["product_name"].split() if len(word) >= 4})
+    return {"unit_ids": unit_ids, "product_ids": [p["product_id"] for p in products], "search_terms": terms}
+
+def _query_count(value):
+    return int(value) if value is not None else None
+
+class TestClientDriver:
+    """Sends requests through the Flask test client of an in-process app"""
+    name = "client"
+
+    def __init__(self, app):
+        self.app = app
+
+    def login(self, form):
+        client = self.app.test_client()
+        with client.post('/login', data=form) as response:
+            if response.status_code != 302:
+                raise SystemExit(f"Login failed for {form['username']}")
+
+        def send(method, path, form=None, json_body=None):
+            with client.open(path, method=method, data=form, json=json_body) as response:
+                response.get_data()
+                return response.status_code, _query_count(response.headers.get('X-DB-Query-Count'))
+        return send
+
+class HttpDriver:
+    """Sends requests to a running server, one keep-alive connection per worker"""
+    name = "http"
+
+    def __init__(self, base_url, timeout=60):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+
+    def login(self, form):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        cookies = {}
+
+        def send(method, path, form=None, json_body=None):
+            headers = {}
+            body = None
+            if form is not None:
+                body = urlencode(form)
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            elif json_body is not None:
+                body = json.dumps(json_body)
+                headers["Content-Type"] = "application/json"
+            if cookies:
+                headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()  # reconnects on the next request
+                raise
+            for header in response.headers.get_all("Set-Cookie") or ():
+                name, _, value = header.split(";", 1)[0].partition("=")
+                cookies[name.strip()] = value
+            return response.status, _query_count(response.headers.get('X-DB-Query-Count'))
+
+        status, _ = send("POST", "/login", form)
+        if status != 302:
+            raise SystemExit(f"Login failed for {form['username']}")
+        return send
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies, errors, queries, wall_seconds):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    queries = [q for q in queries if q is not None]
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": errors / count if count else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if count else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if count else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if count else None,
+        "mean_ms": sum(latencies) / count * 1000 if count else None,
+        "throughput_rps": count / wall_seconds if wall_seconds else None,
+        "queries_per_request": sum(queries) / len(queries) if queries else None,
+        "max_queries": max(queries) if queries else None
+    }
+
+def run_scenario(driver, scenario, ctx, requests, concurrency=1, warmup=5, seed=42):
+    """Send `requests` requests of a scenario from `concurrency` logged-in workers"""
+    sessions = [driver.login(credentials(scenario.role, worker, ctx["unit_ids"])) for worker in range(concurrency)]
+    rngs = [random.Random(f"{seed}:{scenario.name}:{worker}") for worker in range(concurrency)]
+
+    for send, rng in zip(sessions, rngs):
+        for _ in range(warmup):
+            send(*scenario.make_request(rng, ctx))
+
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, queries = [], []
+    errors = [0]
+
+    def worker(send, rng):
+        while next(counter) < requests:
+            method, path, form, json_body = scenario.make_request(rng, ctx)
+            started = time.perf_counter()
+            try:
+                status, query_count = send(method, path, form, json_body)
+            except (OSError, http.client.HTTPException):
+                status, query_count = 599, None
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                queries.append(query_count)
+                if status >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(send, rng)) for send, rng in zip(sessions, rngs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], queries, time.perf_counter() - started)
@@ -0,0 +1,71 @@
+"""
+Benchmarked routes
+
+Each scenario is one route driven with its own stream of requests, so its
+latency percentiles are not mixed with other routes. make_request(rng, ctx)
+returns (method, path, form, json) for the next request; ctx holds
+samples of the seeded data (runner.load_context).
+"""
+from urllib.parse import quote
+from .dataset import BENCH_PASSWORD, EMPLOYEES_PER_UNIT, supervisor_username, employee_username
+
+class Scenario:
+    def __init__(self, name, role, make_request):
+        self.name = name
+        self.role = role
+        self.make_request = make_request
+
+def _get(path):
+    return lambda rng, ctx: ("GET", path, None, None)
+
+def _search_term(rng, ctx):
+    return quote(rng.choice(ctx["search_terms"]))
+
+def _order(rng, ctx, lines=3):
+    products = rng.sample(ctx["product_ids"], lines)
+    return {"lines": [{"product_id": product_id, "quantity": 1} for product_id in products], "notes": "benchmark"}
+
+SCENARIOS = [
+    Scenario("admin.dashboard", "admin", _get("/admin/")),
+    Scenario("admin.company_statistics", "admin", _get("/admin/statistics")),
+    Scenario("admin.view_products", "admin", _get("/admin/products")),
+    Scenario("supervisor.unit_statistics", "supervisor", _get("/supervisor/statistics")),
+    Scenario("employee.view_products", "employee", _get("/employee/products")),
+    Scenario("employee.view_products.search", "employee",
+             lambda rng, ctx: ("GET", f"/employee/products?search_name={_search_term(rng, ctx)}", None, None)),
+    Scenario("employee.search_products_api", "employee",
+             lambda rng, ctx: ("GET", f"/employee/search_products?q={_search_term(rng, ctx)}", None, None)),
+    Scenario("employee.view_product_details", "employee",
+             lambda rng, ctx: ("GET", f"/employee/product/{rng.choice(ctx['product_ids'])}", None, None)),
+    Scenario("employee.sell_product", "employee",
+             lambda rng, ctx: ("POST", f"/employee/sell_product/{rng.choice(ctx['product_ids'])}", {"quantity": "1"}, None)),
+    Scenario("supervisor.purchase_product", "supervisor",
+             lambda rng, ctx: ("POST", f"/supervisor/purchase_product/{rng.choice(ctx['product_ids'])}", {"quantity": "1"}, None)),
+    Scenario("employee.create_sale_order", "employee",
+             lambda rng, ctx: ("POST", "/employee/order", None, _order(rng, ctx))),
+    Scenario("supervisor.create_purchase_order", "supervisor",
+             lambda rng, ctx: ("POST", "/supervisor/order", None, _order(rng, ctx))),
+]
+
+def scenario_names():
+    return [scenario.name for scenario in SCENARIOS]
+
+def select(names=None):
+    """Scenarios by name (all of them if names is empty)"""
+    if not names:
+        return list(SCENARIOS)
+    unknown = set(names) - set(scenario_names())
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return [scenario for scenario in SCENARIOS if scenario.name in names]
+
+def credentials(role, worker, unit_ids):
+    """Login form of the seeded user a worker logs in as; workers are spread over the units"""
+    if role == "admin":
+        return {"username": "admin", "password": "admin123"}
+    unit_id = unit_ids[worker % len(unit_ids)]
+    if role == "supervisor":
+        username = supervisor_username(unit_id)
+    else:
+        username = employee_username(unit_id, worker % EMPLOYEES_PER_UNIT + 1)
+    return {"username": username, "password": BENCH_PASSWORD, "unit_id": unit_id}
@@ -0,0 +1,255 @@
+"""
+Concurrency stress test of the sell and purchase paths
+
+Many processes, each with many threads, send sells (as employees) and
+purchases (as the supervisor) of the same few hot products of one unit at
+the same time, through the real routes. Throughput and latency under
+contention are measured, then the database is checked against the
+transactions ledger written during the run:
+
+- final quantity = initial quantity + purchases - sales (no lost updates),
+- no negative stock (no oversell),
+- gain delta = sold quantity x (selling price - purchase price),
+- accepted requests = ledger entries, and the daily rollups and unit
+  summary moved by the same amounts.
+
+Any difference is reported as drift.
+"""
+import http.client
+import math
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.database import db_instance
+from app.models import product_model, unit_summary_model, transaction_model, stock_deltas
+from .dataset import check_target
+from .runner import summarize
+from .scenarios import credentials
+
+# Seconds the workers wait for each other at the start line
+START_TIMEOUT = 120
+
+# Set by run() before the pool starts, inherited by the forked workers
+_plan = {}
+
+def hot_products(unit_id, count):
+    """Master documents of the first `count` products of a unit"""
+    product_ids = [row["product_id"] for row in product_model.unit_products_collection
+                   .find({"unit_id": unit_id}, {"_id": 0, "product_id": 1}).sort("product_id", 1).limit(count)]
+    products = {p["product_id"]: p for p in product_model.master_collection.find({"product_id": {"$in": product_ids}})}
+    return [products[product_id] for product_id in product_ids]
+
+def set_initial_stock(unit_id, products, quantity):
+    """Set the stock of the hot products, keeping the unit summary in step"""
+    for product in products:
+        before = product_model.unit_products_collection.find_one_and_update(
+            {"unit_id": unit_id, "product_id": product["product_id"]},
+            {"$set": {"product_quantity": quantity}}
+        )
+        unit_summary_model.apply_delta(unit_id, stock_deltas(product, quantity - before["product_quantity"]))
+
+def snapshot(unit_id, product_ids):
+    """Stock, gain and rollup totals of the hot products"""
+    rows = {row["product_id"]: row for row in product_model.unit_products_collection.find(
+        {"unit_id": unit_id, "product_id": {"$in": product_ids}})}
+    rollups = {row["_id"]: row for row in db_instance.db.sales_rollups.aggregate([
+        {"$match": {"unit_id": unit_id, "product_id": {"$in": product_ids}}},
+        {"$group": {
+            "_id": "$product_id",
+            "sale_quantity": {"$sum": "$sale_quantity"},
+            "purchase_quantity": {"$sum": "$purchase_quantity"}
+        }}
+    ])}
+    return {
+        product_id: {
+            "quantity": rows[product_id]["product_quantity"],
+            "gain": rows[product_id].get("product_unit_gain", 0.0),
+            "rollup_sale_quantity": rollups.get(product_id, {}).get("sale_quantity", 0),
+            "rollup_purchase_quantity": rollups.get(product_id, {}).get("purchase_quantity", 0)
+        }
+        for product_id in product_ids
+    }
+
+def ledger_totals(unit_id, product_ids):
+    """Count and quantity of the logged sales and purchases, per product"""
+    totals = {product_id: {"sale": [0, 0], "purchase": [0, 0]} for product_id in product_ids}
+    for row in transaction_model.aggregate([
+        {"$match": {"unit_id": unit_id, "product_id": {"$in": product_ids}}},
+        {"$group": {
+            "_id": {"product_id": "$product_id", "transaction_type": "$transaction_type"},
+            "count": {"$sum": 1},
+            "quantity": {"$sum": "$quantity"}
+        }}
+    ]):
+        totals[row["_id"]["product_id"]][row["_id"]["transaction_type"]] = [row["count"], row["quantity"]]
+    return totals
+
+def _worker(process_index, driver, operations):
+    """Run one process of the stress test: its threads share the `operations` budget"""
+    plan = _plan
+    unit_id, product_ids = plan["unit_id"], plan["product_ids"]
+    results = {"sale": [], "purchase": []}
+    counts = {product_id: {"sale": 0, "purchase": 0} for product_id in product_ids}
+    errors = {"sale": 0, "purchase": 0}
+    rejected = {"sale": 0, "purchase": 0}
+    lock = threading.Lock()
+    remaining = [operations]
+
+    workers = [process_index * plan["threads"] + thread_index for thread_index in range(plan["threads"])]
+    try:
+        logins = [{
+            "sale": driver.login(credentials("employee", worker, [unit_id])),
+            "purchase": driver.login(credentials("supervisor", worker, [unit_id]))
+        } for worker in workers]
+    except BaseException:
+        # Don't keep the other processes waiting at the start line
+        plan["barrier"].abort()
+        raise
+
+    def run_thread(worker, sessions):
+        rng = random.Random(f"{plan['seed']}:stress:{worker}")
+        try:
+            plan["barrier"].wait(START_TIMEOUT)
+        except threading.BrokenBarrierError:
+            return
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            transaction_type = "sale" if rng.random() < plan["sale_ratio"] else "purchase"
+            product_id = rng.choice(product_ids)
+            path = (f"/employee/sell_product/{product_id}" if transaction_type == "sale"
+                    else f"/supervisor/purchase_product/{product_id}")
+            form = {"quantity": str(rng.randint(1, plan["max_quantity"]))}
+            started = time.perf_counter()
+            try:
+                status, _ = sessions[transaction_type]("POST", path, form)
+            except (OSError, http.client.HTTPException):
+                status = 599
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[transaction_type].append(elapsed)
+                # The routes redirect on success and render the form again on refusal
+                if status == 302:
+                    counts[product_id][transaction_type] += 1
+                elif status >= 400:
+                    errors[transaction_type] += 1
+                else:
+                    rejected[transaction_type] += 1
+
+    threads = [threading.Thread(target=run_thread, args=args) for args in zip(workers, logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"latencies": results, "accepted": counts, "errors": errors, "rejected": rejected}
+
+def _process(process_index, mode, url, operations):
+    if mode == "http":
+        from .runner import HttpDriver
+        driver = HttpDriver(url)
+    else:
+        from app import create_app
+        from .runner import TestClientDriver
+        driver = TestClientDriver(create_app())
+    return _worker(process_index, driver, operations)
+
+def _close(actual, expected):
+    return math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-6)
+
+def check_invariants(unit_id, products, before, after, ledger, accepted):
+    """Drift between the final state, the initial state and the ledger, as printable strings"""
+    drift = []
+    for product in products:
+        product_id = product["product_id"]
+        start, end, logged = before[product_id], after[product_id], ledger[product_id]
+        (sales, sold), (purchases, bought) = logged["sale"], logged["purchase"]
+
+        expected = start["quantity"] + bought - sold
+        if end["quantity"] != expected:
+            drift.append(f"{product_id}: quantity {end['quantity']}, ledger says {expected} "
+                         f"({end['quantity'] - expected:+d} lost or phantom updates)")
+        if end["quantity"] < 0:
+            drift.append(f"{product_id}: negative stock {end['quantity']} (oversold)")
+
+        margin = product["product_selling_price"] - product["product_purchase_price"]
+        gain = end["gain"] - start["gain"]
+        if not _close(gain, sold * margin):
+            drift.append(f"{product_id}: gain moved by {gain:.2f}, ledger sales are worth {sold * margin:.2f}")
+
+        for transaction_type, logged_count in (("sale", sales), ("purchase", purchases)):
+            if accepted[product_id][transaction_type] != logged_count:
+                drift.append(f"{product_id}: {accepted[product_id][transaction_type]} {transaction_type}s accepted, "
+                             f"{logged_count} in the ledger")
+
+        for field, logged_quantity in (("rollup_sale_quantity", sold), ("rollup_purchase_quantity", bought)):
+            if end[field] - start[field] != logged_quantity:
+                drift.append(f"{product_id}: {field} moved by {end[field] - start[field]}, ledger {logged_quantity}")
+
+    stored = unit_summary_model.get_summary(unit_id)
+    totals = product_model.aggregate_unit_totals([unit_id]).get(unit_id, {})
+    for field in unit_summary_model.FIELDS:
+        if not _close(stored[field], float(totals.get(field, 0.0))):
+            drift.append(f"unit summary {field}: {stored[field]:.2f}, unit_products say {float(totals.get(field, 0.0)):.2f}")
+    return drift
+
+def run(mode="client", url=None, unit_id=None, skus=3, processes=4, threads=8, operations=5000,
+        sale_ratio=0.7, max_quantity=3, initial_stock=None, seed=42):
+    """Run the stress test and check the invariants. Returns the report."""
+    check_target()
+    if unit_id is None:
+        first = db_instance.db.units.find_one({}, {"unit_id": 1}, sort=[("unit_id", 1)])
+        if not first:
+            raise SystemExit("The benchmark database is empty: run `python -m benchmarks seed` first")
+        unit_id = first["unit_id"]
+    products = hot_products(unit_id, skus)
+    product_ids = [p["product_id"] for p in products]
+    if initial_stock is not None:
+        set_initial_stock(unit_id, products, initial_stock)
+
+    # Ledger totals are compared before and after rather than by timestamp,
+    # so the clock of a remote server doesn't matter
+    before = snapshot(unit_id, product_ids)
+    ledger_before = ledger_totals(unit_id, product_ids)
+
+    context = multiprocessing.get_context('fork')
+    _plan.update(
+        unit_id=unit_id, product_ids=product_ids, threads=threads, seed=seed,
+        sale_ratio=sale_ratio, max_quantity=max_quantity,
+        barrier=context.Barrier(processes * threads)
+    )
+    shares = [operations // processes + (1 if i < operations % processes else 0) for i in range(processes)]
+    started = time.perf_counter()
+    # Forked workers open their own MongoDB client
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        outcomes = [future.result() for future in
+                    [pool.submit(_process, i, mode, url, share) for i, share in enumerate(shares)]]
+    wall_seconds = time.perf_counter() - started
+
+    after = snapshot(unit_id, product_ids)
+    ledger_after = ledger_totals(unit_id, product_ids)
+    ledger = {product_id: {transaction_type: [a - b for a, b in zip(totals, ledger_before[product_id][transaction_type])]
+                           for transaction_type, totals in ledger_after[product_id].items()}
+              for product_id in product_ids}
+    accepted = {product_id: {"sale": 0, "purchase": 0} for product_id in product_ids}
+    report = {"unit_id": unit_id, "products": product_ids, "mode": mode,
+              "processes": processes, "threads": threads, "wall_seconds": wall_seconds, "operations": {}}
+    for transaction_type in ("sale", "purchase"):
+        latencies = [latency for outcome in outcomes for latency in outcome["latencies"][transaction_type]]
+        errors = sum(outcome["errors"][transaction_type] for outcome in outcomes)
+        stats = summarize(latencies, errors, [], wall_seconds)
+        stats["rejected"] = sum(outcome["rejected"][transaction_type] for outcome in outcomes)
+        report["operations"][transaction_type] = stats
+    for outcome in outcomes:
+        for product_id, counts in outcome["accepted"].items():
+            for transaction_type, count in counts.items():
+                accepted[product_id][transaction_type] += count
+
+    report["stock"] = {product_id: {"initial": before[product_id]["quantity"], "final": after[product_id]["quantity"],
+                                    "sold": ledger[product_id]["sale"][1], "bought": ledger[product_id]["purchase"][1]}
+                       for product_id in product_ids}
+    report["drift"] = check_invariants(unit_id, products, before, after, ledger, accepted)
+    return report
@@ -0,0 +1,66 @@
+"""
+Gunicorn configuration for the Logistics Warehouse System (production mode)
+
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+Every setting can be overridden from the environment.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Threaded workers: requests mostly wait on MongoDB, so a few threads per
+# worker process keep the cores busy without one process per request
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', str(cores * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# The app is imported once in the master and forked into the workers;
+# post_fork() makes sure no worker reuses the master's Mongo client
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth (caches, fragmentation)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+# Hash passwords inline in the request threads: bcrypt releases the GIL, so
+# the workers' threads already hash on every core, and with more worker
+# processes than cores a per-worker pool would only add processes competing
+# for the same cores. Set HASH_POOL_SIZE to keep bcrypt off the request threads.
+os.environ.setdefault('HASH_POOL_SIZE', '0')
+
+# The workers save their metrics here so /metrics can add them all up
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'wms-metrics'))
+
+def on_starting(server):
+    """Forget the metrics of the workers of a previous run"""
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+def post_fork(server, worker):
+    """Start the worker's bcrypt pool and give it its own MongoDB client.
+
+    The pool forks its processes, so it is started first, while the worker
+    still has a single thread.
+    """
+    from app.security import password_hasher
+    from app.database import db_instance
+    password_hasher.start()
+    db_instance.reset_after_fork()
+
+def worker_exit(server, worker):
+    """Save the final metrics of a worker that is shutting down"""
+    from app.metrics import flush
+    flush()
@@ -0,0 +1,18 @@
+"""
+Shared fixtures: an in-memory MongoDB (mongomock) behind db_instance
+"""
+import pytest
+from app import database
+from app.cache import catalog_cache
+
+@pytest.fixture
+def db(monkeypatch):
+    """Empty in-memory database with the app's indexes, used through db_instance"""
+    mongomock = pytest.importorskip("mongomock")
+    monkeypatch.setattr(database, "MongoClient", mongomock.MongoClient)
+    database.db_instance.reset_after_fork()
+    database.db_instance.initialize_indexes()
+    catalog_cache.clear()
+    yield database.db_instance.db
+    catalog_cache.clear()
+    database.db_instance.reset_after_fork()
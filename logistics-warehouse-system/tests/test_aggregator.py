@@ -0,0 +1,60 @@
+"""
+Change-stream worker: which view keys a change event marks, and what a refresh recomputes
+"""
+from datetime import datetime
+import pytest
+from app.aggregator import Aggregator, month_of, next_month
+
+class RecordingViews:
+    """Stands in for DerivedViews, recording the refreshes"""
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name,) + tuple(sorted(arg) for arg in args))
+
+def _change(collection, operation="insert", **document):
+    change = {"ns": {"db": "LogisticsDB", "coll": collection}, "operationType": operation}
+    if document:
+        change["fullDocument"] = document
+    return change
+
+@pytest.fixture
+def aggregator():
+    return Aggregator(RecordingViews(), interval_ms=0)
+
+def test_month_helpers():
+    assert month_of(datetime(2024, 3, 15, 10)) == datetime(2024, 3, 1)
+    assert next_month(datetime(2024, 12, 1)) == datetime(2025, 1, 1)
+
+def test_mark_collects_keys(aggregator):
+    aggregator.mark(_change("unit_products", "update", product_id="P0001", unit_id="001"))
+    aggregator.mark(_change("products_master", "replace", product_id="P0002"))
+    aggregator.mark(_change("transactions", transaction_type="sale", performed_by="emp", unit_id="001"))
+    aggregator.mark(_change("transactions", transaction_type="purchase", performed_by="sup", unit_id="001"))
+    aggregator.mark(_change("sales_rollups", "update", unit_id="001", day=datetime(2024, 3, 15)))
+
+    assert aggregator.products == {"P0001", "P0002"}
+    assert aggregator.sellers == {("emp", "001")}
+    assert aggregator.months == {("001", datetime(2024, 3, 1))}
+    assert not (aggregator.rebuild_stock or aggregator.rebuild_sellers or aggregator.rebuild_months)
+
+def test_deletes_rebuild_their_view(aggregator):
+    aggregator.mark(_change("unit_products", "delete"))
+    aggregator.mark(_change("sales_rollups", "delete"))
+    assert aggregator.rebuild_stock and aggregator.rebuild_months
+    assert not aggregator.rebuild_sellers
+
+def test_drop_rebuilds_everything(aggregator):
+    aggregator.mark({"operationType": "dropDatabase"})
+    assert aggregator.rebuild_stock and aggregator.rebuild_sellers and aggregator.rebuild_months
+
+def test_refresh_recomputes_marked_keys_and_clears_them(aggregator):
+    aggregator.mark(_change("unit_products", "update", product_id="P0001"))
+    aggregator.mark(_change("transactions", transaction_type="sale", performed_by="emp", unit_id="001"))
+    aggregator.mark(_change("transactions", "delete"))
+
+    aggregator.refresh()
+
+    assert aggregator.views.calls == [("refresh_products", ["P0001"]), ("rebuild_sellers",)]
+    assert not aggregator.dirty
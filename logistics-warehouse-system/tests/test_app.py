@@ -0,0 +1,19 @@
+"""
+Application factory
+"""
+from flask.cli import ScriptInfo
+import app
+from app import create_app
+
+def test_importing_the_package_builds_no_app():
+    assert not hasattr(app, "app")
+    assert not hasattr(app.main, "app")
+
+def test_create_app_builds_independent_apps():
+    first, second = create_app(), create_app()
+    assert first is not second
+    assert "/login" in {rule.rule for rule in first.url_map.iter_rules()}
+    assert "setup-db" in first.cli.commands
+
+def test_flask_cli_target():
+    assert ScriptInfo(app_import_path="app:create_app").load_app().name == create_app().name
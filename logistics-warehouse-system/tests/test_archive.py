@@ -0,0 +1,82 @@
+"""
+Transaction archival: day files, seller totals and re-runs after an interruption
+"""
+import gzip
+import json
+import os
+from datetime import datetime
+import pytest
+from app import archive
+from app.archive import archive_day, archive_transactions, iter_archived_transactions, ArchiveUnsupported
+from app.models import transaction_model
+
+DAY = datetime(2024, 3, 1)
+
+def _ledger():
+    return [
+        transaction_model.build_transaction("001", "P0001", "sale", 2, 15, "emp", timestamp=datetime(2024, 3, 1, 9)),
+        transaction_model.build_transaction("001", "P0002", "sale", 1, 60, "emp", timestamp=datetime(2024, 3, 1, 12)),
+        transaction_model.build_transaction("001", "P0001", "purchase", 5, 10, "sup", timestamp=datetime(2024, 3, 1, 15)),
+        transaction_model.build_transaction("001", "P0001", "sale", 1, 15, "emp", timestamp=datetime(2024, 3, 2, 9))
+    ]
+
+@pytest.fixture
+def ledger(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    transactions = _ledger()
+    db.transactions.insert_many(transactions)
+    return transactions
+
+def _file_ids(tmp_path):
+    with gzip.open(os.path.join(tmp_path, "transactions", "2024", "03", "2024-03-01.jsonl.gz"), 'rt') as f:
+        return [json.loads(line)["_id"] for line in f]
+
+def _seller_sales(db):
+    return [(s["day"], s["performed_by"], s["total_sales"], s["transactions_count"])
+            for s in db.archived_seller_sales.find()]
+
+def test_archive_day(ledger, db, tmp_path):
+    assert archive_day(DAY) == 3
+
+    assert _file_ids(tmp_path) == [str(t["_id"]) for t in ledger[:3]]
+    assert db.transactions.count_documents({}) == 1
+    assert _seller_sales(db) == [(DAY, "emp", 90, 2)]
+    archived = list(iter_archived_transactions(DAY, datetime(2024, 3, 2), transaction_type="sale"))
+    assert [t["product_id"] for t in archived] == ["P0001", "P0002"]
+    assert archived[0]["timestamp"] == datetime(2024, 3, 1, 9)
+
+def test_rerun_after_an_interrupted_delete(ledger, db, tmp_path):
+    archive_day(DAY)
+    # The first run stopped after deleting one transaction
+    db.transactions.insert_many([dict(t) for t in ledger[1:3]])
+
+    assert archive_day(DAY) == 0
+
+    assert _file_ids(tmp_path) == [str(t["_id"]) for t in ledger[:3]]
+    assert db.transactions.count_documents({}) == 1
+    assert _seller_sales(db) == [(DAY, "emp", 90, 2)]
+
+def test_rerun_adds_transactions_that_arrived_later(ledger, db, tmp_path):
+    archive_day(DAY)
+    late = transaction_model.build_transaction("001", "P0001", "sale", 3, 15, "emp", timestamp=datetime(2024, 3, 1, 20))
+    db.transactions.insert_one(late)
+
+    assert archive_day(DAY) == 1
+
+    assert _file_ids(tmp_path) == [str(t["_id"]) for t in ledger[:3]] + [str(late["_id"])]
+    assert _seller_sales(db) == [(DAY, "emp", 135, 3)]
+
+def test_archive_transactions_needs_archive_dir(db, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", "")
+    with pytest.raises(ArchiveUnsupported):
+        archive_transactions(0)
+    assert list(iter_archived_transactions()) == []
+
+def test_archive_transactions(ledger, db, tmp_path):
+    report = archive_transactions(0)
+    assert report["days"] == 2
+    assert report["transactions"] == 4
+    assert db.transactions.count_documents({}) == 0
+    assert transaction_model.archived_before() == report["archived_before"]
+    # The daily rollups of the archived days stay
+    assert db.sales_rollups.count_documents({}) == 3
@@ -0,0 +1,55 @@
+"""
+Catalog cache: LRU eviction, TTL expiry and invalidation on catalog edits
+"""
+from app.cache import LRUCache, catalog_cache
+from app.models import product_model, unit_model
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(ttl=60)
+    cache.put("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+def test_invalidate():
+    cache = LRUCache()
+    cache.put("a", 1)
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+
+def test_update_product_refreshes_cached_entry(db):
+    unit_model.create_unit("Test", 1000.0)
+    product_model.create_product("Chair", 1, 0.1, "Furniture", 10, 15, "ACME")
+    assert product_model.get_master_product("P0001")["product_selling_price"] == 15
+
+    product_model.update_product("P0001", {"product_selling_price": 20})
+
+    assert product_model.get_master_product("P0001")["product_selling_price"] == 20
+
+def test_write_paths_skip_a_stale_entry(db):
+    unit_id = unit_model.create_unit("Test", 1000.0)
+    product_model.create_product("Chair", 1, 0.1, "Furniture", 10, 15, "ACME", initial_quantity=5)
+    # Another worker changed the price; this process still has the old one cached
+    catalog_cache.put("P0001", dict(product_model.get_master_product("P0001"), product_selling_price=1))
+    db.products_master.update_one({"product_id": "P0001"}, {"$set": {"product_selling_price": 15}})
+
+    product_model.update_product_quantity(unit_id, "P0001", 2, "sale")
+
+    unit_product = product_model.unit_products_collection.find_one({"unit_id": unit_id, "product_id": "P0001"})
+    assert unit_product["product_unit_gain"] == 10
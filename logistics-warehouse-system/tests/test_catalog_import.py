@@ -0,0 +1,81 @@
+"""
+Catalog row validation and reading
+"""
+from tempfile import SpooledTemporaryFile
+import pytest
+from app.catalog_import import validate_product_row, detect_format, iter_rows
+
+ROW = {
+    "product_name": " Chair ",
+    "product_weight": "1.5",
+    "product_volume": "0.2",
+    "product_category": "Furniture",
+    "product_purchase_price": "10",
+    "product_selling_price": 15,
+    "product_manufacturer": "ACME"
+}
+
+def test_valid_new_product():
+    product_id, product_data, initial_quantity = validate_product_row(ROW)
+    assert product_id is None
+    assert initial_quantity == 0
+    assert product_data == {
+        "product_name": "Chair",
+        "product_category": "Furniture",
+        "product_manufacturer": "ACME",
+        "product_weight": 1.5,
+        "product_volume": 0.2,
+        "product_purchase_price": 10.0,
+        "product_selling_price": 15.0
+    }
+
+def test_valid_update_with_quantity():
+    product_id, _, initial_quantity = validate_product_row(dict(ROW, product_id=" P0003 ", initial_quantity="7"))
+    assert product_id == "P0003"
+    assert initial_quantity == 7
+
+@pytest.mark.parametrize("changes, message", [
+    ({"product_name": "  "}, "missing product_name"),
+    ({"product_manufacturer": None}, "missing product_manufacturer"),
+    ({"product_weight": "heavy"}, "invalid product_weight"),
+    ({"product_volume": None}, "invalid product_volume"),
+    ({"product_selling_price": "-1"}, "negative product_selling_price"),
+    ({"initial_quantity": "1.5"}, "invalid initial_quantity"),
+    ({"initial_quantity": -2}, "negative initial_quantity")
+])
+def test_invalid_rows(changes, message):
+    with pytest.raises(ValueError, match=message):
+        validate_product_row(dict(ROW, **changes))
+
+def test_detect_format():
+    assert detect_format("catalog.CSV") == "csv"
+    assert detect_format("catalog.jsonl") == "jsonl"
+    assert detect_format("catalog.ndjson") == "jsonl"
+
+def test_iter_rows_from_an_upload():
+    # Uploads arrive as spooled temporary files (no readable() on Python 3.9)
+    upload = SpooledTemporaryFile()
+    upload.write("product_name,product_weight\r\nΚαρέκλα,1\r\n\"Τραπέζι, μεγάλο\",5\r\n".encode('utf-8-sig'))
+    upload.seek(0)
+    assert [row for _, row in iter_rows(upload, 'csv')] == [
+        {"product_name": "Καρέκλα", "product_weight": "1"},
+        {"product_name": "Τραπέζι, μεγάλο", "product_weight": "5"}
+    ]
+
+def test_iter_rows_splits_only_on_newlines():
+    upload = SpooledTemporaryFile()
+    upload.write('product_name,product_weight\nA\u2028B,1\n"Two\nlines",2\n'.encode('utf-8'))
+    upload.seek(0)
+    assert list(iter_rows(upload, 'csv')) == [
+        (2, {"product_name": "A\u2028B", "product_weight": "1"}),
+        (4, {"product_name": "Two\nlines", "product_weight": "2"})
+    ]
+
+def test_iter_rows_jsonl():
+    upload = SpooledTemporaryFile()
+    upload.write('{"product_name": "A B"}\r\n\n{"product_name": "C"}\nnot json\n'.encode('utf-8-sig'))
+    upload.seek(0)
+    rows = list(iter_rows(upload, 'jsonl'))
+    assert rows[:2] == [(1, {"product_name": "A B"}), (3, {"product_name": "C"})]
+    assert rows[2][0] == 4 and isinstance(rows[2][1], ValueError)
+    assert not upload.closed
@@ -0,0 +1,57 @@
+"""
+Streaming transactions export
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from app import export
+from app.export import transactions_query, iter_lines, stream_transactions_export, export_filename, EXPORT_FIELDS
+from app.models import transaction_model
+
+def test_transactions_query():
+    assert transactions_query() == {}
+    assert transactions_query("001", datetime(2024, 3, 1), datetime(2024, 4, 1), "sale") == {
+        "unit_id": "001",
+        "transaction_type": "sale",
+        "timestamp": {"$gte": datetime(2024, 3, 1), "$lt": datetime(2024, 4, 1)}
+    }
+
+def test_export_filename():
+    assert export_filename() == "transactions.csv"
+    assert export_filename("jsonl", True, "001") == "transactions_001.jsonl.gz"
+
+def _row(n):
+    return dict({field: None for field in EXPORT_FIELDS}, timestamp=datetime(2024, 3, 1, 9, n),
+                product_id=f"P{n:04d}", product_name="Καρέκλα, μεγάλη", quantity=n)
+
+def test_csv_lines_are_chunked(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 100)
+    chunks = list(iter_lines((_row(n) for n in range(10)), 'csv'))
+    assert len(chunks) > 1
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == 10
+    assert rows[3]["timestamp"] == "2024-03-01T09:03:00"
+    assert rows[3]["product_name"] == "Καρέκλα, μεγάλη"
+
+def test_jsonl_lines():
+    lines = "".join(iter_lines([_row(1)], 'jsonl')).splitlines()
+    assert json.loads(lines[0])["product_name"] == "Καρέκλα, μεγάλη"
+
+def test_gzip_export_from_the_ledger(db):
+    db.units.insert_one({"unit_id": "001", "unit_name": "Κεντρική"})
+    db.products_master.insert_one({"product_id": "P0001", "product_name": "Chair"})
+    transaction_model.record_transactions([
+        transaction_model.build_transaction("001", "P0001", "sale", 2, 15, "emp", timestamp=datetime(2024, 3, 2)),
+        transaction_model.build_transaction("001", "P0009", "purchase", 1, 10, "sup", timestamp=datetime(2024, 3, 1))
+    ])
+
+    data = b"".join(stream_transactions_export({}, 'jsonl', compress=True, batch_size=1))
+
+    rows = [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines()]
+    assert [(row["product_id"], row["product_name"], row["unit_name"]) for row in rows] == [
+        ("P0009", "", "Κεντρική"),
+        ("P0001", "Chair", "Κεντρική")
+    ]
+    assert rows[1]["total_amount"] == 30
@@ -0,0 +1,77 @@
+"""
+Prometheus metrics: histograms, merging the samples of several workers, /metrics access
+"""
+import json
+import os
+from app import create_app, metrics
+from app.metrics import Histogram, Samples, render_prometheus
+
+def test_histogram_is_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.snapshot() == {"buckets": [("0.1", 2), ("1.0", 3), ("+Inf", 4)], "count": 4, "sum": 3.65}
+
+def _worker(requests, in_flight, duration):
+    samples = Samples()
+    samples.family("requests_total", "counter", "Requests")
+    samples.add("requests_total", requests, endpoint="login", method="POST")
+    samples.family("in_flight", "gauge", "Jobs in flight")
+    samples.add("in_flight", in_flight)
+    histogram = Histogram(buckets=(1.0,))
+    histogram.observe(duration)
+    samples.family("duration_seconds", "histogram", "Latency")
+    samples.histogram("duration_seconds", histogram.snapshot(), endpoint="login")
+    return samples
+
+def _values(samples):
+    return {(name, suffix, tuple(map(tuple, labels))): value
+            for name, family in samples.families.items() for suffix, labels, value in family["samples"]}
+
+def test_merge_adds_matching_samples():
+    merged = _worker(3, 1, 0.5)
+    # Through JSON, as the other workers' samples are read from METRICS_DIR
+    merged.merge(Samples(json.loads(json.dumps(_worker(4, 2, 2.0).families))))
+    values = _values(merged)
+    assert values[("requests_total", "", (("endpoint", "login"), ("method", "POST")))] == 7
+    assert values[("in_flight", "", ())] == 3
+    assert values[("duration_seconds", "_bucket", (("endpoint", "login"), ("le", "1.0")))] == 1
+    assert values[("duration_seconds", "_bucket", (("endpoint", "login"), ("le", "+Inf")))] == 2
+    assert values[("duration_seconds", "_count", (("endpoint", "login"),))] == 2
+
+def test_merge_keeps_new_label_sets_and_skips_dead_gauges():
+    merged = _worker(3, 1, 0.5)
+    other = Samples()
+    other.family("requests_total", "counter", "Requests")
+    other.add("requests_total", 2, endpoint="logout", method="GET")
+    other.family("in_flight", "gauge", "Jobs in flight")
+    other.add("in_flight", 5)
+    merged.merge(other, gauges=False)
+    values = _values(merged)
+    assert values[("requests_total", "", (("endpoint", "logout"), ("method", "GET")))] == 2
+    assert values[("in_flight", "", ())] == 1
+
+def test_render_sums_saved_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "collect", lambda: _worker(3, 1, 0.5))
+    with open(os.path.join(tmp_path, "999999999.json"), 'w') as sample_file:
+        json.dump(_worker(4, 2, 2.0).families, sample_file)
+    monkeypatch.setattr(metrics, "_alive", lambda pid: False)
+
+    text = render_prometheus()
+
+    assert 'requests_total{endpoint="login",method="POST"} 7' in text
+    assert "in_flight 1" in text
+    assert "# TYPE duration_seconds histogram" in text
+
+def test_metrics_endpoint_access(monkeypatch):
+    client = create_app().test_client()
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics, "METRICS_PUBLIC", False)
+    assert client.get("/metrics").status_code == 403
+
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert b"wms_http_requests_total" in response.data
@@ -0,0 +1,83 @@
+"""
+Order lines parsing and the all-or-nothing order path without MongoDB transactions
+"""
+import pytest
+from app.models import ProductModel, product_model, unit_model, unit_summary_model, MAX_ORDER_LINES
+
+def test_parse_order_lines():
+    lines = ProductModel.parse_order_lines([
+        {"product_id": "P0001", "quantity": 2},
+        {"product_id": "P0002", "quantity": "3"}
+    ])
+    assert lines == [("P0001", 2), ("P0002", 3)]
+
+@pytest.mark.parametrize("raw_lines", [
+    None,
+    [],
+    {"product_id": "P0001", "quantity": 1},
+    [{"quantity": 1}],
+    ["P0001"],
+    [{"product_id": "P0001", "quantity": 0}],
+    [{"product_id": "P0001", "quantity": -1}],
+    [{"product_id": "P0001", "quantity": 1.5}],
+    [{"product_id": "P0001", "quantity": True}],
+    [{"product_id": "P0001", "quantity": "two"}],
+    [{"product_id": "P0001"}],
+    [{"product_id": "P0001", "quantity": 1}] * (MAX_ORDER_LINES + 1)
+])
+def test_parse_order_lines_rejects(raw_lines):
+    with pytest.raises(ValueError):
+        ProductModel.parse_order_lines(raw_lines)
+
+@pytest.fixture
+def unit(db):
+    """A unit holding P0001 (10 pieces) and P0002 (1 piece)"""
+    unit_id = unit_model.create_unit("Test", 1000.0)
+    product_model.create_product("Chair", 1, 0.1, "Furniture", 10, 15, "ACME", initial_quantity=10)
+    product_model.create_product("Table", 5, 0.5, "Furniture", 40, 60, "ACME", initial_quantity=1)
+    return unit_id
+
+def _quantities(unit_id):
+    return {up["product_id"]: up["product_quantity"]
+            for up in product_model.unit_products_collection.find({"unit_id": unit_id})}
+
+def _stale_stock(monkeypatch, stock):
+    """Make the up-front stock check see `stock`, as if it was read before a concurrent change"""
+    unit_stock = product_model._unit_stock
+    calls = []
+    def stale(unit_id, product_ids):
+        calls.append(unit_id)
+        return dict(stock) if len(calls) == 1 else unit_stock(unit_id, product_ids)
+    monkeypatch.setattr(product_model, "_unit_stock", stale)
+
+def test_order_applies_all_lines(unit, db):
+    result = product_model.process_order(unit, [("P0001", 3), ("P0002", 1), ("P0001", 2)], "sale", "emp")
+    assert result["errors"] == []
+    assert len(result["transaction_ids"]) == 2
+    assert _quantities(unit) == {"P0001": 5, "P0002": 0}
+    assert db.transactions.count_documents({}) == 2
+
+def test_rejected_order_rolls_back_applied_lines(unit, db, monkeypatch):
+    summary = unit_summary_model.get_summary(unit)
+    _stale_stock(monkeypatch, {"P0001": 10, "P0002": 5})
+
+    result = product_model.process_order(unit, [("P0001", 3), ("P0002", 2)], "sale", "emp")
+
+    assert result["transaction_ids"] == []
+    assert result["errors"] == [{"product_id": "P0002", "error": "insufficient_stock", "available": 1}]
+    assert _quantities(unit) == {"P0001": 10, "P0002": 1}
+    assert product_model.unit_products_collection.find_one({"product_id": "P0001"})["product_unit_gain"] == 0.0
+    assert db.transactions.count_documents({}) == 0
+    assert unit_summary_model.get_summary(unit) == summary
+
+def test_rejected_order_removes_upserted_rows(unit, db, monkeypatch):
+    # P0002 was removed from the unit after the stock check
+    product_model.unit_products_collection.delete_one({"unit_id": unit, "product_id": "P0002"})
+    _stale_stock(monkeypatch, {"P0001": 10, "P0002": 1})
+
+    # First line, so the upsert is reported at index 0 (mongomock reports every upsert there)
+    result = product_model.process_order(unit, [("P0002", 1), ("P0001", 1)], "purchase", "sup")
+
+    assert result["errors"] == [{"product_id": "P0002", "error": "not_in_unit"}]
+    assert _quantities(unit) == {"P0001": 10}
+    assert db.transactions.count_documents({}) == 0
@@ -0,0 +1,79 @@
+"""
+Keyset pagination helpers and the bounded walk of catalog-sorted pages
+"""
+import pytest
+from app import models
+from app.models import product_model, unit_model
+from app.pagination import encode_cursor, decode_cursor, keyset_filter, build_page
+
+def test_cursor_round_trip():
+    token = encode_cursor("next", ["Καρέκλα", "P0007"])
+    assert decode_cursor(token) == ("next", ["Καρέκλα", "P0007"])
+    assert decode_cursor(encode_cursor("prev", [12.5, "P0001"])) == ("prev", [12.5, "P0001"])
+
+def test_invalid_cursors_start_from_the_first_page():
+    for token in ("", "not base64!", encode_cursor("sideways", ["a", "P0001"]),
+                  encode_cursor("next", ["only one"]), encode_cursor("next", "P0001")):
+        assert decode_cursor(token) == ("next", None)
+
+def test_keyset_filter_by_product_id():
+    assert keyset_filter("product_id", 1, [None, "P0005"]) == {"product_id": {"$gt": "P0005"}}
+    assert keyset_filter("product_id", -1, [None, "P0005"]) == {"product_id": {"$lt": "P0005"}}
+
+def test_keyset_filter_breaks_ties_on_product_id():
+    assert keyset_filter("product_name", 1, ["Chair", "P0005"]) == {"$or": [
+        {"product_name": {"$gt": "Chair"}},
+        {"product_name": "Chair", "product_id": {"$gt": "P0005"}}
+    ]}
+    assert keyset_filter("product_quantity", -1, [3, "P0005"]) == {"$or": [
+        {"product_quantity": {"$lt": 3}},
+        {"product_quantity": 3, "product_id": {"$lt": "P0005"}}
+    ]}
+
+def _rows(*ids):
+    return [{"product_id": product_id, "product_name": f"Name {product_id}"} for product_id in ids]
+
+def test_build_page_next():
+    page = build_page(_rows("P1", "P2", "P3"), "product_name", 1, 2, "next", False)
+    assert [row["product_id"] for row in page["items"]] == ["P1", "P2"]
+    assert decode_cursor(page["next_cursor"]) == ("next", ["Name P2", "P2"])
+    assert page["prev_cursor"] is None
+
+def test_build_page_prev_flips_rows():
+    page = build_page(_rows("P3", "P2"), "product_name", -1, 2, "prev", True)
+    assert [row["product_id"] for row in page["items"]] == ["P2", "P3"]
+    assert decode_cursor(page["next_cursor"]) == ("next", ["Name P3", "P3"])
+    assert page["prev_cursor"] is None
+
+def test_build_page_resumes_a_partial_scan():
+    page = build_page(_rows("P1"), "product_name", 1, 2, "next", False, resume_key=["Name P9", "P9"])
+    assert page["partial"] == "next"
+    assert decode_cursor(page["next_cursor"]) == ("next", ["Name P9", "P9"])
+
+@pytest.fixture
+def catalog(db):
+    """A unit holding only the last 2 of 12 products in name order"""
+    unit_id = unit_model.create_unit("Test", 1000.0)
+    for n in range(12):
+        product_model.create_product(f"Item {n:02d}", 1, 0.1, "Misc", 1, 2, "ACME")
+    db.unit_products.delete_many({"product_id": {"$nin": ["P0011", "P0012"]}})
+    return unit_id
+
+def test_master_sorted_pages_skip_products_outside_the_unit(catalog):
+    page = product_model.get_products_page(catalog, sort_params={'field': 'product_name', 'order': 1}, page_size=5)
+    assert [row["product_id"] for row in page["items"]] == ["P0011", "P0012"]
+    assert page["next_cursor"] is None
+
+def test_master_sorted_walk_is_bounded(catalog, monkeypatch):
+    monkeypatch.setattr(models, "KEYSET_MAX_BATCHES", 2)
+    sort_params = {'field': 'product_name', 'order': 1}
+
+    # Two batches of 3 rows (page_size + 1) scan 6 products, none held by the unit
+    page = product_model.get_products_page(catalog, sort_params=sort_params, page_size=2)
+    assert page["items"] == []
+    assert page["partial"] == "next"
+    assert decode_cursor(page["next_cursor"]) == ("next", ["Item 05", "P0006"])
+
+    page = product_model.get_products_page(catalog, sort_params=sort_params, page_size=2,
+                                           cursor=page["next_cursor"])
+    assert [row["product_id"] for row in page["items"]] == ["P0011", "P0012"]
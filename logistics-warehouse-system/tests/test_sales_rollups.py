@@ -0,0 +1,76 @@
+"""
+Daily sales rollups: incremental updates and the rebuild from the ledger
+"""
+from datetime import datetime
+from app.init_db import initialize_database
+from app.models import transaction_model, sales_rollup_model
+
+def _transaction(product_id, transaction_type, quantity, unit_price, timestamp, unit_id="001"):
+    return transaction_model.build_transaction(unit_id, product_id, transaction_type, quantity, unit_price,
+                                               "emp", timestamp=timestamp)
+
+LEDGER = [
+    _transaction("P0001", "sale", 2, 15, datetime(2024, 3, 1, 9)),
+    _transaction("P0001", "sale", 1, 15, datetime(2024, 3, 1, 18)),
+    _transaction("P0001", "purchase", 5, 10, datetime(2024, 3, 1, 12)),
+    _transaction("P0002", "sale", 1, 60, datetime(2024, 3, 2, 10)),
+    _transaction("P0001", "sale", 4, 15, datetime(2024, 4, 15, 10))
+]
+
+def _rollups(db):
+    return {(r["product_id"], r["day"]): {k: v for k, v in r.items() if k.startswith(("sale_", "purchase_"))}
+            for r in db.sales_rollups.find()}
+
+def test_record_many_groups_by_unit_product_and_day(db):
+    sales_rollup_model.record_many(LEDGER[:3])
+    assert _rollups(db) == {("P0001", datetime(2024, 3, 1)): {
+        "sale_count": 2, "sale_quantity": 3, "sale_amount": 45,
+        "purchase_count": 1, "purchase_quantity": 5, "purchase_amount": 50
+    }}
+
+def test_record_and_record_many_agree(db):
+    for transaction in LEDGER:
+        sales_rollup_model.record(transaction)
+    one_by_one = _rollups(db)
+    db.sales_rollups.delete_many({})
+    sales_rollup_model.record_many(LEDGER)
+    assert _rollups(db) == one_by_one
+
+def test_backfill_rebuilds_from_the_ledger(db):
+    db.transactions.insert_many([dict(t) for t in LEDGER])
+    sales_rollup_model.record_many(LEDGER)
+    expected = _rollups(db)
+    # Drifted and stray rollups are replaced
+    db.sales_rollups.update_many({}, {"$inc": {"sale_count": 7}})
+    db.sales_rollups.insert_one({"unit_id": "001", "product_id": "P0009", "day": datetime(2024, 3, 5), "sale_count": 1})
+
+    assert sales_rollup_model.backfill() == 3
+
+    assert {key: {k: v for k, v in value.items() if v} for key, value in _rollups(db).items()} == expected
+
+def test_backfill_range_keeps_other_days(db):
+    db.transactions.insert_many([dict(t) for t in LEDGER])
+    sales_rollup_model.record_many(LEDGER)
+    db.sales_rollups.update_many({}, {"$inc": {"sale_count": 7}})
+
+    sales_rollup_model.backfill(datetime(2024, 3, 1), datetime(2024, 3, 2))
+
+    counts = {key: value["sale_count"] for key, value in _rollups(db).items()}
+    assert counts == {
+        ("P0001", datetime(2024, 3, 1)): 2,
+        ("P0002", datetime(2024, 3, 2)): 8,
+        ("P0001", datetime(2024, 4, 15)): 8
+    }
+
+def test_monthly_totals(db):
+    sales_rollup_model.record_many(LEDGER)
+    totals = sales_rollup_model.get_monthly_totals(datetime(2024, 1, 1), datetime(2024, 12, 31))
+    assert totals == {
+        "2024-03": {"amount": 105, "quantity": 4, "count": 3},
+        "2024-04": {"amount": 60, "quantity": 4, "count": 1}
+    }
+
+def test_setup_db_builds_missing_rollups(db):
+    db.transactions.insert_many([dict(t) for t in LEDGER])
+    assert initialize_database()
+    assert len(_rollups(db)) == 3
@@ -0,0 +1,31 @@
+"""
+Product name normalization and n-grams
+"""
+from app.search import normalize_name, name_ngrams, query_ngrams, search_fields
+
+def test_normalize_name_folds_case_and_accents():
+    assert normalize_name("Καρέκλα") == normalize_name("ΚΑΡΕΚΛΑ") == "καρεκλα"
+    assert normalize_name("Ϊ ϋ") == "ι υ"
+    assert normalize_name("Café  Crème ") == "cafe creme"
+
+def test_normalize_name_folds_final_sigma():
+    assert normalize_name("Ράφος") == normalize_name("ΡΑΦΟΣ")
+
+def test_query_ngrams_uses_the_longest_size():
+    assert query_ngrams("καρ") == ["καρ"]
+    assert query_ngrams("καρε") == ["αρε", "καρ"]
+
+def test_query_ngrams_of_short_words():
+    assert query_ngrams("κα") == ["κα"]
+    assert query_ngrams("κ") == []
+    assert query_ngrams("κ κα") == ["κα"]
+
+def test_query_ngrams_are_a_subset_of_matching_names():
+    name = normalize_name("Μεταλλική Καρέκλα Γραφείου")
+    for query in ("καρεκ", "γραφ", "λλι", "ρα"):
+        assert set(query_ngrams(normalize_name(query))) <= set(name_ngrams(name))
+
+def test_search_fields():
+    fields = search_fields("Καρέκλα Α")
+    assert fields["product_name_normalized"] == "καρεκλα α"
+    assert "ρεκ" in fields["product_name_ngrams"]
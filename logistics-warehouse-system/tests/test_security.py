@@ -0,0 +1,48 @@
+"""
+bcrypt pool: queue limit, timeouts and rehash detection
+"""
+import time
+import pytest
+from app.security import PasswordHasher, HashingUnavailable
+
+def test_inline_hash_and_check():
+    hasher = PasswordHasher(rounds=4, pool_size=0)
+    hashed = hasher.hash_password("secret")
+    assert hasher.check_password("secret", hashed)
+    assert not hasher.check_password("wrong", hashed)
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(rounds=5).needs_rehash(hashed)
+    assert hasher.stats()["hash_latency"]["count"] == 3
+
+def test_full_queue_is_rejected_at_once():
+    hasher = PasswordHasher(rounds=4, pool_size=0, queue_limit=1)
+    hasher._slots.acquire()  # a job in flight
+    with pytest.raises(HashingUnavailable, match="queue is full"):
+        hasher.hash_password("secret")
+    assert hasher.stats()["rejected"] == 1
+    hasher._slots.release()
+    assert hasher.hash_password("secret")
+
+def test_timed_out_job_keeps_its_slot_until_it_ends():
+    hasher = PasswordHasher(rounds=4, pool_size=1, queue_limit=1, timeout=0.2)
+    hasher.start()
+    with pytest.raises(HashingUnavailable, match="timed out"):
+        hasher._run(time.sleep, 1)
+    assert hasher.stats()["timeouts"] == 1
+    assert hasher.stats()["in_flight"] == 1
+    with pytest.raises(HashingUnavailable, match="queue is full"):
+        hasher.hash_password("secret")
+
+    deadline = time.time() + 5
+    while hasher.stats()["in_flight"] and time.time() < deadline:
+        time.sleep(0.05)
+    assert hasher.stats()["in_flight"] == 0
+    assert hasher.check_password("secret", hasher.hash_password("secret"))
+    hasher._executor.shutdown()
+
+def test_start_launches_the_workers():
+    hasher = PasswordHasher(rounds=4, pool_size=2)
+    hasher.start()
+    assert len(hasher._executor._processes) == 2
+    hasher._executor.shutdown()
+    assert PasswordHasher(pool_size=0).start() is None
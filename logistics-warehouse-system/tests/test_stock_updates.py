@@ -0,0 +1,44 @@
+"""
+Conditional stock updates: sales never take a unit below zero
+"""
+import pytest
+from app.models import product_model, unit_model
+
+@pytest.fixture
+def unit(db):
+    """A unit holding 5 pieces of P0001 (bought at 10, sold at 15)"""
+    unit_id = unit_model.create_unit("Test", 1000.0)
+    product_model.create_product("Chair", 1, 0.1, "Furniture", 10, 15, "ACME", initial_quantity=5)
+    return unit_id
+
+def _unit_product(unit_id):
+    return product_model.unit_products_collection.find_one({"unit_id": unit_id, "product_id": "P0001"})
+
+def test_sale_decrements_stock_and_adds_gain(unit):
+    updated = product_model.update_product_quantity(unit, "P0001", 3, "sale")
+    assert updated["product_quantity"] == 2
+    assert updated["product_unit_gain"] == 15
+    assert _unit_product(unit)["product_quantity"] == 2
+
+def test_sale_of_the_whole_stock(unit):
+    assert product_model.update_product_quantity(unit, "P0001", 5, "sale")
+    assert _unit_product(unit)["product_quantity"] == 0
+
+def test_oversell_is_rejected(unit):
+    assert product_model.update_product_quantity(unit, "P0001", 6, "sale") is None
+    unit_product = _unit_product(unit)
+    assert unit_product["product_quantity"] == 5
+    assert unit_product["product_unit_gain"] == 0
+
+def test_rejected_sale_is_not_recorded(unit, db):
+    assert product_model.process_transaction(unit, "P0001", "sale", 6, "emp") is None
+    assert db.transactions.count_documents({}) == 0
+
+def test_purchase_increments_stock(unit, db):
+    assert product_model.process_transaction(unit, "P0001", "purchase", 4, "sup")
+    assert _unit_product(unit)["product_quantity"] == 9
+    assert db.transactions.count_documents({}) == 1
+
+def test_unknown_product_or_unit(unit):
+    assert product_model.update_product_quantity(unit, "P9999", 1, "sale") is None
+    assert product_model.update_product_quantity("999", "P0001", 1, "sale") is None
@@ -0,0 +1,52 @@
+"""
+Mapping between the flat transaction layout and the time-series layout
+"""
+from datetime import datetime
+import pytest
+from app.models import TransactionModel
+
+TRANSACTION = TransactionModel.build_transaction("001", "P0001", "sale", 2, 15, "emp", timestamp=datetime(2024, 3, 1))
+
+@pytest.fixture
+def timeseries():
+    model = TransactionModel()
+    model.timeseries = True
+    return model
+
+def test_timeseries_document_moves_meta_fields():
+    document = TransactionModel.timeseries_document(TRANSACTION)
+    assert document["meta"] == {"unit_id": "001", "product_id": "P0001", "transaction_type": "sale"}
+    assert "unit_id" not in document
+    assert document["timestamp"] == datetime(2024, 3, 1)
+    assert document["performed_by"] == "emp"
+
+def test_from_storage_round_trip():
+    assert TransactionModel.from_storage(TransactionModel.timeseries_document(TRANSACTION)) == TRANSACTION
+    # Flat documents are returned as they are
+    assert TransactionModel.from_storage(dict(TRANSACTION)) == TRANSACTION
+
+def test_storage_query_maps_meta_fields(timeseries):
+    query = {
+        "unit_id": "001",
+        "timestamp": {"$gte": datetime(2024, 3, 1)},
+        "$or": [{"transaction_type": "sale"}, {"performed_by": "emp"}]
+    }
+    assert timeseries.storage_query(query) == {
+        "meta.unit_id": "001",
+        "timestamp": {"$gte": datetime(2024, 3, 1)},
+        "$or": [{"meta.transaction_type": "sale"}, {"performed_by": "emp"}]
+    }
+
+def test_storage_query_flat_layout():
+    model = TransactionModel()
+    model.timeseries = False
+    query = {"unit_id": "001"}
+    assert model.storage_query(query) is query
+
+def test_timeseries_ledger_reads_back_flat(db, timeseries):
+    timeseries.record_transactions([dict(TRANSACTION)])
+    stored = db.transactions_ts.find_one()
+    assert stored["meta"]["unit_id"] == "001"
+    assert [dict(t, _id=None) for t in timeseries.iter_transactions({"unit_id": "001"})] == [
+        dict(TRANSACTION, _id=None)
+    ]
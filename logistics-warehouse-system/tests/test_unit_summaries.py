@@ -0,0 +1,88 @@
+"""
+Unit summaries: $inc deltas on stock changes and creation of missing summaries
+"""
+import pytest
+from app.models import product_model, unit_model, unit_summary_model
+
+@pytest.fixture
+def unit(db):
+    """A unit holding 10 pieces of P0001 (volume 0.1, bought at 10, sold at 15)"""
+    unit_id = unit_model.create_unit("Test", 1000.0)
+    product_model.create_product("Chair", 1, 0.1, "Furniture", 10, 15, "ACME", initial_quantity=10)
+    return unit_id
+
+def _totals(summary):
+    return {field: pytest.approx(summary[field]) for field in unit_summary_model.FIELDS}
+
+def test_new_product_stock_is_counted(unit):
+    assert _totals(unit_summary_model.get_summary(unit)) == {
+        "realized_gain": 0.0, "stock_cost": 100.0, "potential_revenue": 150.0, "volume_used": 1.0
+    }
+
+def test_sale_and_purchase_increment_the_summary(unit):
+    product_model.process_transaction(unit, "P0001", "sale", 4, "emp")
+    product_model.process_transaction(unit, "P0001", "purchase", 2, "sup")
+    assert _totals(unit_summary_model.get_summary(unit)) == {
+        "realized_gain": 20.0, "stock_cost": 80.0, "potential_revenue": 120.0, "volume_used": 0.8
+    }
+
+def test_price_change_revalues_stock(unit):
+    product_model.update_product("P0001", {"product_purchase_price": 12, "product_selling_price": 20})
+    summary = unit_summary_model.get_summary(unit)
+    assert summary["stock_cost"] == pytest.approx(120.0)
+    assert summary["potential_revenue"] == pytest.approx(200.0)
+
+def _aggregated(monkeypatch, totals):
+    """Stand in for the unit_products aggregation (mongomock has no $mergeObjects)"""
+    monkeypatch.setattr(product_model, "aggregate_unit_totals",
+                        lambda unit_ids=None: {uid: totals[uid] for uid in (unit_ids or totals) if uid in totals})
+
+def test_missing_summary_is_created_on_read(unit, db, monkeypatch):
+    _aggregated(monkeypatch, {unit: {"realized_gain": 20.0, "stock_cost": 60.0,
+                                     "potential_revenue": 90.0, "volume_used": 0.6}})
+    db.unit_summaries.delete_many({})
+
+    summary = unit_summary_model.get_summary(unit)
+
+    assert summary["realized_gain"] == 20.0
+    assert db.unit_summaries.count_documents({"unit_id": unit}) == 1
+    # Stored, so later stock changes are applied to it
+    product_model.process_transaction(unit, "P0001", "sale", 1, "emp")
+    assert unit_summary_model.get_summary(unit)["realized_gain"] == pytest.approx(25.0)
+
+def test_create_missing_keeps_existing_summaries(unit, db, monkeypatch):
+    _aggregated(monkeypatch, {})
+    other = unit_model.create_unit("Other", 500.0)
+    db.unit_summaries.delete_one({"unit_id": other})
+    db.unit_summaries.update_one({"unit_id": unit}, {"$set": {"realized_gain": 7.0}})
+
+    created = unit_summary_model.create_missing()
+
+    assert list(created) == [other]
+    assert unit_summary_model.get_summary(unit)["realized_gain"] == 7.0
+    assert unit_summary_model.create_missing() == {}
+
+def test_get_all_summaries_creates_missing_with_one_aggregation(unit, db, monkeypatch):
+    others = [unit_model.create_unit(f"Other {n}", 500.0) for n in range(3)]
+    db.unit_summaries.delete_many({"unit_id": {"$in": others}})
+    calls = []
+    monkeypatch.setattr(product_model, "aggregate_unit_totals",
+                        lambda unit_ids=None: calls.append(unit_ids) or {})
+
+    summaries = unit_summary_model.get_all_summaries()
+
+    assert calls == [others]
+    assert set(summaries) == {unit, *others}
+    assert summaries[unit]["stock_cost"] == pytest.approx(100.0)
+    assert db.unit_summaries.count_documents({}) == 4
+
+def test_financial_summaries_cover_the_given_units(unit, db, monkeypatch):
+    _aggregated(monkeypatch, {unit: {"realized_gain": 5.0, "stock_cost": 100.0,
+                                     "potential_revenue": 150.0, "volume_used": 1.0}})
+    db.unit_summaries.delete_many({})
+
+    summaries = product_model.calculate_all_financial_summaries([{"unit_id": unit}])
+
+    assert list(summaries) == [unit]
+    assert summaries[unit]["total_realized_gain"] == 5.0
+    assert summaries[unit]["total_potential_gain"] == 55.0